@@ -0,0 +1,98 @@
+# Abstract syntax tree of Instant programs, built by PrattParser or by
+# TreeBuilder (from the ANTLR parse tree). Every node keeps offsets of its
+# first and last character in the source.
+
+from typing import List
+
+
+class Node:
+    __slots__ = ('start', 'stop')
+
+    def __init__(self, start: int, stop: int):
+        self.start = start
+        self.stop = stop
+
+    # The code of the node without whitespace, like getText() of ANTLR
+    # contexts (all whitespace in Instant is skipped).
+    def text(self, source: str) -> str:
+        return ''.join(source[self.start:self.stop + 1].split())
+
+
+class Exp(Node):
+    __slots__ = ()
+
+
+class BinaryExp(Exp):
+    __slots__ = ('op', 'left', 'right')
+
+    def __init__(self, start: int, stop: int, op: str, left: Exp, right: Exp):
+        super().__init__(start, stop)
+        self.op = op
+        self.left = left
+        self.right = right
+
+
+class ExpMulDiv(BinaryExp):
+    __slots__ = ()
+
+
+class ExpSub(BinaryExp):
+    __slots__ = ()
+
+
+class ExpAdd(BinaryExp):
+    __slots__ = ()
+
+
+class ExpLit(Exp):
+    __slots__ = ('value',)
+
+    def __init__(self, start: int, stop: int, value: int):
+        super().__init__(start, stop)
+        self.value = value
+
+
+class ExpVar(Exp):
+    __slots__ = ('name',)
+
+    def __init__(self, start: int, stop: int, name: str):
+        super().__init__(start, stop)
+        self.name = name
+
+
+class ExpParen(Exp):
+    __slots__ = ('exp',)
+
+    def __init__(self, start: int, stop: int, exp: Exp):
+        super().__init__(start, stop)
+        self.exp = exp
+
+
+class Stmt(Node):
+    __slots__ = ()
+
+
+class StmtAss(Stmt):
+    __slots__ = ('name', 'exp')
+
+    def __init__(self, start: int, stop: int, name: str, exp: Exp):
+        super().__init__(start, stop)
+        self.name = name
+        self.exp = exp
+
+
+class StmtExp(Stmt):
+    __slots__ = ('exp',)
+
+    def __init__(self, start: int, stop: int, exp: Exp):
+        super().__init__(start, stop)
+        self.exp = exp
+
+
+class Prog(Node):
+    __slots__ = ('stmts', 'source')
+
+    def __init__(self, start: int, stop: int, stmts: List[Stmt], source: str):
+        super().__init__(start, stop)
+        self.stmts = stmts
+        self.source = source
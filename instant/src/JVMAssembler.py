@@ -0,0 +1,224 @@
+# Assembling of the class file directly from the instructions generated
+# by JVMCompiler, without starting a JVM for Jasmin. The class has
+# the same members as the one built by Jasmin from the .j file: the default
+# constructor and `main` with the given code and limits. The code has
+# no jumps, so it needs no StackMapTable.
+#
+# Only the instructions used by JVMCompiler are supported, in the same
+# syntax as in the .j file.
+
+import struct
+from typing import Dict, List, Tuple
+
+from JVMCompiler import to_int32
+
+CLASS_MAGIC = 0xCAFEBABE
+# Java 5, the last version which doesn't require StackMapTable
+CLASS_VERSION = (0, 49)  # (minor, major)
+
+ACC_PUBLIC = 0x0001
+ACC_STATIC = 0x0008
+ACC_SUPER = 0x0020
+
+CONSTANT_UTF8 = 1
+CONSTANT_INTEGER = 3
+CONSTANT_CLASS = 7
+CONSTANT_FIELDREF = 9
+CONSTANT_METHODREF = 10
+CONSTANT_NAME_AND_TYPE = 12
+
+OBJECT_CLASS = 'java/lang/Object'
+
+# instructions without arguments
+SIMPLE_OPCODES = {
+    'iconst_m1': 0x02,
+    'iconst_0': 0x03,
+    'iconst_1': 0x04,
+    'iconst_2': 0x05,
+    'iconst_3': 0x06,
+    'iconst_4': 0x07,
+    'iconst_5': 0x08,
+    'iload_0': 0x1a,
+    'iload_1': 0x1b,
+    'iload_2': 0x1c,
+    'iload_3': 0x1d,
+    'aload_0': 0x2a,
+    'istore_0': 0x3b,
+    'istore_1': 0x3c,
+    'istore_2': 0x3d,
+    'istore_3': 0x3e,
+    'pop': 0x57,
+    'dup': 0x59,
+    'swap': 0x5f,
+    'iadd': 0x60,
+    'isub': 0x64,
+    'imul': 0x68,
+    'idiv': 0x6c,
+    'return': 0xb1,
+}
+
+BIPUSH = 0x10
+SIPUSH = 0x11
+LDC = 0x12
+LDC_W = 0x13
+ILOAD = 0x15
+ISTORE = 0x36
+IINC = 0x84
+GETSTATIC = 0xb2
+INVOKEVIRTUAL = 0xb6
+INVOKESPECIAL = 0xb7
+WIDE = 0xc4
+
+
+class ConstantPool:
+
+    def __init__(self):
+        self.entries: List[bytes] = []
+        self.indices: Dict[Tuple, int] = {}
+
+    # Returns the index of the constant, adding it if it's new.
+    def add(self, key: Tuple, entry: bytes) -> int:
+        index = self.indices.get(key)
+        if index is None:
+            self.entries.append(entry)
+            index = len(self.entries)  # indices start from 1
+            self.indices[key] = index
+        return index
+
+    def utf8(self, value: str) -> int:
+        data = value.encode('utf-8')
+        return self.add(
+            ('utf8', value),
+            struct.pack('>BH', CONSTANT_UTF8, len(data)) + data)
+
+    def integer(self, value: int) -> int:
+        value = to_int32(value)
+        return self.add(
+            ('integer', value), struct.pack('>Bi', CONSTANT_INTEGER, value))
+
+    def class_ref(self, name: str) -> int:
+        return self.add(
+            ('class', name),
+            struct.pack('>BH', CONSTANT_CLASS, self.utf8(name)))
+
+    def name_and_type(self, name: str, descriptor: str) -> int:
+        return self.add(
+            ('name_and_type', name, descriptor),
+            struct.pack('>BHH', CONSTANT_NAME_AND_TYPE, self.utf8(name),
+                        self.utf8(descriptor)))
+
+    def member_ref(
+            self, tag: int, class_name: str, name: str,
+            descriptor: str) -> int:
+        return self.add(
+            (tag, class_name, name, descriptor),
+            struct.pack('>BHH', tag, self.class_ref(class_name),
+                        self.name_and_type(name, descriptor)))
+
+    def to_bytes(self) -> bytes:
+        return struct.pack('>H', len(self.entries) + 1) \
+            + b''.join(self.entries)
+
+
+# `java/lang/System/out Ljava/io/PrintStream;` or
+# `java/io/PrintStream/println(I)V` -> (class, name, descriptor)
+def split_member(member: str) -> Tuple[str, str, str]:
+    if '(' in member:
+        path, paren, descriptor = member.partition('(')
+        descriptor = paren + descriptor
+    else:
+        path, descriptor = member.split(' ')
+    class_name, _, name = path.rpartition('/')
+    return class_name, name, descriptor
+
+
+def assemble_code(code: List[str], pool: ConstantPool) -> bytes:
+    out = bytearray()
+    for line in code:
+        if line.startswith(';'):
+            continue
+        instr, _, arg = line.partition(' ')
+        opcode = SIMPLE_OPCODES.get(instr)
+        if opcode is not None:
+            out.append(opcode)
+        elif instr == 'bipush':
+            out += struct.pack('>Bb', BIPUSH, int(arg))
+        elif instr == 'sipush':
+            out += struct.pack('>Bh', SIPUSH, int(arg))
+        elif instr == 'ldc':
+            index = pool.integer(int(arg))
+            if index <= 0xff:
+                out += struct.pack('>BB', LDC, index)
+            else:
+                out += struct.pack('>BH', LDC_W, index)
+        elif instr in ('iload', 'istore'):
+            opcode = ILOAD if instr == 'iload' else ISTORE
+            local = int(arg)
+            if local <= 0xff:
+                out += struct.pack('>BB', opcode, local)
+            else:
+                out += struct.pack('>BBH', WIDE, opcode, local)
+        elif instr == 'iinc':
+            local, increment = map(int, arg.split())
+            if local <= 0xff and -128 <= increment <= 127:
+                out += struct.pack('>BBb', IINC, local, increment)
+            else:
+                out += struct.pack('>BBHh', WIDE, IINC, local, increment)
+        elif instr == 'getstatic':
+            out += struct.pack(
+                '>BH', GETSTATIC,
+                pool.member_ref(CONSTANT_FIELDREF, *split_member(arg)))
+        elif instr in ('invokevirtual', 'invokespecial'):
+            opcode = INVOKEVIRTUAL if instr == 'invokevirtual' \
+                else INVOKESPECIAL
+            out += struct.pack(
+                '>BH', opcode,
+                pool.member_ref(CONSTANT_METHODREF, *split_member(arg)))
+        else:
+            raise ValueError(f'unsupported JVM instruction: `{line}`')
+    return bytes(out)
+
+
+def method_info(
+        pool: ConstantPool, access_flags: int, name: str, descriptor: str,
+        code: List[str], locals_limit: int, stack_limit: int) -> bytes:
+    bytecode = assemble_code(code, pool)
+    # max_stack, max_locals, code, no exception table and attributes
+    code_attribute = struct.pack(
+        '>HHI', stack_limit, locals_limit, len(bytecode)) \
+        + bytecode + struct.pack('>HH', 0, 0)
+    return struct.pack(
+        '>HHHHHI', access_flags, pool.utf8(name), pool.utf8(descriptor),
+        1, pool.utf8('Code'), len(code_attribute)) + code_attribute
+
+
+# Returns the class file of the class `class_name` with `main` running
+# `code` (ending with `return`).
+def assemble(
+        class_name: str, code: List[str], locals_limit: int,
+        stack_limit: int) -> bytes:
+    pool = ConstantPool()
+    this_class = pool.class_ref(class_name)
+    super_class = pool.class_ref(OBJECT_CLASS)
+    init = method_info(
+        pool, ACC_PUBLIC, '<init>', '()V',
+        ['aload_0', f'invokespecial {OBJECT_CLASS}/<init>()V', 'return'],
+        1, 1)
+    main = method_info(
+        pool, ACC_PUBLIC | ACC_STATIC, 'main', '([Ljava/lang/String;)V',
+        code, locals_limit, stack_limit)
+    source_file = struct.pack(
+        '>HIH', pool.utf8('SourceFile'), 2, pool.utf8(f'{class_name}.j'))
+
+    minor, major = CLASS_VERSION
+    return b''.join([
+        struct.pack('>IHH', CLASS_MAGIC, minor, major),
+        pool.to_bytes(),
+        # no interfaces and fields, 2 methods
+        struct.pack('>HHHHHH', ACC_PUBLIC | ACC_SUPER, this_class,
+                    super_class, 0, 0, 2),
+        init,
+        main,
+        struct.pack('>H', 1),  # attributes
+        source_file,
+    ])
@@ -1,4 +1,8 @@
-from antlr_generated.InstantParser import InstantParser
+import operator
+import re
+from typing import Iterator, List, Optional, Set, TextIO, Tuple, Union
+
+import InstantAST as ast
 
 
 JVM_TEMPLATE = '''.source {class_name}.j
@@ -12,10 +16,13 @@ JVM_TEMPLATE = '''.source {class_name}.j
 .end method
 
 .method public static main([Ljava/lang/String;)V
+'''
+
+# The limits are known only after the whole method is compiled,
+# Jasmin accepts them at the end of the method.
+JVM_MAIN_END = '''    return
 .limit locals {locals_limit}
 .limit stack {stack_limit}
-{main_code}
-    return
 .end method
 '''
 
@@ -26,6 +33,53 @@ JVM_PRINT_INT = [
 ]
 
 
+INT_MIN = -2**31
+INT_MAX = 2**31 - 1
+
+# `iload 5`, `istore_2` etc.
+LOCAL_INSTR_RE = re.compile(r'(iload|istore)[ _](\d+)$')
+
+
+# Wraps the result of an operation to 32 bits, like JVM arithmetic does.
+def to_int32(value: int) -> int:
+    return (value - INT_MIN) % 2**32 + INT_MIN
+
+
+# Rounds towards zero, like idiv (// in Python rounds down).
+def jvm_idiv(left: int, right: int) -> int:
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+
+# operator: (instruction, commutative, value for constant arguments)
+BINARY_OPS = {
+    '*': ('imul', True, operator.mul),
+    '/': ('idiv', False, jvm_idiv),
+    '-': ('isub', False, operator.sub),
+    '+': ('iadd', True, operator.add),
+}
+
+
+# Code of an expression is built as a tree of instructions, with the
+# instructions of each node in reverse order, so that combining the code of
+# subexpressions takes constant time, rather than copying their lists.
+# The instructions are appended to the code of the statement at the end,
+# in linear time.
+Code = Union[str, tuple]
+# (code, stack limit, value if constant), see JVMCompiler.visit_exp
+ExpResult = Tuple[Code, int, Optional[int]]
+
+
+def append_code(exp_code: Code, code: List[str]) -> None:
+    stack = [exp_code]
+    while stack:
+        piece = stack.pop()
+        if type(piece) is str:
+            code.append(piece)
+        else:
+            stack += piece
+
+
 def get_jvm_instr(instr: str, arg: int) -> str:
     if instr in ['iload', 'istore'] and 0 <= arg <= 3:
         return f'{instr}_{arg}'
@@ -41,137 +95,318 @@ def get_jvm_instr(instr: str, arg: int) -> str:
     return f'{instr} {arg}'
 
 
+def iter_subexps(node: ast.Exp) -> Iterator[ast.Exp]:
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        if type(node) is ast.ExpParen:
+            stack.append(node.exp)
+        elif isinstance(node, ast.BinaryExp):
+            stack.append(node.right)
+            stack.append(node.left)
+
+
+def unparen(node: ast.Exp) -> ast.Exp:
+    while type(node) is ast.ExpParen:
+        node = node.exp
+    return node
+
+
+def get_read_vars(node: ast.Exp) -> Set[str]:
+    return {exp.name for exp in iter_subexps(node) if type(exp) is ast.ExpVar}
+
+
+# Only idiv can throw an exception (division by zero).
+def may_throw(node: ast.Exp) -> bool:
+    return any(
+        type(exp) is ast.ExpMulDiv and exp.op == '/'
+        for exp in iter_subexps(node))
+
+
+# Returns the assignments whose values are never read, since the variable
+# is assigned again or not read at all after them. Instant programs have
+# no jumps, so it's a single backward pass over the statements.
+# Assignments which may throw an exception are kept (the value is popped)
+# and the variables they read stay live.
+def find_dead_stores(stmts: List[ast.Stmt]) -> Set[ast.StmtAss]:
+    dead_stores = set()
+    live_vars = set()
+    for stmt in reversed(stmts):
+        if isinstance(stmt, ast.StmtAss):
+            if stmt.name not in live_vars:
+                dead_stores.add(stmt)
+                if not may_throw(stmt.exp):
+                    continue
+            live_vars.discard(stmt.name)
+        live_vars |= get_read_vars(stmt.exp)
+    return dead_stores
+
+
+# Peephole optimization of the code of a method (lines starting with ';'
+# are comments):
+# * a load of the local whose value is already on top of the stack
+#   is replaced with dup,
+# * a store followed by a load of the same local is replaced with dup
+#   and the store, the value stays on stack for the next statement.
+# Returns the optimized code and the stack limit needed by the dups added
+# before stores (0 if there are none), the other dups don't change it.
+def peephole(code: List[str]) -> Tuple[List[str], int]:
+    optimized = []
+    stack_limit = 0
+    top_local = None  # local whose value is on top of the stack
+    skipped_load = None  # index of the load replaced by a dup before store
+    for i, line in enumerate(code):
+        if line.startswith(';'):
+            optimized.append(line)
+            continue
+        if i == skipped_load:
+            continue
+        match = LOCAL_INSTR_RE.match(line)
+        if match is None:
+            optimized.append(line)
+            top_local = None
+            continue
+        instr, local = match.group(1), int(match.group(2))
+        if instr == 'iload':
+            optimized.append('dup' if local == top_local else line)
+            top_local = local
+            continue
+        top_local = None
+        next_i = i + 1
+        while next_i < len(code) and code[next_i].startswith(';'):
+            next_i += 1
+        if next_i < len(code):
+            next_match = LOCAL_INSTR_RE.match(code[next_i])
+            if (next_match is not None and next_match.group(1) == 'iload'
+                    and int(next_match.group(2)) == local):
+                optimized.append('dup')
+                skipped_load = next_i
+                top_local = local
+                stack_limit = 2
+        optimized.append(line)
+    return optimized, stack_limit
+
+
 class JVMCompiler:
 
-    def __init__(self, class_name: str):
+    # With `optimize`, constant subexpressions are folded, assignments whose
+    # values are never read are removed, `x = x + c` uses iinc and the code
+    # goes through the peephole optimization. With `keep_code`, the code
+    # of main is also kept in main_code for JVMAssembler.
+    def __init__(self, class_name: str, optimize: bool = False,
+                 keep_code: bool = False):
         self.var_env = {}  # ident: jvm_var_index
         self.locals = 1  # first local is reserved by JVM
         self.class_name = class_name
+        self.optimize = optimize
+        self.keep_code = keep_code
+        # variables read anywhere in the program, others get no locals
+        self.read_vars = set()
+        self.dead_stores = set()
+        # code of main (without the final return) and its stack limit
+        self.main_code = []
+        self.stack_limit = 0
 
     def get_new_local(self) -> int:
         local_index = self.locals
         self.locals += 1
         return local_index
 
-    def visit_prog(self, ctx: InstantParser.ProgContext):
-        main_code = []
-        stack_limit = 0
+    # Without optimizations the code of each statement is written as soon
+    # as it's compiled. With them, all statements are visited before
+    # the code is written, since the peephole optimization works on the
+    # whole method and the stack limit of the method decides the order of
+    # instructions printing a value (see stmt_instrs).
+    def visit_prog(self, node: ast.Prog, out: TextIO) -> None:
+        out.write(JVM_TEMPLATE.format(class_name=self.class_name))
+        if self.optimize:
+            self.write_code(self.visit_stmts_optimized(node), out)
+        else:
+            for stmt in node.stmts:
+                stmt_code, stmt_stack_limit = self.visit_stmt(stmt)
+                self.write_code(self.stmt_instrs(
+                    stmt, node.source, stmt_code, stmt_stack_limit, 2), out)
+        out.write(JVM_MAIN_END.format(
+            locals_limit=self.locals,
+            stack_limit=self.stack_limit))
 
-        for child in ctx.children:
-            if isinstance(child, InstantParser.StmtContext):
-                main_code.append(f'; {child.getText()}')
+    def write_code(self, code: List[str], out: TextIO) -> None:
+        if self.keep_code:
+            self.main_code += code
+        for line in code:
+            out.write(f'    {line}\n')
 
-            if isinstance(child, InstantParser.StmtAssContext):
-                visit_result = self.visit_stmt_ass(child)
-            elif isinstance(child, InstantParser.StmtExpContext):
-                visit_result = self.visit_stmt_exp(child)
-            else:
-                continue
+    # Returns the optimized code of all statements.
+    def visit_stmts_optimized(self, node: ast.Prog) -> List[str]:
+        for stmt in node.stmts:
+            self.read_vars |= get_read_vars(stmt.exp)
+        self.dead_stores = find_dead_stores(node.stmts)
+        stmts_code = []
+        for stmt in node.stmts:
+            stmt_code, stmt_stack_limit = self.visit_stmt(stmt)
+            stmts_code.append((stmt, stmt_code, stmt_stack_limit))
+        code = []
+        for stmt, stmt_code, stmt_stack_limit in stmts_code:
+            code += self.stmt_instrs(
+                stmt, node.source, stmt_code, stmt_stack_limit,
+                self.stack_limit)
+        code, peephole_stack_limit = peephole(code)
+        self.stack_limit = max(self.stack_limit, peephole_stack_limit)
+        return code
 
-            stack_limit = max(stack_limit, visit_result['stack_limit'])
-            main_code += visit_result['code']
+    # Visits the statement and updates the stack limit of the method.
+    def visit_stmt(self, node: ast.Stmt) -> Tuple[Code, int]:
+        if isinstance(node, ast.StmtAss):
+            stmt_code, stack_limit = self.visit_stmt_ass(node)
+        else:
+            stmt_code, stack_limit = self.visit_stmt_exp(node)
+            # PrintStream and the value at least
+            self.stack_limit = max(self.stack_limit, 2)
+        self.stack_limit = max(self.stack_limit, stack_limit)
+        return stmt_code, stack_limit
 
-        return JVM_TEMPLATE.format(
-            class_name=self.class_name,
-            locals_limit=self.locals,
-            stack_limit=stack_limit,
-            main_code='\n'.join(('    ' + line for line in main_code)))
+    # Returns the instructions of the statement, after a comment with its
+    # source. PrintStream is loaded before the printed value if there is
+    # space on stack for it (the stack limit of the value is below
+    # print_stack_limit), otherwise after the value and swapped with it.
+    # Without optimizations print_stack_limit is 2, so that the code of
+    # a statement doesn't depend on the following ones.
+    def stmt_instrs(
+            self, node: ast.Stmt, source: str, stmt_code: Code,
+            stmt_stack_limit: int, print_stack_limit: int) -> List[str]:
+        code = [f'; {node.text(source)}']
+        if isinstance(node, ast.StmtAss):
+            append_code(stmt_code, code)
+        elif stmt_stack_limit < print_stack_limit:
+            code.append(JVM_PRINT_INT[0])
+            append_code(stmt_code, code)
+            code.append(JVM_PRINT_INT[2])
+        else:
+            append_code(stmt_code, code)
+            code += JVM_PRINT_INT
+        return code
 
-    def visit_stmt_ass(self, ctx: InstantParser.StmtAssContext):
-        ident = ctx.IDENT().getText()
+    # Visiting each statement returns a pair: its code (a Code tree)
+    # and the maximum number of values on stack during its execution.
+    def visit_stmt_ass(self, node: ast.StmtAss) -> Tuple[Code, int]:
+        ident = node.name
         var_local = self.var_env.get(ident)
-        if var_local is None:
+        if var_local is None and (
+                not self.optimize or ident in self.read_vars):
             var_local = self.get_new_local()
             self.var_env[ident] = var_local
-        visit_result = self.visit_exp(ctx.exp())
-        return {
-            'code': visit_result['code'] + [get_jvm_instr('istore', var_local)],
-            'stack_limit': visit_result['stack_limit']
-        }
-
-    def visit_stmt_exp(self, ctx: InstantParser.StmtExpContext):
-        visit_result = self.visit_exp(ctx.exp())
-        if visit_result['stack_limit'] <= 1:
-            code = [JVM_PRINT_INT[0]] + visit_result['code'] + [JVM_PRINT_INT[2]]
+        if node in self.dead_stores:
+            exp_code, stack_limit, value = self.visit_exp(node.exp)
+            if value is None and may_throw(node.exp):
+                return ('pop', exp_code), stack_limit
+            return (), 0
+        if self.optimize:
+            increment = self.get_increment(node)
+            if increment is not None:
+                return f'iinc {var_local} {increment}', 0
+        exp_code, stack_limit, _ = self.visit_exp(node.exp)
+        return (get_jvm_instr('istore', var_local), exp_code), stack_limit
+
+    # Returns c for `x = x + c`, `x = c + x` and -c for `x = x - c`, where
+    # c is constant and fits in iinc, None for other assignments.
+    def get_increment(self, node: ast.StmtAss) -> Optional[int]:
+        exp = unparen(node.exp)
+        if type(exp) not in (ast.ExpAdd, ast.ExpSub):
+            return None
+        left, right = unparen(exp.left), unparen(exp.right)
+        if type(left) is ast.ExpVar and left.name == node.name:
+            increment_exp = right
+        elif (exp.op == '+' and type(right) is ast.ExpVar
+                and right.name == node.name):
+            increment_exp = left
         else:
-            code = visit_result['code'] + JVM_PRINT_INT
-        return {
-            'code': code,
-            'stack_limit': max(2, visit_result['stack_limit'])
-        }
-
-    # Visiting each expression returns a dict with two key-value pairs:
-    # 'code', a list of JVM instructions,
-    # and 'stack_limit', which is the maximum number of values on stack
-    # during the execution of that expression.
+            return None
+        _, _, increment = self.visit_exp(increment_exp)
+        if increment is None:
+            return None
+        if exp.op == '-':
+            increment = -increment
+        if -128 <= increment <= 127 and self.var_env[node.name] <= 255:
+            return increment
+        return None
+
+    # The code and the stack limit are of the printed expression only,
+    # instructions printing it are added in visit_prog.
+    def visit_stmt_exp(self, node: ast.StmtExp) -> Tuple[Code, int]:
+        exp_code, stack_limit, _ = self.visit_exp(node.exp)
+        return exp_code, stack_limit
+
+    # Visiting each expression returns a triple:
+    # the code, a Code tree of JVM instructions,
+    # the stack limit, which is the maximum number of values on stack
+    # during the execution of that expression,
+    # and its value if it's constant (only with `optimize`), None otherwise.
     # The JVM code should always leave one value on stack,
     # the result of the expression.
-    def visit_exp(self, ctx: InstantParser.ExpContext):
-        if isinstance(ctx, (InstantParser.ExpMulDivContext,
-                            InstantParser.ExpSubContext,
-                            InstantParser.ExpAddContext)):
-            return self.visit_binary_op_exp(ctx)
-        if isinstance(ctx, InstantParser.ExpLitContext):
-            return self.visit_exp_lit(ctx)
-        if isinstance(ctx, InstantParser.ExpVarContext):
-            return self.visit_exp_var(ctx)
-        if isinstance(ctx, InstantParser.ExpParenContext):
-            return self.visit_exp_paren(ctx)
-        raise TypeError(f'unknown expression context type')
-
-    def visit_binary_op_exp(self, ctx: InstantParser.ExpContext):
-        if isinstance(ctx, InstantParser.ExpMulDivContext) and ctx.MULDIVOP().getText() == '*':
-            instr = 'imul'
-            commutative = True
-        elif isinstance(ctx, InstantParser.ExpMulDivContext) and ctx.MULDIVOP().getText() == '/':
-            instr = 'idiv'
-            commutative = False
-        elif isinstance(ctx, InstantParser.ExpSubContext):
-            instr = 'isub'
-            commutative = False
-        elif isinstance(ctx, InstantParser.ExpAddContext):
-            instr = 'iadd'
-            commutative = True
-        else:
-            raise TypeError('unsupported context type')
-
-        left_visit_res = self.visit_exp(ctx.exp(0))
-        right_visit_res = self.visit_exp(ctx.exp(1))
-        if left_visit_res['stack_limit'] >= right_visit_res['stack_limit']:
-            code = left_visit_res['code'] + right_visit_res['code']
-            stack_limit = left_visit_res['stack_limit']
-            swapped = False
-            if left_visit_res['stack_limit'] == right_visit_res['stack_limit']:
-                stack_limit += 1
-        else:
-            code = right_visit_res['code'] + left_visit_res['code']
-            stack_limit = right_visit_res['stack_limit']
-            swapped = True
-
-        if swapped and not commutative:
-            code.append('swap')
-        code.append(instr)
-
-        return {
-            'code': code,
-            'stack_limit': stack_limit
-        }
-
-    def visit_exp_lit(self, ctx: InstantParser.ExpLitContext):
-        return {
-            'code': [get_jvm_instr('ldc', int(ctx.getText()))],
-            'stack_limit': 1
-        }
-
-    def visit_exp_var(self, ctx: InstantParser.ExpVarContext):
-        ident = ctx.IDENT().getText()
+    # Expressions are visited in post-order with an explicit stack rather
+    # than by recursion, so that their depth isn't bounded by the recursion
+    # limit of Python. The stack holds pairs (node, whether the results of
+    # its operands are already on the `results` stack).
+    def visit_exp(self, node: ast.Exp) -> ExpResult:
+        results = []
+        stack = [(node, False)]
+        while stack:
+            node, operands_visited = stack.pop()
+            if operands_visited:
+                right_visit_res = results.pop()
+                results.append(self.visit_binary_op_exp(
+                    node, results.pop(), right_visit_res))
+                continue
+            leaf_visitor = self.LEAF_VISITORS.get(type(node))
+            if leaf_visitor is not None:
+                results.append(leaf_visitor(self, node))
+            elif type(node) is ast.ExpParen:
+                stack.append((node.exp, False))
+            else:
+                stack.append((node, True))
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+        return results.pop()
+
+    # The argument needing the larger stack is computed first, so that
+    # the value of the other one doesn't occupy the stack meanwhile.
+    # Division by a constant 0 isn't folded, it throws at runtime.
+    def visit_binary_op_exp(
+            self, node: ast.BinaryExp, left_visit_res: ExpResult,
+            right_visit_res: ExpResult) -> ExpResult:
+        instr, commutative, fold = BINARY_OPS[node.op]
+        left_code, left_stack_limit, left_value = left_visit_res
+        right_code, right_stack_limit, right_value = right_visit_res
+        if (left_value is not None and right_value is not None
+                and not (instr == 'idiv' and right_value == 0)):
+            value = to_int32(fold(left_value, right_value))
+            return get_jvm_instr('ldc', value), 1, value
+        if left_stack_limit > right_stack_limit:
+            return (instr, right_code, left_code), left_stack_limit, None
+        if left_stack_limit == right_stack_limit:
+            return (instr, right_code, left_code), left_stack_limit + 1, None
+        if commutative:
+            return (instr, left_code, right_code), right_stack_limit, None
+        return (instr, 'swap', left_code, right_code), right_stack_limit, None
+
+    # Literals out of the range of int aren't folded, like without
+    # optimizations they are passed to Jasmin as they are.
+    def visit_exp_lit(self, node: ast.ExpLit) -> ExpResult:
+        value = node.value
+        if not self.optimize or not INT_MIN <= value <= INT_MAX:
+            value = None
+        return get_jvm_instr('ldc', node.value), 1, value
+
+    def visit_exp_var(self, node: ast.ExpVar) -> ExpResult:
+        ident = node.name
         var_local = self.var_env.get(ident)
         if var_local is None:
             raise RuntimeError(f'undefined variable `{ident}`')
-        return {
-            'code': [get_jvm_instr('iload', var_local)],
-            'stack_limit': 1
-        }
+        return get_jvm_instr('iload', var_local), 1, None
 
-    def visit_exp_paren(self, ctx: InstantParser.ExpParenContext):
-        return self.visit_exp(ctx.exp())
+    # visitors of expressions without subexpressions, built once
+    LEAF_VISITORS = {
+        ast.ExpLit: visit_exp_lit,
+        ast.ExpVar: visit_exp_var,
+    }
@@ -0,0 +1,41 @@
+# Assembling of the generated .ll file to bitcode. When llvmlite
+# is installed, it's done in-process, otherwise llvm-as is used.
+
+import subprocess
+import sys
+
+try:
+    import llvmlite.binding as llvm
+except ImportError:
+    llvm = None
+
+
+# exit code of the compiler
+ASSEMBLY_FAILED = 3
+
+
+# Returns 0 on success or ASSEMBLY_FAILED. Output of llvm-as is printed
+# like the output of the compiler, so that in batch mode it's captured
+# with the output of the file.
+def assemble(ll_path: str, bc_path: str) -> int:
+    if llvm is None:
+        ps = subprocess.run(
+            ['llvm-as', ll_path, '-o', bc_path], stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, universal_newlines=True)
+        sys.stdout.write(ps.stdout)
+        sys.stderr.write(ps.stderr)
+        if ps.returncode != 0:
+            print(f'llvm-as exited with code {ps.returncode}',
+                  file=sys.stderr)
+            return ASSEMBLY_FAILED
+        return 0
+    with open(ll_path) as f:
+        ir = f.read()
+    try:
+        module = llvm.parse_assembly(ir)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return ASSEMBLY_FAILED
+    with open(bc_path, 'wb') as f:
+        f.write(module.as_bitcode())
+    return 0
@@ -1,6 +1,6 @@
-import antlr4
+from typing import TextIO
 
-from antlr_generated.InstantParser import InstantParser
+import InstantAST as ast
 
 
 PRINT_TREE = False
@@ -17,16 +17,26 @@ define void @printInt(i32 %x) {
 }'''
 
 
+BINARY_OPS = {
+    '*': 'mul',
+    '/': 'sdiv',
+    '-': 'sub',
+    '+': 'add',
+}
+
+
 def tree_printer(fun):
-    def fun_wrapper(self, ctx: antlr4.ParserRuleContext) -> str:
+    def fun_wrapper(self, node: ast.Node, *args) -> str:
         if PRINT_TREE:
+            if isinstance(node, ast.Prog):
+                self.source = node.source
             self.tree_depth += 1
-            print(' ' * self.tree_depth + ctx.getText().replace('\n', '; '))
-            ret_val = fun(self, ctx)
+            print(' ' * self.tree_depth + node.text(self.source))
+            ret_val = fun(self, node, *args)
             self.tree_depth -= 1
             return ret_val
         else:
-            return fun(self, ctx)
+            return fun(self, node, *args)
 
     return fun_wrapper
 
@@ -35,9 +45,10 @@ class LLVMCompiler:
 
     def __init__(self):
         self.next_reg_index = 1
-        self.main_code = []
+        self.out = None
         self.print_used = False
         self.var_env = {}
+        self.source = ''
         self.tree_depth = -1
 
     def get_new_register(self) -> int:
@@ -45,87 +56,99 @@ class LLVMCompiler:
         self.next_reg_index += 1
         return reg
 
+    def emit(self, line: str) -> None:
+        self.out.write(f'    {line}\n')
+
+    # The code is written to `out` as soon as each statement is compiled.
+    # printInt is defined after main, since it is known whether it is needed
+    # only at the end.
     @tree_printer
-    def visit_prog(self, ctx: InstantParser.ProgContext) -> str:
-        for child in ctx.children:
-            if isinstance(child, InstantParser.StmtContext):
-                self.main_code.append(f'; {child.getText()}')
-
-            if isinstance(child, InstantParser.StmtAssContext):
-                self.visit_stmt_ass(child)
-            elif isinstance(child, InstantParser.StmtExpContext):
-                self.visit_stmt_exp(child)
-
-        self.main_code.append('ret i32 0')
-        code = '{print_int}define i32 @main() {{\n{main_code}\n}}\n'.format(
-            print_int=LLVM_PRINT_INT + '\n\n' if self.print_used else '',
-            main_code='\n'.join(('    ' + line for line in self.main_code)))
-        return code
+    def visit_prog(self, node: ast.Prog, out: TextIO) -> None:
+        self.out = out
+        self.source = node.source
+        out.write('define i32 @main() {\n')
+        for stmt in node.stmts:
+            self.emit(f'; {stmt.text(self.source)}')
+
+            if isinstance(stmt, ast.StmtAss):
+                self.visit_stmt_ass(stmt)
+            else:
+                self.visit_stmt_exp(stmt)
+
+        self.emit('ret i32 0')
+        out.write('}\n')
+        if self.print_used:
+            out.write('\n' + LLVM_PRINT_INT + '\n')
 
     @tree_printer
-    def visit_stmt_ass(self, ctx: InstantParser.StmtAssContext) -> None:
-        ident = ctx.IDENT().getText()
+    def visit_stmt_ass(self, node: ast.StmtAss) -> None:
+        ident = node.name
         if PRINT_TREE:
             print(' ' * (self.tree_depth + 1) + ident)
         reg = self.var_env.get(ident)
         if reg is None:
             reg = self.get_new_register()
-            self.main_code.append(f'%{reg} = alloca i32')
+            self.emit(f'%{reg} = alloca i32')
             self.var_env[ident] = reg
-        value = self.visit_exp(ctx.exp())
-        self.main_code.append(f'store i32 {value}, i32* %{reg}')
+        value = self.visit_exp(node.exp)
+        self.emit(f'store i32 {value}, i32* %{reg}')
 
     @tree_printer
-    def visit_stmt_exp(self, ctx: InstantParser.StmtExpContext) -> None:
-        value = self.visit_exp(ctx.exp())
-        self.main_code.append(f'call void @printInt(i32 {value})')
+    def visit_stmt_exp(self, node: ast.StmtExp) -> None:
+        value = self.visit_exp(node.exp)
+        self.emit(f'call void @printInt(i32 {value})')
         self.print_used = True
 
-    # Each function that visits an expression returns
-    # either '%reg' when its result is stored in a register,
-    # or a number if it's a constant (only for ExpLit).
-    @tree_printer
-    def visit_exp(self, ctx: InstantParser.ExpContext) -> str:
-        if isinstance(ctx, (InstantParser.ExpMulDivContext,
-                            InstantParser.ExpSubContext,
-                            InstantParser.ExpAddContext)):
-            return self.visit_binary_op_exp(ctx)
-        if isinstance(ctx, InstantParser.ExpLitContext):
-            return self.visit_exp_lit(ctx)
-        if isinstance(ctx, InstantParser.ExpVarContext):
-            return self.visit_exp_var(ctx)
-        if isinstance(ctx, InstantParser.ExpParenContext):
-            return self.visit_exp_paren(ctx)
-        raise TypeError('unknown expression context type')
-
-    def visit_binary_op_exp(self, ctx: InstantParser.ExpContext) -> str:
-        if isinstance(ctx, InstantParser.ExpMulDivContext) and ctx.MULDIVOP().getText() == '*':
-            instr = 'mul'
-        elif isinstance(ctx, InstantParser.ExpMulDivContext) and ctx.MULDIVOP().getText() == '/':
-            instr = 'sdiv'
-        elif isinstance(ctx, InstantParser.ExpSubContext):
-            instr = 'sub'
-        elif isinstance(ctx, InstantParser.ExpAddContext):
-            instr = 'add'
-        else:
-            raise TypeError('unsupported context type')
-        left = self.visit_exp(ctx.exp(0))
-        right = self.visit_exp(ctx.exp(1))
+    # Expressions are visited in post-order with an explicit stack rather
+    # than by recursion, so that their depth isn't bounded by the recursion
+    # limit of Python. The value of each expression is either '%reg' when
+    # its result is stored in a register, or a number if it's a constant
+    # (only for ExpLit). The stack holds pairs (node, depth in the printed
+    # tree), with the depth None when the operands of a binary operation
+    # are already on the `values` stack.
+    def visit_exp(self, node: ast.Exp) -> str:
+        values = []
+        stack = [(node, self.tree_depth + 1)]
+        while stack:
+            node, depth = stack.pop()
+            if depth is None:
+                right = values.pop()
+                values.append(self.visit_binary_op_exp(
+                    node, values.pop(), right))
+                continue
+            if PRINT_TREE:
+                print(' ' * depth + node.text(self.source))
+            leaf_visitor = self.LEAF_VISITORS.get(type(node))
+            if leaf_visitor is not None:
+                values.append(leaf_visitor(self, node))
+            elif type(node) is ast.ExpParen:
+                stack.append((node.exp, depth + 1))
+            else:
+                stack.append((node, None))
+                stack.append((node.right, depth + 1))
+                stack.append((node.left, depth + 1))
+        return values.pop()
+
+    def visit_binary_op_exp(
+            self, node: ast.BinaryExp, left: str, right: str) -> str:
         reg = self.get_new_register()
-        self.main_code.append(f'%{reg} = {instr} i32 {left}, {right}')
+        self.emit(f'%{reg} = {BINARY_OPS[node.op]} i32 {left}, {right}')
         return f'%{reg}'
 
-    def visit_exp_lit(self, ctx: InstantParser.ExpLitContext) -> str:
-        return ctx.getText()
+    def visit_exp_lit(self, node: ast.ExpLit) -> str:
+        return str(node.value)
 
-    def visit_exp_var(self, ctx: InstantParser.ExpVarContext) -> str:
-        ident = ctx.IDENT().getText()
+    def visit_exp_var(self, node: ast.ExpVar) -> str:
+        ident = node.name
         var_reg = self.var_env.get(ident)
         if var_reg is None:
             raise RuntimeError(f'undefined variable `{ident}`')
         reg = self.get_new_register()
-        self.main_code.append(f'%{reg} = load i32, i32* %{var_reg}')
+        self.emit(f'%{reg} = load i32, i32* %{var_reg}')
         return f'%{reg}'
 
-    def visit_exp_paren(self, ctx: InstantParser.ExpParenContext) -> str:
-        return self.visit_exp(ctx.exp())
+    # visitors of expressions without subexpressions, built once
+    LEAF_VISITORS = {
+        ast.ExpLit: visit_exp_lit,
+        ast.ExpVar: visit_exp_var,
+    }
@@ -0,0 +1,302 @@
+# Hand-written front end for Instant, producing the same InstantAST trees
+# as ANTLR with TreeBuilder, without the ANTLR runtime. The lexer is
+# a single regular expression built from TOKEN_TYPES, expressions are
+# parsed by a Pratt parser with an explicit stack, using BINARY_OPS, with
+# the same precedence and associativity as the `exp` rule in Instant.g4.
+#
+# Syntax errors are raised as ParseError with the line and column (counted
+# from 0) of the offending token, like ANTLR reports them.
+
+import re
+from typing import Callable, List, Tuple
+
+import InstantAST as ast
+
+TOKEN_TYPES = [
+    ('WS', r'[ \t\r\n]+'),
+    ('IDENT', r"[a-zA-Z][a-zA-Z0-9_']*"),
+    ('INTEGER', r'[0-9]+'),
+    ('OP', r'[-+*/=;()]'),
+]
+TOKEN_RE = re.compile(
+    '|'.join(f'(?P<{name}>{regex})' for name, regex in TOKEN_TYPES))
+
+EOF = '<EOF>'
+# the last token when the rest of the source can't be tokenized
+INVALID = '<invalid>'
+
+# operator: (precedence, right associative, node class)
+BINARY_OPS = {
+    '+': (1, True, ast.ExpAdd),
+    '-': (2, False, ast.ExpSub),
+    '*': (3, False, ast.ExpMulDiv),
+    '/': (3, False, ast.ExpMulDiv),
+}
+
+EXP_START = "{'(', IDENT, INTEGER}"
+
+# (kind, text, line, column, offset); kind is the text for operators
+Token = Tuple[str, str, int, int, int]
+# (method, args) called with the value of a parsed subexpression, see
+# Parser.parse_exp
+Continuation = Tuple[Callable[..., ast.Exp], tuple]
+# returned instead of a value by a continuation which needs another operand
+PENDING = object()
+
+
+class ParseError(Exception):
+
+    def __init__(self, line: int, column: int, msg: str):
+        super().__init__(f'{line}:{column}: {msg}')
+        self.line = line
+        self.column = column
+        self.msg = msg
+
+
+def tokenize(source: str) -> List[Token]:
+    tokens = []
+    line = 1
+    line_start = 0
+    offset = 0
+    match = TOKEN_RE.match
+    while offset < len(source):
+        m = match(source, offset)
+        if m is None:
+            tokens.append(
+                (INVALID, source[offset], line, offset - line_start, offset))
+            return tokens
+        kind = m.lastgroup
+        text = m.group()
+        if kind == 'WS':
+            newlines = text.count('\n')
+            if newlines:
+                line += newlines
+                line_start = offset + text.rindex('\n') + 1
+        else:
+            if kind == 'OP':
+                kind = text
+            tokens.append((kind, text, line, offset - line_start, offset))
+        offset = m.end()
+    tokens.append((EOF, EOF, line, offset - line_start, offset))
+    return tokens
+
+
+class Parser:
+
+    def __init__(self, source: str):
+        self.source = source
+        self.tokens = tokenize(source)
+        self.pos = 0
+
+    def peek(self, ahead: int = 0) -> str:
+        return self.tokens[self.pos + ahead][0]
+
+    def expect(self, kind: str) -> Token:
+        token = self.tokens[self.pos]
+        if token[0] != kind:
+            self.error(f"'{kind}'")
+        self.pos += 1
+        return token
+
+    def error(self, expected: str) -> None:
+        kind, text, line, column, _ = self.tokens[self.pos]
+        if kind == INVALID:
+            raise ParseError(
+                line, column, f"token recognition error at: '{text}'")
+        raise ParseError(
+            line, column, f"mismatched input '{text}' expecting {expected}")
+
+    # Offsets of the code from the token at index `first` to the last
+    # consumed token.
+    def span(self, first: int) -> Tuple[int, int]:
+        start = self.tokens[first][4]
+        _, text, _, _, last_start = self.tokens[self.pos - 1]
+        return start, last_start + len(text) - 1
+
+    # `(stmt ';')* stmt ';'?` in the grammar
+    def parse_prog(self) -> ast.Prog:
+        stmts = [self.parse_stmt()]
+        while self.peek() != EOF:
+            self.expect(';')
+            if self.peek() == EOF:
+                break
+            stmts.append(self.parse_stmt())
+        return ast.Prog(*self.span(0), stmts, self.source)
+
+    def parse_stmt(self) -> ast.Stmt:
+        first = self.pos
+        if self.peek() == 'IDENT' and self.peek(1) == '=':
+            name = self.tokens[self.pos][1]
+            self.pos += 2
+            exp = self.parse_exp()
+            return ast.StmtAss(*self.span(first), name, exp)
+        exp = self.parse_exp()
+        return ast.StmtExp(*self.span(first), exp)
+
+    # Expressions are parsed without recursion, so that deeply nested
+    # parentheses don't exceed the recursion limit of Python. Where
+    # a recursive descent parser would call parse_exp for an operand,
+    # a continuation (method, args) is pushed on `stack` and the operand is
+    # parsed in the loop of parse_exp. When an expression is parsed, the
+    # continuation on top of the stack is called with its value: it
+    # returns the value of its own expression, or PENDING after pushing
+    # continuations of the next operand. Continuations hold unbound
+    # methods, which is a bit faster than creating bound ones.
+    def parse_exp(self, min_precedence: int = 0) -> ast.Exp:
+        stack: List[Continuation] = []
+        value = self.parse_operand(stack, min_precedence)
+        while value is PENDING:
+            value = self.parse_primary(stack)
+            while value is not PENDING and stack:
+                method, args = stack.pop()
+                value = method(self, value, stack, *args)
+        return value
+
+    # Starts an expression whose binary operators have precedence
+    # at least min_precedence, its first operand is parsed next.
+    def start_exp(self, stack: List[Continuation],
+                  min_precedence: int) -> None:
+        stack.append((Parser.continue_exp, (self.pos, min_precedence)))
+
+    # Parses an expression whose binary operators have precedence at least
+    # min_precedence if it starts with a variable or a literal, otherwise
+    # starts it in the loop of parse_exp and returns PENDING.
+    def parse_operand(
+            self, stack: List[Continuation], min_precedence: int) -> ast.Exp:
+        first = self.pos
+        atom = self.parse_atom()
+        if atom is PENDING:
+            self.start_exp(stack, min_precedence)
+            return PENDING
+        return self.continue_exp(atom, stack, first, min_precedence)
+
+    # Parses the binary operators after the operand `left` of the
+    # expression starting at the token `first`. A right operand which is
+    # a variable or a literal (the most common case) is parsed here,
+    # without a continuation, together with the operators binding tighter
+    # after it (the recursion is bounded by the number of precedence
+    # levels).
+    def continue_exp(
+            self, left: ast.Exp, stack: List[Continuation], first: int,
+            min_precedence: int) -> ast.Exp:
+        while True:
+            op_info = BINARY_OPS.get(self.peek())
+            if op_info is None or op_info[0] < min_precedence:
+                return left
+            precedence, right_assoc, exp_class = op_info
+            if right_assoc:
+                left = self.parse_right_assoc_chain(
+                    left, stack, first, min_precedence, precedence, [], [],
+                    first)
+                if left is PENDING:
+                    return PENDING
+                continue
+            op = self.tokens[self.pos][1]
+            self.pos += 1
+            stack.append((Parser.end_binary_op, (
+                first, min_precedence, left, exp_class, op)))
+            right = self.parse_operand(stack, precedence + 1)
+            if right is PENDING:
+                return PENDING
+            stack.pop()
+            left = exp_class(*self.span(first), op, left, right)
+
+    def end_binary_op(
+            self, right: ast.Exp, stack: List[Continuation], first: int,
+            min_precedence: int, left: ast.Exp, exp_class: type,
+            op: str) -> ast.Exp:
+        left = exp_class(*self.span(first), op, left, right)
+        return self.continue_exp(left, stack, first, min_precedence)
+
+    # Parses a chain of right associative operators of the given
+    # precedence, called with each of its operands `right` (starting
+    # at the token right_first). The chain is kept in lists, `operands`
+    # are pairs (first token, expression) of the previous operands and
+    # `ops` are pairs (node class, operator). Returns the tree built when
+    # the chain ends, or PENDING.
+    def parse_right_assoc_chain(
+            self, right: ast.Exp, stack: List[Continuation], first: int,
+            min_precedence: int, precedence: int,
+            operands: List[Tuple[int, ast.Exp]], ops: List[Tuple[type, str]],
+            right_first: int) -> ast.Exp:
+        operands.append((right_first, right))
+        while True:
+            op_info = BINARY_OPS.get(self.peek())
+            if op_info is None or op_info[0] != precedence:
+                break
+            ops.append((op_info[2], self.tokens[self.pos][1]))
+            self.pos += 1
+            right_first = self.pos
+            stack.append((Parser.continue_right_assoc_chain, (
+                first, min_precedence, precedence, operands, ops,
+                right_first)))
+            right = self.parse_operand(stack, precedence + 1)
+            if right is PENDING:
+                return PENDING
+            stack.pop()
+            operands.append((right_first, right))
+        _, exp = operands.pop()
+        while ops:
+            exp_class, op = ops.pop()
+            left_first, left = operands.pop()
+            exp = exp_class(*self.span(left_first), op, left, exp)
+        return exp
+
+    # Continues the chain and then the expression containing it.
+    def continue_right_assoc_chain(
+            self, right: ast.Exp, stack: List[Continuation], first: int,
+            min_precedence: int, *chain_args) -> ast.Exp:
+        exp = self.parse_right_assoc_chain(
+            right, stack, first, min_precedence, *chain_args)
+        if exp is PENDING:
+            return PENDING
+        return self.continue_exp(exp, stack, first, min_precedence)
+
+    # Parses a subexpression and returns the value of the continuation
+    # (method, args) called with it. Like parse_operand, it returns PENDING
+    # if the subexpression is parsed in the loop of parse_exp, then the
+    # continuation is called there. `method` mustn't call parse_subexp,
+    # so that the recursion is bounded.
+    def parse_subexp(
+            self, stack: List[Continuation], min_precedence: int,
+            method: Callable[..., ast.Exp], args: tuple) -> ast.Exp:
+        stack.append((method, args))
+        value = self.parse_operand(stack, min_precedence)
+        if value is PENDING:
+            return PENDING
+        stack.pop()
+        return method(self, value, stack, *args)
+
+    # Parses a variable or a literal, if it's the next operand. Otherwise
+    # returns PENDING without consuming anything.
+    def parse_atom(self) -> ast.Exp:
+        first = self.pos
+        kind, text = self.tokens[first][:2]
+        if kind == 'INTEGER':
+            self.pos += 1
+            return ast.ExpLit(*self.span(first), int(text))
+        if kind == 'IDENT':
+            self.pos += 1
+            return ast.ExpVar(*self.span(first), text)
+        return PENDING
+
+    # Returns the parsed operand, or PENDING if the expression
+    # in parentheses is parsed next.
+    def parse_primary(self, stack: List[Continuation]) -> ast.Exp:
+        atom = self.parse_atom()
+        if atom is not PENDING:
+            return atom
+        first = self.pos
+        if self.peek() == '(':
+            self.pos += 1
+            return self.parse_subexp(stack, 0, Parser.end_paren, (first,))
+        self.error(EXP_START)
+
+    def end_paren(self, exp: ast.Exp, _stack: List[Continuation],
+                  first: int) -> ast.Exp:
+        self.expect(')')
+        return ast.ExpParen(*self.span(first), exp)
+
+
+def parse_prog(source: str) -> ast.Prog:
+    return Parser(source).parse_prog()
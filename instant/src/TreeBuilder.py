@@ -0,0 +1,49 @@
+# Builds the InstantAST tree from the ANTLR parse tree. ANTLR is kept as
+# the reference front end (--parser antlr), PrattParser builds the same
+# trees without it.
+
+import antlr4
+
+from antlr_generated.InstantParser import InstantParser
+import InstantAST as ast
+
+BINARY_EXPS = {
+    InstantParser.ExpMulDivContext: ast.ExpMulDiv,
+    InstantParser.ExpSubContext: ast.ExpSub,
+    InstantParser.ExpAddContext: ast.ExpAdd,
+}
+
+
+def pos(ctx: antlr4.ParserRuleContext):
+    return ctx.start.start, ctx.stop.stop
+
+
+def build_prog(ctx: InstantParser.ProgContext, source: str) -> ast.Prog:
+    stmts = [
+        build_stmt(child) for child in ctx.children
+        if isinstance(child, InstantParser.StmtContext)]
+    return ast.Prog(*pos(ctx), stmts, source)
+
+
+def build_stmt(ctx: InstantParser.StmtContext) -> ast.Stmt:
+    if isinstance(ctx, InstantParser.StmtAssContext):
+        return ast.StmtAss(
+            *pos(ctx), ctx.IDENT().getText(), build_exp(ctx.exp()))
+    if isinstance(ctx, InstantParser.StmtExpContext):
+        return ast.StmtExp(*pos(ctx), build_exp(ctx.exp()))
+    raise TypeError('unknown statement context type')
+
+
+def build_exp(ctx: InstantParser.ExpContext) -> ast.Exp:
+    binary_exp = BINARY_EXPS.get(type(ctx))
+    if binary_exp is not None:
+        return binary_exp(
+            *pos(ctx), ctx.getChild(1).getText(), build_exp(ctx.exp(0)),
+            build_exp(ctx.exp(1)))
+    if isinstance(ctx, InstantParser.ExpLitContext):
+        return ast.ExpLit(*pos(ctx), int(ctx.getText()))
+    if isinstance(ctx, InstantParser.ExpVarContext):
+        return ast.ExpVar(*pos(ctx), ctx.IDENT().getText())
+    if isinstance(ctx, InstantParser.ExpParenContext):
+        return ast.ExpParen(*pos(ctx), build_exp(ctx.exp()))
+    raise TypeError('unknown expression context type')
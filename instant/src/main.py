@@ -1,55 +1,324 @@
 #!/usr/bin/env python3
 
+import argparse
+import contextlib
+import functools
+import io
+import json
+import multiprocessing
+import subprocess
+import traceback
+
 import antlr4
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.ErrorStrategy import BailErrorStrategy, DefaultErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
 import os
 import sys
 
 from antlr_generated.InstantLexer import InstantLexer
 from antlr_generated.InstantParser import InstantParser
+import JVMAssembler
 from JVMCompiler import JVMCompiler
+from LLVMAssembler import assemble
 from LLVMCompiler import LLVMCompiler
+import PrattParser
+from TimeReport import TimeReport
+import TreeBuilder
 
 
-def main(argv):
-    if len(argv) != 4:
-        raise AttributeError('invalid number of arguments to compiler')
-    input_file, target_vm, project_dir = argv[1:]
-    if not input_file.endswith('.ins'):
-        raise AttributeError('input_file must have `ins` extension')
+# Parses with SLL prediction first (with BailErrorStrategy, which stops
+# at the first syntax error) and only if that fails, again with full LL
+# prediction and normal error reporting. The DFA cache of the generated
+# parser is shared by all files parsed in one process.
+def parse_prog(input_stream):
+    token_stream = antlr4.CommonTokenStream(InstantLexer(input_stream))
+    parser = InstantParser(token_stream)
+    parser._interp.predictionMode = PredictionMode.SLL
+    parser._errHandler = BailErrorStrategy()
+    try:
+        return parser.prog()
+    except ParseCancellationException:
+        parser.reset()
+        parser._interp.predictionMode = PredictionMode.LL
+        parser._errHandler = DefaultErrorStrategy()
+        return parser.prog()
+
+
+# Returns the InstantAST tree of the program, built with PrattParser or
+# with ANTLR (the reference front end, slower). Syntax errors are reported
+# like by the default error listener of ANTLR. ANTLR lexes the program
+# while parsing it, so there's no separate `lex` phase for it.
+def build_ast(source, parser='pratt', time_report=None):
+    if time_report is None:
+        time_report = TimeReport()
+    if parser == 'antlr':
+        # ANTLR and TreeBuilder are recursive, PrattParser is not
+        try:
+            with time_report.phase('parse'):
+                prog_tree = parse_prog(antlr4.InputStream(source))
+            with time_report.phase('build AST'):
+                return TreeBuilder.build_prog(prog_tree, source)
+        except RecursionError:
+            print('expression nested too deeply', file=sys.stderr)
+            sys.exit(1)
+    try:
+        with time_report.phase('lex'):
+            pratt_parser = PrattParser.Parser(source)
+        with time_report.phase('parse'):
+            return pratt_parser.parse_prog()
+    except PrattParser.ParseError as e:
+        print(f'line {e.line}:{e.column} {e.msg}', file=sys.stderr)
+        sys.exit(1)
+
+
+def parse_args(argv):
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        'input_file', help='.ins file or a manifest listing .ins files')
+    arg_parser.add_argument('target_vm')
+    arg_parser.add_argument('project_dir')
+    arg_parser.add_argument(
+        'more_input_files', nargs='*', metavar='input_file',
+        help='more files compiled in the same process (batch mode)')
+    arg_parser.add_argument(
+        '--parser', choices=('pratt', 'antlr'), default='pratt',
+        help='pratt: hand-written parser, antlr: parser generated by ANTLR '
+             '(the reference one, slower)')
+    arg_parser.add_argument(
+        '-O', type=int, choices=(0, 1), default=0, dest='opt_level',
+        help='jvm only; 1: fold constants, remove assignments which are '
+             'never read and optimize the code with a peephole pass, '
+             '0: no optimizations')
+    arg_parser.add_argument(
+        '--jvm-assembler', choices=('builtin', 'jasmin'), default='builtin',
+        help='builtin: write the .class file directly (JVMAssembler), '
+             'jasmin: assemble the .j file with Jasmin (slower, starts JVM)')
+    arg_parser.add_argument(
+        '--time-report', action='store_true',
+        help='print wall time, CPU time and peak memory of each phase '
+             'of the compilation')
+    arg_parser.add_argument(
+        '--time-report-json', metavar='PATH',
+        help='write the phases measured like by --time-report to PATH '
+             'as JSON (for all files in batch mode)')
+    arg_parser.add_argument(
+        '-j', '--jobs', type=int, default=1, metavar='N',
+        help='number of processes compiling the files in batch mode')
+    arg_parser.add_argument(
+        '--batch-report', metavar='PATH',
+        help='write exit codes and outputs of all files compiled in batch '
+             'mode to PATH as JSON')
+    # More input files can follow the options (latc adds --backend before
+    # them), such positional arguments are left unparsed by argparse
+    # (parse_intermixed_args needs Python 3.7)
+    args, unparsed = arg_parser.parse_known_args(argv[1:])
+    unknown_options = [arg for arg in unparsed if arg.startswith('-')]
+    if unknown_options:
+        arg_parser.error(
+            f'unrecognized arguments: {" ".join(unknown_options)}')
+    args.more_input_files += unparsed
+    return args
+
+
+def run_jasmin(project_dir, out_path, j_file_paths):
+    jasmin_path = os.path.join(project_dir, 'lib', 'jasmin.jar')
+    subprocess.run(
+        ['java', '-jar', jasmin_path, '-d', out_path] + j_file_paths)
+
+
+# With jasmin=False the .j file is only saved, Jasmin is run later for all
+# files of the batch.
+def compile_file(args, input_file, time_report, jasmin=True):
+    target_vm, project_dir = args.target_vm, args.project_dir
 
     out_path = os.path.dirname(input_file)
     base_name = os.path.split(input_file)[1][:-4]
     out_base_name = os.path.join(out_path, base_name)
 
-    input_file_stream = antlr4.FileStream(input_file)
-    lexer = InstantLexer(input_file_stream)
-    token_stream = antlr4.CommonTokenStream(lexer)
-    parser = InstantParser(token_stream)
-    prog_tree = parser.prog()
+    with time_report.phase('read'):
+        # decoded like antlr4.FileStream does
+        with open(input_file, 'rb') as f:
+            source = f.read().decode('ascii')
+    prog_ast = build_ast(source, args.parser, time_report)
     if target_vm == 'jvm':
-        compiler = JVMCompiler(base_name)
+        compiler = JVMCompiler(
+            base_name, optimize=args.opt_level > 0,
+            keep_code=args.jvm_assembler == 'builtin')
+        code_path = out_base_name + '.j'
     elif target_vm == 'llvm':
         compiler = LLVMCompiler()
+        code_path = out_base_name + '.ll'
     else:
         raise AttributeError(f'unknown target VM: `{target_vm}`')
 
-    code = compiler.visit_prog(prog_tree)
+    # the code is written to the file while it's generated, so the phase
+    # includes writing it
+    try:
+        with time_report.phase('codegen'):
+            with open(code_path, 'w') as f:
+                compiler.visit_prog(prog_ast, f)
+    except BaseException:
+        # don't leave a partially written file after an error
+        if os.path.exists(code_path):
+            os.remove(code_path)
+        raise
+    print(f'Saved {code_path}')
 
     if target_vm == 'llvm':
-        ll_file_path = out_base_name + '.ll'
         bc_file_path = out_base_name + '.bc'
-        with open(ll_file_path, 'w') as f:
-            f.write(code)
-            print(f'Saved {ll_file_path}')
-        os.system(f'llvm-as {ll_file_path} -o {bc_file_path}')
+        with time_report.phase('assemble'):
+            exit_code = assemble(code_path, bc_file_path)
+        if exit_code != 0:
+            sys.exit(exit_code)
         print(f'Compiled to {bc_file_path}')
-    elif target_vm == 'jvm':
-        j_file_path = out_base_name + '.j'
-        with open(j_file_path, 'w') as f:
-            f.write(code)
-            print(f'Saved {j_file_path}')
-        jasmin_path = os.path.join(project_dir, 'lib', 'jasmin.jar')
-        os.system(f'java -jar {jasmin_path} -d {out_path} {j_file_path}')
+    elif args.jvm_assembler == 'jasmin':
+        if jasmin:
+            with time_report.phase('jasmin'):
+                run_jasmin(project_dir, out_path, [code_path])
+    else:
+        class_file_path = out_base_name + '.class'
+        with time_report.phase('assemble'):
+            with open(class_file_path, 'wb') as f:
+                f.write(JVMAssembler.assemble(
+                    base_name, compiler.main_code + ['return'],
+                    compiler.locals, compiler.stack_limit))
+        print(f'Generated: {class_file_path}')
+
+
+def new_time_report(args):
+    return TimeReport(args.time_report or bool(args.time_report_json))
+
+
+# Compiles the file and prints its time report with --time-report, also
+# when the compilation fails.
+def compile_timed(args, input_file, time_report, jasmin=True):
+    try:
+        compile_file(args, input_file, time_report, jasmin)
+    finally:
+        if args.time_report:
+            print(time_report.format_table())
+
+
+# --time-report-json: a list of {"input_file": ..., "phases": [...]},
+# where each phase is {"phase", "wall", "cpu" (seconds), "peak_memory"
+# (bytes)}.
+def write_time_reports(path, reports):
+    with open(path, 'w') as f:
+        json.dump(reports, f, indent=1)
+
+
+# Returns the .ins files to compile. Any other input file is a manifest:
+# one path per line (relative to the manifest's directory), empty lines
+# and lines starting with `#` are skipped.
+def expand_inputs(input_files):
+    ins_files = []
+    for input_file in input_files:
+        if input_file.endswith('.ins'):
+            ins_files.append(input_file)
+            continue
+        manifest_dir = os.path.dirname(input_file)
+        with open(input_file) as f:
+            for line in f:
+                path = line.strip()
+                if path and not path.startswith('#'):
+                    ins_files.append(os.path.join(manifest_dir, path))
+    return ins_files
+
+
+# Compiles the file like a separate run of the compiler, with stdout
+# and stderr captured; returns them with the exit code.
+def compile_captured(args, input_file):
+    time_report = new_time_report(args)
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    exit_code = 0
+    with contextlib.redirect_stdout(stdout), \
+            contextlib.redirect_stderr(stderr):
+        try:
+            compile_timed(args, input_file, time_report, jasmin=False)
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                exit_code = e.code
+            elif e.code is not None:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except Exception:
+            traceback.print_exc()
+            exit_code = 1
+    result = {
+        'input_file': input_file,
+        'exit_code': exit_code,
+        'stdout': stdout.getvalue(),
+        'stderr': stderr.getvalue(),
+    }
+    if time_report.enabled:
+        result['time_report'] = time_report.phases
+    return result
+
+
+# Compiles many files in one process (with -j in a pool of processes),
+# so that Python and the parser are loaded once. Outputs of each file
+# are printed after a header line, in the order of the files, followed
+# by a summary; the exit code is 1 if any file failed. With Jasmin, it's
+# started once for all .j files of each output directory.
+def compile_batch(args, input_files):
+    if args.jobs > 1:
+        with multiprocessing.Pool(args.jobs) as pool:
+            results = pool.map(
+                functools.partial(compile_captured, args), input_files,
+                chunksize=1)
+    else:
+        results = [compile_captured(args, f) for f in input_files]
+
+    jasmin = args.target_vm == 'jvm' and args.jvm_assembler == 'jasmin'
+    j_files_by_dir = {}
+    for result in results:
+        print(f'==> {result["input_file"]} <==')
+        sys.stdout.flush()
+        sys.stderr.write(result['stderr'])
+        sys.stderr.flush()
+        sys.stdout.write(result['stdout'])
+        if jasmin and result['exit_code'] == 0:
+            out_path = os.path.dirname(result['input_file']) or '.'
+            j_files_by_dir.setdefault(out_path, []).append(
+                result['input_file'][:-4] + '.j')
+    if j_files_by_dir:
+        sys.stdout.flush()
+        for out_path, j_file_paths in j_files_by_dir.items():
+            run_jasmin(args.project_dir, out_path, j_file_paths)
+
+    failed = [result for result in results if result['exit_code'] != 0]
+    print(f'Compiled {len(results)} files, {len(failed)} failed')
+    for result in failed:
+        print(f'{result["input_file"]}: exit code {result["exit_code"]}')
+    if args.batch_report:
+        with open(args.batch_report, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.time_report_json:
+        write_time_reports(args.time_report_json, [
+            {'input_file': result['input_file'],
+             'phases': result['time_report']}
+            for result in results])
+    if failed:
+        sys.exit(1)
+
+
+def main(argv):
+    args = parse_args(argv)
+    input_files = [args.input_file] + args.more_input_files
+    if len(input_files) == 1 and input_files[0].endswith('.ins') \
+            and not args.batch_report:
+        time_report = new_time_report(args)
+        try:
+            compile_timed(args, args.input_file, time_report)
+        finally:
+            if args.time_report_json:
+                write_time_reports(args.time_report_json, [
+                    {'input_file': args.input_file,
+                     'phases': time_report.phases}])
+    else:
+        compile_batch(args, expand_inputs(input_files))
 
 
 if __name__ == '__main__':
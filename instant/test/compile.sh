@@ -1,10 +1,8 @@
 #!/usr/bin/env bash
 
-for i in {01..12}
-do
-    ../insc_llvm test${i}.ins
-    ../insc_jvm test${i}.ins
-done
+# all tests are compiled by one run of each compiler (batch mode)
+../insc_llvm test{01..12}.ins
+../insc_jvm test{01..12}.ins
 
 mkdir -p out bin
 mv *.ll *.j out/
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# Measures time of code generation (LLVMCompiler, without writing the code
+# and building the executable) for generated Latte programs of growing
+# size, per AST node. A program of size n has n statements with balanced
+# expressions of 64 leaves (ints, variables, calls) mixing all binary
+# operators, and n / 8 if/else and while statements. The values come from
+# readInt(), so that nothing is folded to constants.
+
+import argparse
+import gc
+import os
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_DIR, 'src'))
+
+# pylint: disable=C0413
+import LatteAST as ast
+from LLVMCompiler import LLVMCompiler
+import PrattParser
+
+INT_OPS = ['+', '-', '*', '/', '%']
+LEAVES = ['x', 'y', '7', 'f(x)', '(x - y)', '-y']
+
+
+class NullWriter:
+    def write_function(self, function):
+        pass
+
+    def write_globals(self, str_consts, declarations):
+        pass
+
+
+def generate_exp(depth, i):
+    if depth == 0:
+        return LEAVES[i % len(LEAVES)]
+    op = INT_OPS[(depth + i) % len(INT_OPS)]
+    left = generate_exp(depth - 1, 2 * i)
+    right = generate_exp(depth - 1, 2 * i + 1)
+    return f'({left} {op} {right})'
+
+
+def generate_program(n):
+    lines = [
+        'int f(int a) { return a + 1; }',
+        'int main() {',
+        '  int x = readInt(), y = readInt() + 1;',
+    ]
+    for i in range(n):
+        lines.append(f'  x = {generate_exp(6, i)};')
+        if i % 8 == 0:
+            lines.append(
+                f'  if (x < y && !(x == {i}) || y >= x) x++; else y--;')
+            lines.append(f'  while (x > {i}) {{ x = x / 2; printInt(x); }}')
+    lines += ['  return 0;', '}']
+    return '\n'.join(lines) + '\n'
+
+
+def count_nodes(node):
+    count = 1
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        for cls in type(node).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                value = getattr(node, slot, None)
+                children = value if isinstance(value, list) else [value]
+                for child in children:
+                    if isinstance(child, ast.Node):
+                        count += 1
+                        stack.append(child)
+    return count
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[100, 200, 400, 800],
+        help='sizes of generated programs')
+    arg_parser.add_argument(
+        '--runs', type=int, default=3,
+        help='number of runs for each size (the best one is shown)')
+    args = arg_parser.parse_args()
+
+    print(f'{"size":>6} {"nodes":>8} {"time [ms]":>10} {"per node [us]":>14}')
+    for n in args.sizes:
+        prog = PrattParser.parse_program(generate_program(n))
+        nodes = count_nodes(prog)
+        best = None
+        for _ in range(args.runs):
+            # without collections of the garbage collector, which depend
+            # on the number of objects alive rather than on the program
+            gc.collect()
+            gc.disable()
+            start = time.perf_counter()
+            LLVMCompiler().visit_prog(prog, NullWriter())
+            elapsed = time.perf_counter() - start
+            gc.enable()
+            best = elapsed if best is None else min(best, elapsed)
+        print(f'{n:>6} {nodes:>8} {best * 1000:>10.1f} '
+              f'{best / nodes * 10**6:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
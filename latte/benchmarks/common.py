@@ -0,0 +1,42 @@
+# Helpers shared by the benchmarks which compile Latte programs with
+# latc_llvm and time their runs.
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def compile_program(lat_path, backend):
+    ps = subprocess.run(
+        [os.path.join(PROJECT_DIR, 'latc_llvm'), lat_path,
+         '--backend', backend],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    if ps.returncode != 0:
+        print(str(ps.stdout, 'ascii', 'replace'), file=sys.stderr)
+        sys.exit(f'Compilation of {lat_path} ({backend}) failed')
+
+
+# Arguments running the program compiled from base_path + '.lat':
+# the bitcode with lli or the native executable.
+def program_args(base_path, backend):
+    if backend == 'llvm':
+        return ['lli', base_path + '.bc']
+    return [base_path]
+
+
+# Runs the program `runs` times with program_input (bytes) on its standard
+# input, checks its output and returns the mean run time.
+def time_runs(args, program_input, correct_out, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        ps = subprocess.run(
+            args, input=program_input, stdout=subprocess.PIPE)
+        times.append(time.perf_counter() - start)
+        if str(ps.stdout, 'ascii') != correct_out:
+            sys.exit(f'Wrong output of {" ".join(args)}')
+    return statistics.mean(times)
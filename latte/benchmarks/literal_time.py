@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# Measures time of code generation (LLVMCompiler, without writing the code
+# and building the executable) for generated Latte programs with growing
+# numbers of distinct string literals. A program with n literals uses
+# each of them twice (printed and compared with a string read from
+# the input) and declares n / 8 strings without initializers, which share
+# the empty string. Each of them is declared in its own block, so that
+# the number of variables joined after if statements doesn't grow.
+# The number of generated instructions is shown too.
+
+import argparse
+import gc
+import os
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_DIR, 'src'))
+
+# pylint: disable=C0413
+from LLVMCompiler import LLVMCompiler
+import PrattParser
+
+
+class CountingWriter:
+    def __init__(self):
+        self.instrs = 0
+        self.str_consts = 0
+
+    def write_function(self, function):
+        self.instrs += sum(len(block.instrs) for block in function.blocks)
+
+    def write_globals(self, str_consts, declarations):
+        self.str_consts = len(str_consts)
+
+
+def generate_program(n):
+    lines = [
+        'int main() {',
+        '  string s = readString();',
+    ]
+    for i in range(n):
+        lines.append(f'  printString("literal {i}");')
+        lines.append(f'  if (s == "literal {i}") printInt({i});')
+        if i % 8 == 0:
+            lines.append('  { string t; printString(t); }')
+    lines += ['  return 0;', '}']
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[1000, 4000, 16000],
+        help='numbers of distinct literals in generated programs')
+    arg_parser.add_argument(
+        '--runs', type=int, default=3,
+        help='number of runs for each size (the best one is shown)')
+    args = arg_parser.parse_args()
+
+    print(f'{"literals":>8} {"globals":>8} {"instructions":>13} '
+          f'{"time [ms]":>10} {"per literal [us]":>17}')
+    for n in args.sizes:
+        prog = PrattParser.parse_program(generate_program(n))
+        best = None
+        for _ in range(args.runs):
+            # without collections of the garbage collector, which depend
+            # on the number of objects alive rather than on the program
+            gc.collect()
+            gc.disable()
+            writer = CountingWriter()
+            start = time.perf_counter()
+            LLVMCompiler().visit_prog(prog, writer)
+            elapsed = time.perf_counter() - start
+            gc.enable()
+            best = elapsed if best is None else min(best, elapsed)
+        print(f'{n:>8} {writer.str_consts:>8} {writer.instrs:>13} '
+              f'{best * 1000:>10.1f} {best / n * 10**6:>17.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Compares run times of the lattests/good programs compiled with the LLVM
+# backend (run with lli) and with the x86-64 backend (native executables).
+# Programs are compiled in a temporary directory, each one is run the given
+# number of times with its .input file, and outputs of both versions are
+# checked against the .output file.
+
+import argparse
+import os
+import shutil
+import tempfile
+
+from common import PROJECT_DIR, compile_program, program_args, time_runs
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '--runs', type=int, default=5,
+        help='number of runs of each program')
+    arg_parser.add_argument(
+        '--test-dir', default=os.path.join(PROJECT_DIR, 'lattests', 'good'))
+    args = arg_parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='latc_bench')
+    try:
+        print(f'{"program":<12} {"lli [ms]":>10} {"native [ms]":>12} '
+              f'{"speedup":>8}')
+        total_lli = total_native = 0
+        for f in sorted(os.listdir(args.test_dir)):
+            if not f.endswith('.lat'):
+                continue
+            name = f[:-4]
+            lat_path = os.path.join(tmp_dir, f)
+            shutil.copy(os.path.join(args.test_dir, f), lat_path)
+            input_path = os.path.join(args.test_dir, name + '.input')
+            program_input = None
+            if os.path.isfile(input_path):
+                with open(input_path, 'rb') as f:
+                    program_input = f.read()
+            with open(os.path.join(args.test_dir, name + '.output')) as out:
+                correct_out = out.read()
+            compile_program(lat_path, 'llvm')
+            compile_program(lat_path, 'x86_64')
+            base_path = os.path.join(tmp_dir, name)
+            lli_time = time_runs(
+                program_args(base_path, 'llvm'), program_input, correct_out,
+                args.runs)
+            native_time = time_runs(
+                program_args(base_path, 'x86_64'), program_input,
+                correct_out, args.runs)
+            total_lli += lli_time
+            total_native += native_time
+            print(f'{name:<12} {lli_time * 1000:>10.2f} '
+                  f'{native_time * 1000:>12.2f} '
+                  f'{lli_time / native_time:>7.1f}x')
+        print(f'{"total":<12} {total_lli * 1000:>10.2f} '
+              f'{total_native * 1000:>12.2f} '
+              f'{total_lli / total_native:>7.1f}x')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# Measures time of parsing generated Latte programs of growing size with
+# ANTLR, with full LL prediction and with the SLL-first parse used by
+# `--parser antlr`, and with the hand-written parser (PrattParser) used by
+# default, including building the AST in both cases.
+# A program of size n has an expression with n additions (a long chain
+# of a left-recursive rule) and n / 4 if/else and while statements.
+#
+# The DFA cache of the parser is cleared before each measurement, so the
+# first parse ("cold") shows the cost of compiling a single file in a new
+# process and the second one ("warm") the cost in a long-running process
+# like the compile server.
+
+import argparse
+import os
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_DIR, 'src'))
+
+# pylint: disable=C0413
+import antlr4
+from antlr4.dfa.DFA import DFA
+from antlr_generated.LatteLexer import LatteLexer
+from antlr_generated.LatteParser import LatteParser
+from main import LatteParserErrorListener, parse_program
+import PrattParser
+import TreeBuilder
+
+
+def generate_program(n):
+    lines = ['int main() {', '  int x = readInt();']
+    lines.append(
+        '  x = ' + ' + '.join(f'x * {i}' for i in range(n)) + ';')
+    for i in range(n // 4):
+        lines.append(
+            f'  if (x < {i}) x = x - {i}; else {{ printInt(x + {i}); }}')
+        lines.append(f'  while (x > {i} && x != {i + 1}) x--;')
+    lines += ['  return 0;', '}']
+    return '\n'.join(lines) + '\n'
+
+
+def clear_dfa_cache():
+    decision_states = LatteParser.atn.decisionToState
+    LatteParser.decisionsToDFA = [
+        DFA(state, i) for i, state in enumerate(decision_states)]
+
+
+def parse_time(source, sll_first):
+    start = time.perf_counter()
+    prog_tree = parse_program(
+        antlr4.InputStream(source), LatteParserErrorListener(), sll_first)
+    TreeBuilder.build_program(prog_tree, source)
+    return time.perf_counter() - start
+
+
+def pratt_parse_time(source):
+    start = time.perf_counter()
+    PrattParser.parse_program(source)
+    return time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[50, 100, 200, 400, 800],
+        help='sizes of generated programs')
+    args = arg_parser.parse_args()
+
+    print(f'{"size":>6} {"tokens":>7} {"LL cold":>9} {"LL warm":>9} '
+          f'{"SLL cold":>9} {"SLL warm":>9} {"Pratt":>9}   [ms]')
+    for n in args.sizes:
+        source = generate_program(n)
+        tokens = antlr4.CommonTokenStream(
+            LatteLexer(antlr4.InputStream(source)))
+        tokens.fill()
+        times = []
+        for sll_first in (False, True):
+            clear_dfa_cache()
+            times.append(parse_time(source, sll_first))
+            times.append(parse_time(source, sll_first))
+        times.append(pratt_parse_time(source))
+        print(f'{n:>6} {len(tokens.tokens):>7} ' + ' '.join(
+            f'{t * 1000:>9.1f}' for t in times))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+# Measures building strings in a loop (`s = s + "abc"`, run n times)
+# for increasing n, followed by a comparison of two strings built this way.
+# The program is compiled once in a temporary directory and n is given
+# on its standard input. With linear-time appending, time per append
+# stays about the same as n grows.
+
+import argparse
+import os
+import shutil
+import tempfile
+
+from common import compile_program, program_args, time_runs
+
+PROGRAM = '''
+int main() {
+  int n = readInt();
+  string s = "";
+  string t = "";
+  int i = 0;
+  while (i < n) {
+    s = s + "abc";
+    i++;
+  }
+  i = 0;
+  while (i < n) {
+    t = t + "abc";
+    i++;
+  }
+  if (s == t) {
+    printString("equal");
+  }
+  return 0;
+}
+'''
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '--sizes', type=int, nargs='+',
+        default=[1000, 2000, 4000, 8000, 16000],
+        help='numbers of appends to each of the strings')
+    arg_parser.add_argument(
+        '--runs', type=int, default=3,
+        help='number of runs for each size')
+    arg_parser.add_argument(
+        '--backend', choices=('llvm', 'x86_64'), default='x86_64',
+        help='llvm runs the program with lli, x86_64 natively')
+    args = arg_parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='latc_bench')
+    try:
+        lat_path = os.path.join(tmp_dir, 'strings.lat')
+        with open(lat_path, 'w') as f:
+            f.write(PROGRAM)
+        compile_program(lat_path, args.backend)
+        run_args = program_args(lat_path[:-4], args.backend)
+        # time of starting the program, subtracted from the other times
+        start_time = time_runs(run_args, b'0\n', 'equal\n', args.runs)
+        print(f'{"n":>8} {"time [ms]":>10} {"per append [ns]":>16}')
+        for size in args.sizes:
+            run_time = time_runs(
+                run_args, bytes(f'{size}\n', 'ascii'), 'equal\n',
+                args.runs)
+            per_append = max(run_time - start_time, 0) / (2 * size)
+            print(f'{size:>8} {run_time * 1000:>10.2f} '
+                  f'{per_append * 1e9:>16.1f}')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
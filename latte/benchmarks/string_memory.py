@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# Stress test of freeing strings: a program which reads n lines and builds
+# temporary strings from each of them is run for increasing n, and its
+# peak memory usage (maximum resident set size) is printed. When unused
+# strings are freed, peak memory stays about the same as n grows.
+# The program is compiled once in a temporary directory.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import compile_program, program_args
+
+PROGRAM = '''
+int main() {
+  int n = readInt();
+  string longest = "";
+  int i = 0;
+  while (i < n) {
+    string line = readString();
+    string s = "";
+    int j = 0;
+    while (j < 10) {
+      s = s + line + ",";
+      j++;
+    }
+    if (s + line > longest) {
+      longest = s + line;
+    }
+    i++;
+  }
+  printString(longest);
+  return 0;
+}
+'''
+
+LINE_LENGTH = 80
+
+
+# The input is written line by line, since the peak memory of the program
+# includes the memory of this process, from which it's started.
+def write_input(size, input_path):
+    with open(input_path, 'w') as f:
+        f.write(f'{size}\n')
+        for i in range(size):
+            f.write(f'{i:0{LINE_LENGTH}}\n')
+
+
+# Returns the run time and the maximum resident set size in bytes.
+def measure_run(args, size, input_path):
+    correct_out = (f'{size - 1:0{LINE_LENGTH}},' * 10
+                   + f'{size - 1:0{LINE_LENGTH}}\n')
+    write_input(size, input_path)
+    with open(input_path) as stdin:
+        start = time.perf_counter()
+        ps = subprocess.Popen(args, stdin=stdin, stdout=subprocess.PIPE)
+        out = ps.stdout.read()
+        _, status, usage = os.wait4(ps.pid, 0)
+        run_time = time.perf_counter() - start
+    if status != 0 or str(out, 'ascii') != correct_out:
+        sys.exit(f'Wrong output of {" ".join(args)} for n = {size}')
+    return run_time, usage.ru_maxrss * 1024
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '--sizes', type=int, nargs='+',
+        default=[1000, 10000, 100000, 1000000],
+        help='numbers of read lines')
+    arg_parser.add_argument(
+        '--backend', choices=('llvm', 'x86_64'), default='x86_64',
+        help='llvm runs the program with lli, x86_64 natively')
+    args = arg_parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='latc_bench')
+    try:
+        lat_path = os.path.join(tmp_dir, 'strings.lat')
+        with open(lat_path, 'w') as f:
+            f.write(PROGRAM)
+        compile_program(lat_path, args.backend)
+        base_path = lat_path[:-4]
+        run_args = program_args(base_path, args.backend)
+        print(f'{"n":>8} {"time [ms]":>10} {"peak memory [MiB]":>18}')
+        for size in args.sizes:
+            run_time, peak_memory = measure_run(
+                run_args, size, base_path + '.input')
+            print(f'{size:>8} {run_time * 1000:>10.2f} '
+                  f'{peak_memory / (1 << 20):>18.1f}')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,67 +1,398 @@
+#include <errno.h>
+#include <limits.h>
+#include <stdint.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <unistd.h>
 
 
+// Strings know their length, so that concatenation and comparison don't
+// need strlen. Characters of strings built at run time are kept
+// in a Buffer, which can be shared by many strings: each one is a prefix
+// of the buffer's used part. A string that ends where the used part ends
+// (e.g. `s` after `s = s + x`) can be extended in place, since no other
+// string sees the bytes after it, so building a string in a loop copies
+// every character only a constant number of times on average. Literals
+// generated by the compiler are Strings with buffer == NULL.
+typedef struct {
+    size_t used;
+    size_t capacity;
+    char data[];
+} Buffer;
+
+typedef struct {
+    size_t length;
+    const char *chars;
+    Buffer *buffer;
+} String;
+
+#define MIN_BUFFER_CAPACITY 16
+
+// Input and output go through large buffers and system calls instead of
+// stdio, and integers are parsed and formatted here. Output is flushed
+// when its buffer is full, before reading more input (so that prompts
+// are visible), at exit, in error() and, if stdout is a terminal, after
+// every line, like with stdio.
+
+#define IO_BUFFER_SIZE (64 << 10)
+
+static char output[IO_BUFFER_SIZE];
+static size_t output_used = 0;
+static int output_is_terminal = -1;  // unknown until the first print
+
+static char input[IO_BUFFER_SIZE];
+static size_t input_pos = 0;
+static size_t input_end = 0;
+
+static void write_all(const char *data, size_t size) {
+    while (size > 0) {
+        ssize_t written = write(STDOUT_FILENO, data, size);
+        if (written < 0) {
+            if (errno == EINTR) {
+                continue;
+            }
+            return;
+        }
+        data += written;
+        size -= written;
+    }
+}
+
+static void flush_output(void) {
+    write_all(output, output_used);
+    output_used = 0;
+}
+
+// Run at exit of the program, also when it's run by lli.
+static __attribute__((destructor)) void flush_output_at_exit(void) {
+    flush_output();
+}
+
+static void print(const char *data, size_t size) {
+    if (size > IO_BUFFER_SIZE - output_used) {
+        flush_output();
+        if (size > IO_BUFFER_SIZE) {
+            write_all(data, size);
+            return;
+        }
+    }
+    memcpy(output + output_used, data, size);
+    output_used += size;
+}
+
+static void print_cstring(const char *s) {
+    print(s, strlen(s));
+}
+
+static void end_line(void) {
+    print("\n", 1);
+    if (output_is_terminal < 0) {
+        output_is_terminal = isatty(STDOUT_FILENO);
+    }
+    if (output_is_terminal) {
+        flush_output();
+    }
+}
+
+// Returns the next input character without consuming it, or EOF.
+static int peek_char(void) {
+    if (input_pos == input_end) {
+        flush_output();
+        ssize_t size;
+        do {
+            size = read(STDIN_FILENO, input, IO_BUFFER_SIZE);
+        } while (size < 0 && errno == EINTR);
+        if (size <= 0) {
+            return EOF;
+        }
+        input_pos = 0;
+        input_end = size;
+    }
+    return (unsigned char) input[input_pos];
+}
+
+static int read_char(void) {
+    int c = peek_char();
+    if (c != EOF) {
+        ++input_pos;
+    }
+    return c;
+}
+
+static int is_space(int c) {
+    return c == ' ' || (c >= '\t' && c <= '\r');
+}
+
 void printInt(int x) {
-    printf("%d\n", x);
+    char digits[16];
+    char *end = digits + sizeof(digits);
+    char *start = end;
+    unsigned int value = x < 0 ? -(unsigned int) x : (unsigned int) x;
+    do {
+        *--start = '0' + value % 10;
+        value /= 10;
+    } while (value > 0);
+    if (x < 0) {
+        *--start = '-';
+    }
+    print(start, end - start);
+    end_line();
 }
 
-void printString(char *s) {
-    puts(s);
+void printString(String *s) {
+    print(s->chars, s->length);
+    end_line();
 }
 
 void error() {
-    puts("runtime error");
+    print_cstring("runtime error\n");
+    flush_output();
     exit(1);
 }
 
+// Reads like scanf("%d\n"): whitespace, an optionally signed number (out
+// of range values are clamped to long and then converted to int, like
+// in glibc) and the whitespace after it.
 int readInt() {
-    int x;
-    if (scanf("%d\n", &x) == 1) {
-        return x;
-    } else {
-        puts("Runtime error: read value is not an integer.");
+    int c;
+    while (is_space(c = peek_char())) {
+        ++input_pos;
+    }
+    int negative = c == '-';
+    if (c == '-' || c == '+') {
+        ++input_pos;
+        c = peek_char();
+    }
+    if (c < '0' || c > '9') {
+        print_cstring("Runtime error: read value is not an integer.\n");
+        flush_output();
         exit(1);
     }
+    unsigned long limit = (unsigned long) LONG_MAX + negative;
+    unsigned long value = 0;
+    while ((c = peek_char()) >= '0' && c <= '9') {
+        ++input_pos;
+        unsigned long digit = c - '0';
+        value = value > (limit - digit) / 10 ? limit : value * 10 + digit;
+    }
+    while (is_space(peek_char())) {
+        ++input_pos;
+    }
+    return (int) (negative ? -value : value);
 }
 
-char *readString() {
-    size_t buf_size = 8;
-    char *buf = malloc(buf_size);
-    size_t read_chars = 0;
-    char c = 1;
-    while (c != 0) {
-        if (read_chars == buf_size) {
-            size_t new_buf_size = buf_size << 1;
-            char *new_buf = malloc(new_buf_size);
-            while (buf_size--) {
-                new_buf[buf_size] = buf[buf_size];
+// Strings and Buffers are freed by a mark-sweep collector. Pointers
+// to strings are kept by the generated code only in registers and on the
+// stack (Latte has no global variables and the runtime keeps no strings),
+// so the stack is scanned conservatively: every word which points into
+// a managed object (also into its middle, e.g. the chars of a Buffer)
+// marks it, and a marked String marks its Buffer. Collections happen
+// only at the beginning of the allocating runtime functions, after
+// enough memory has been allocated since the last one.
+
+typedef struct {
+    size_t size;
+    int marked;
+    int is_string;
+} Header;  // precedes each managed object
+
+#define MIN_GC_THRESHOLD (4 << 20)
+
+extern void *__libc_stack_end;  // the top of the stack of the main thread
+
+static Header **objects = NULL;
+static size_t objects_count = 0;
+static size_t objects_capacity = 0;
+static size_t allocated_bytes = 0;  // since the last collection
+static size_t gc_threshold = MIN_GC_THRESHOLD;
+
+static void *gc_alloc(size_t size, int is_string) {
+    if (objects_count == objects_capacity) {
+        objects_capacity = objects_capacity ? 2 * objects_capacity : 1024;
+        objects = realloc(objects, objects_capacity * sizeof(Header *));
+    }
+    Header *header = malloc(sizeof(Header) + size);
+    header->size = size;
+    header->marked = 0;
+    header->is_string = is_string;
+    objects[objects_count++] = header;
+    allocated_bytes += sizeof(Header) + size;
+    return header + 1;
+}
+
+static int compare_words(const void *a, const void *b) {
+    uintptr_t x = *(const uintptr_t *) a;
+    uintptr_t y = *(const uintptr_t *) b;
+    return (x > y) - (x < y);
+}
+
+static uintptr_t *stack_words = NULL;
+static size_t stack_words_count = 0;
+static size_t stack_words_capacity = 0;
+
+// Not inlined, so that the frame of collect_garbage, with the registers
+// saved by it, is above the copied part of the stack.
+static __attribute__((noinline)) void copy_stack(void) {
+    void *bottom = &bottom;
+    uintptr_t *word = (uintptr_t *) ((uintptr_t) bottom & ~(uintptr_t) 7);
+    size_t count = (uintptr_t *) __libc_stack_end - word;
+    if (count > stack_words_capacity) {
+        stack_words_capacity = 2 * count;
+        stack_words = realloc(
+            stack_words, stack_words_capacity * sizeof(uintptr_t));
+    }
+    memcpy(stack_words, word, count * sizeof(uintptr_t));
+    stack_words_count = count;
+}
+
+// stack_words has to be sorted
+static int is_pointed_to(Header *header) {
+    uintptr_t start = (uintptr_t) (header + 1);
+    size_t low = 0, high = stack_words_count;
+    while (low < high) {  // finds the first word >= start
+        size_t mid = low + (high - low) / 2;
+        if (stack_words[mid] < start) {
+            low = mid + 1;
+        } else {
+            high = mid;
+        }
+    }
+    return low < stack_words_count
+        && stack_words[low] < start + header->size;
+}
+
+// There are usually much fewer words on the stack than objects, so
+// the words are sorted and looked up for each object, and not the other
+// way round.
+static __attribute__((noinline)) void collect_garbage(void) {
+    __builtin_unwind_init();  // saves callee-saved registers on the stack
+    copy_stack();
+    qsort(stack_words, stack_words_count, sizeof(uintptr_t), compare_words);
+    for (size_t i = 0; i < objects_count; ++i) {
+        Header *header = objects[i];
+        if (is_pointed_to(header)) {
+            header->marked = 1;
+            if (header->is_string) {
+                Buffer *buffer = ((String *) (header + 1))->buffer;
+                if (buffer != NULL) {
+                    ((Header *) buffer - 1)->marked = 1;
+                }
             }
-            buf_size = new_buf_size;
-            free(buf);
-            buf = new_buf;
         }
-        c = getchar();
-        if (c == EOF || c == '\n' || c == '\r') {
-            c = 0;
+    }
+    size_t live_count = 0;
+    size_t live_bytes = 0;
+    for (size_t i = 0; i < objects_count; ++i) {
+        Header *header = objects[i];
+        if (header->marked) {
+            header->marked = 0;
+            live_bytes += sizeof(Header) + header->size;
+            objects[live_count++] = header;
+        } else {
+            free(header);
         }
-        buf[read_chars] = c;
-        ++read_chars;
     }
-    return buf;
+    objects_count = live_count;
+    allocated_bytes = 0;
+    gc_threshold = live_bytes > MIN_GC_THRESHOLD ? live_bytes
+                                                 : MIN_GC_THRESHOLD;
 }
 
-char *strconcat(char *a, char *b) {
-    size_t a_len = strlen(a);
-    size_t b_len = strlen(b);
-    char *s = malloc(a_len + b_len + 1);
-    for (int i = 0; i < a_len; ++i) {
-        s[i] = a[i];
+static void maybe_collect_garbage(void) {
+    if (allocated_bytes >= gc_threshold) {
+        collect_garbage();
     }
-    for (int i = 0; i < b_len; ++i) {
-        s[a_len + i] = b[i];
+}
+
+static Buffer *new_buffer(size_t capacity) {
+    if (capacity < MIN_BUFFER_CAPACITY) {
+        capacity = MIN_BUFFER_CAPACITY;
     }
-    s[a_len + b_len] = 0;
+    Buffer *buffer = gc_alloc(sizeof(Buffer) + capacity, 0);
+    buffer->used = 0;
+    buffer->capacity = capacity;
+    return buffer;
+}
+
+static String *new_string(size_t length, const char *chars, Buffer *buffer) {
+    String *s = gc_alloc(sizeof(String), 1);
+    s->length = length;
+    s->chars = chars;
+    s->buffer = buffer;
     return s;
 }
+
+// The line is read into a buffer reused by all calls and copied into
+// a Buffer of its size.
+String *readString() {
+    static char *line = NULL;
+    static size_t line_capacity = 64;
+    if (line == NULL) {
+        line = malloc(line_capacity);
+    }
+    maybe_collect_garbage();
+    size_t length = 0;
+    int c;
+    while ((c = read_char()) != EOF && c != '\n' && c != '\r' && c != 0) {
+        if (length == line_capacity) {
+            line_capacity *= 2;
+            line = realloc(line, line_capacity);
+        }
+        line[length++] = c;
+    }
+    Buffer *buffer = new_buffer(length);
+    memcpy(buffer->data, line, length);
+    buffer->used = length;
+    return new_string(length, buffer->data, buffer);
+}
+
+String *strconcat(String *a, String *b) {
+    maybe_collect_garbage();
+    if (b->length == 0) {
+        return a;
+    }
+    if (a->length == 0) {
+        return b;
+    }
+    size_t length = a->length + b->length;
+    Buffer *buffer = a->buffer;
+    if (buffer != NULL && buffer->used == a->length
+            && buffer->capacity - buffer->used >= b->length) {
+        memcpy(buffer->data + buffer->used, b->chars, b->length);
+        buffer->used = length;
+        return new_string(length, buffer->data, buffer);
+    }
+    buffer = new_buffer(2 * length);
+    memcpy(buffer->data, a->chars, a->length);
+    memcpy(buffer->data + a->length, b->chars, b->length);
+    buffer->used = length;
+    return new_string(length, buffer->data, buffer);
+}
+
+// Used for == and !=. Occurrences of the same literal are the same
+// String, so comparing them doesn't look at the characters.
+int strequal(String *a, String *b) {
+    if (a == b) {
+        return 1;
+    }
+    if (a->length != b->length) {
+        return 0;
+    }
+    return a->chars == b->chars
+        || memcmp(a->chars, b->chars, a->length) == 0;
+}
+
+// Used for <, <=, > and >=; returns a negative number, 0 or a positive
+// number, like strcmp.
+int strcompare(String *a, String *b) {
+    if (a == b) {
+        return 0;
+    }
+    size_t length = a->length < b->length ? a->length : b->length;
+    int result = memcmp(a->chars, b->chars, length);
+    if (result != 0) {
+        return result;
+    }
+    return (a->length > b->length) - (a->length < b->length);
+}
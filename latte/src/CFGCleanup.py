@@ -0,0 +1,188 @@
+# pylint: disable=C0103, C0111, R1705
+
+# Cleanup of a function generated by LLVMCompiler, run before it is
+# added to the module. The cleanup:
+# * drops instructions after the first terminator of each block,
+# * moves all allocas to the entry block,
+# * removes blocks which are unreachable from the entry block,
+# * merges blocks with their only successor if they are its only predecessor,
+# * removes phi nodes with only one distinct value,
+# * removes instructions which have no side effects and whose results are
+#   never used.
+
+from typing import Dict, List, Set
+
+from LLVMIR import Block, Function, Instr
+
+
+def drop_code_after_terminators(blocks: List[Block]) -> None:
+    for block in blocks:
+        for i, instr in enumerate(block.instrs):
+            if instr.is_terminator():
+                del block.instrs[i + 1:]
+                break
+
+
+def hoist_allocas(blocks: List[Block]) -> None:
+    allocas = []
+    for block in blocks:
+        allocas += [instr for instr in block.instrs if instr.opcode == 'alloca']
+        block.instrs = [
+            instr for instr in block.instrs if instr.opcode != 'alloca']
+    blocks[0].instrs = allocas + blocks[0].instrs
+
+
+def remove_unreachable_blocks(blocks: List[Block]) -> List[Block]:
+    by_label = {block.label: block for block in blocks}
+    reachable = {blocks[0].label}
+    stack = [blocks[0]]
+    while stack:
+        for label in stack.pop().successors():
+            if label not in reachable:
+                reachable.add(label)
+                stack.append(by_label[label])
+    blocks = [block for block in blocks if block.label in reachable]
+    for block in blocks:
+        for instr in block.instrs:
+            if instr.opcode == 'phi':
+                incoming = [
+                    (value, label)
+                    for value, label in zip(instr.operands, instr.labels)
+                    if label in reachable]
+                instr.operands = [value for value, _ in incoming]
+                instr.labels = [label for _, label in incoming]
+    return blocks
+
+
+def predecessors(blocks: List[Block]) -> Dict[str, List[str]]:
+    preds: Dict[str, List[str]] = {block.label: [] for block in blocks}
+    for block in blocks:
+        for label in block.successors():
+            preds[label].append(block.label)
+    return preds
+
+
+def merge_blocks(blocks: List[Block]) -> List[Block]:
+    by_label = {block.label: block for block in blocks}
+    preds = predecessors(blocks)
+    merged: Set[str] = set()
+    for block in blocks:
+        if block.label in merged:
+            continue
+        while True:
+            succs = block.successors()
+            if len(succs) != 1 or succs[0] == blocks[0].label:
+                break
+            succ = by_label[succs[0]]
+            if len(preds[succ.label]) != 1 or succ is block:
+                break
+            # phi nodes of the successor have a single incoming value now,
+            # remove_trivial_phis will replace them
+            block.instrs = block.instrs[:-1] + succ.instrs
+            merged.add(succ.label)
+            for label in succ.successors():
+                preds[label] = [
+                    block.label if pred == succ.label else pred
+                    for pred in preds[label]]
+                for instr in by_label[label].instrs:
+                    if instr.opcode == 'phi':
+                        instr.labels = [
+                            block.label if pred == succ.label else pred
+                            for pred in instr.labels]
+    return [block for block in blocks if block.label not in merged]
+
+
+def replace_values(blocks: List[Block], replacements: Dict[str, str]) \
+        -> None:
+    def resolve(value: str) -> str:
+        while value in replacements:
+            value = replacements[value]
+        return value
+
+    for block in blocks:
+        for instr in block.instrs:
+            instr.operands = [resolve(value) for value in instr.operands]
+
+
+# Replacing a phi may make phis using it trivial, they are checked again
+# through a worklist rather than by passes over the whole function, which
+# would be quadratic in the length of chains of phis (e.g. of a long `||`
+# condition).
+def remove_trivial_phis(blocks: List[Block]) -> None:
+    phis = [
+        instr for block in blocks for instr in block.instrs
+        if instr.opcode == 'phi']
+    users: Dict[str, List[Instr]] = {}
+    for phi in phis:
+        for value in phi.operands:
+            users.setdefault(value, []).append(phi)
+    replacements: Dict[str, str] = {}
+
+    def resolve(value: str) -> str:
+        while value in replacements:
+            value = replacements[value]
+        return value
+
+    worklist = phis[::-1]
+    while worklist:
+        phi = worklist.pop()
+        if phi.result in replacements:
+            continue
+        values = {resolve(value) for value in phi.operands} - {phi.result}
+        if len(values) == 1:
+            value = values.pop()
+            replacements[phi.result] = value
+            # phis using the result now use the value, and have to be
+            # checked again if it's replaced too
+            phi_users = users.pop(phi.result, [])
+            worklist += phi_users
+            users.setdefault(value, []).extend(phi_users)
+    if not replacements:
+        return
+    for block in blocks:
+        block.instrs = [
+            instr for instr in block.instrs
+            if instr.result not in replacements]
+    replace_values(blocks, replacements)
+
+
+# Instructions are removed with a worklist and counts of uses of values,
+# rather than by repeating passes over the function until nothing changes,
+# which is quadratic in the length of chains of dead instructions (e.g. phis
+# of a long unused `&&` expression).
+def remove_dead_instructions(blocks: List[Block]) -> None:
+    uses: Dict[str, int] = {}
+    definitions = {}
+    for block in blocks:
+        for instr in block.instrs:
+            for value in instr.operands:
+                uses[value] = uses.get(value, 0) + 1
+            if instr.result and not instr.has_side_effects():
+                definitions[instr.result] = instr
+    dead = [
+        result for result in definitions if uses.get(result, 0) == 0]
+    removed: Set[str] = set()
+    while dead:
+        result = dead.pop()
+        removed.add(result)
+        for value in definitions[result].operands:
+            uses[value] -= 1
+            if (uses[value] == 0 and value in definitions
+                    and value not in removed):
+                dead.append(value)
+    if removed:
+        for block in blocks:
+            block.instrs = [
+                instr for instr in block.instrs
+                if instr.result not in removed]
+
+
+def cleanup_function(fun: Function) -> None:
+    blocks = fun.blocks
+    drop_code_after_terminators(blocks)
+    hoist_allocas(blocks)
+    blocks = remove_unreachable_blocks(blocks)
+    blocks = merge_blocks(blocks)
+    remove_trivial_phis(blocks)
+    remove_dead_instructions(blocks)
+    fun.blocks = blocks
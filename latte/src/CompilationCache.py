@@ -0,0 +1,162 @@
+# pylint: disable=C0103, C0111, R1705
+
+# On-disk cache of compilation results. An entry is a directory named
+# by a hash of the source file, the options which affect the output,
+# the compiler sources (with the Latte.g4 grammar) and the compiled
+# runtime, and it contains copies of the output files (.ll or .s, .bc,
+# the native executable).
+#
+# Entries are evicted in LRU order (by directory mtime, updated on every
+# hit) when the total size of the cache exceeds max_size. Numbers of
+# hits, misses and evictions are kept in stats.json in the cache
+# directory. Updates of the cache are done under a lock file, so it can
+# be shared by compilers running in parallel.
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, Iterator, List
+
+DEFAULT_MAX_SIZE = 256 * 2**20  # bytes
+STATS_FILE = 'stats.json'
+LOCK_FILE = 'lock'
+
+# digests of compiler sources, by project directory
+compiler_digests: Dict[str, str] = {}
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2**16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compiler_source_paths(project_dir: str) -> Iterator[str]:
+    src_dir = os.path.join(project_dir, 'src')
+    for name in sorted(os.listdir(src_dir)):
+        if name.endswith('.py') or name == 'Latte.g4':
+            yield os.path.join(src_dir, name)
+    for name in ('runtime.bc', 'runtime.o'):
+        path = os.path.join(project_dir, 'lib', name)
+        if os.path.isfile(path):
+            yield path
+
+
+def compiler_digest(project_dir: str) -> str:
+    digest = compiler_digests.get(project_dir)
+    if digest is None:
+        digest = hashlib.sha256('\n'.join(
+            f'{os.path.basename(path)} {file_digest(path)}'
+            for path in compiler_source_paths(project_dir)).encode()) \
+            .hexdigest()
+        compiler_digests[project_dir] = digest
+    return digest
+
+
+def dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path))
+
+
+class CompilationCache:
+
+    def __init__(self, cache_dir: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+
+    def key(self, input_file: str, project_dir: str, options: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(compiler_digest(project_dir).encode())
+        digest.update(options.encode() + b'\0')
+        with open(input_file, 'rb') as f:
+            digest.update(f.read())
+        return digest.hexdigest()
+
+
+    # Copies cached outputs to out_paths (the same number of files
+    # in the same order as they were stored). Returns False on a miss.
+    def restore(self, key: str, out_paths: List[str]) -> bool:
+        entry_dir = os.path.join(self.cache_dir, key)
+        with self.locked():
+            hit = os.path.isdir(entry_dir)
+            if hit:
+                os.utime(entry_dir)
+                for i, out_path in enumerate(out_paths):
+                    shutil.copy(os.path.join(entry_dir, str(i)), out_path)
+            self.update_stats(hits=int(hit), misses=int(not hit))
+        return hit
+
+
+    def store(self, key: str, out_paths: List[str]) -> None:
+        entry_dir = os.path.join(self.cache_dir, key)
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp')
+        for i, out_path in enumerate(out_paths):
+            shutil.copy(out_path, os.path.join(tmp_dir, str(i)))
+        with self.locked():
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(tmp_dir)
+            else:
+                os.rename(tmp_dir, entry_dir)
+            self.evict()
+
+
+    def evict(self) -> None:
+        entries = [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir)
+            if os.path.isdir(os.path.join(self.cache_dir, name))
+            and not name.startswith('.')]
+        entries.sort(key=os.path.getmtime)
+        sizes = {entry: dir_size(entry) for entry in entries}
+        total_size = sum(sizes.values())
+        evictions = 0
+        # the most recently used entry is never evicted
+        for entry in entries[:-1]:
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(entry)
+            total_size -= sizes[entry]
+            evictions += 1
+        self.update_stats(evictions=evictions, size=total_size)
+
+
+    def stats(self) -> Dict[str, int]:
+        stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'size': 0}
+        try:
+            with open(os.path.join(self.cache_dir, STATS_FILE)) as f:
+                stats.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        return stats
+
+
+    # Must be called with the lock held.
+    def update_stats(
+            self, hits: int = 0, misses: int = 0, evictions: int = 0,
+            size: int = None) -> None:
+        stats = self.stats()
+        stats['hits'] += hits
+        stats['misses'] += misses
+        stats['evictions'] += evictions
+        if size is not None:
+            stats['size'] = size
+        stats_path = os.path.join(self.cache_dir, STATS_FILE)
+        with open(stats_path + '.tmp', 'w') as f:
+            json.dump(stats, f)
+        os.replace(stats_path + '.tmp', stats_path)
+
+
+    @contextlib.contextmanager
+    def locked(self) -> Iterator[None]:
+        with open(os.path.join(self.cache_dir, LOCK_FILE), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
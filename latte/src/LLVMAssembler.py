@@ -0,0 +1,170 @@
+# pylint: disable=C0103, C0111, R1705
+
+# Assembling of the generated .ll file to bitcode, linking it with
+# the runtime, optimizing the linked module and building a native
+# executable from it. When llvmlite is installed, it's done in-process
+# and the parsed runtime module is cached, so compiling many files
+# in one process reads it only once. Otherwise (or when in_process
+# is False) external llvm-as, llvm-link, opt and llc are used.
+#
+# The module is optimized after linking with the runtime, so that
+# runtime functions can be inlined into the user code. All functions
+# except main are internalized first, which lets the optimizer remove
+# the ones which are not used anymore.
+#
+# Linking with the runtime can be skipped (runtime_path None): the bitcode
+# then only declares the runtime functions and is run with
+# `lli -extra-module=lib/runtime.bc`, and the native executable is linked
+# with the precompiled lib/runtime.o by `cc`.
+#
+# External tools are run by run_tool, also used by the x86-64 backend.
+
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+try:
+    import llvmlite.binding as llvm
+except ImportError:
+    llvm = None
+
+
+# exit codes of the compiler
+ASSEMBLY_FAILED = 3
+LINKING_FAILED = 4
+
+# the same thresholds as used by opt for these levels
+INLINING_THRESHOLDS = {1: 225, 2: 225, 3: 250}
+
+runtime_modules: Dict[str, 'llvm.ModuleRef'] = {}
+native_target_initialized = False
+
+
+# Runs an external tool with the arguments (args[0] is the tool). Its output
+# is printed like the output of the compiler, so that in batch mode it's
+# captured with the output of the file. Returns whether it succeeded.
+def run_tool(args: List[str]) -> bool:
+    ps = subprocess.run(
+        args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    sys.stdout.write(ps.stdout)
+    sys.stderr.write(ps.stderr)
+    if ps.returncode != 0:
+        print(f'{args[0]} exited with code {ps.returncode}', file=sys.stderr)
+    return ps.returncode == 0
+
+
+def get_runtime_module(runtime_path: str) -> 'llvm.ModuleRef':
+    module = runtime_modules.get(runtime_path)
+    if module is None:
+        with open(runtime_path, 'rb') as f:
+            module = llvm.parse_bitcode(f.read())
+        runtime_modules[runtime_path] = module
+    return module
+
+
+def optimize_module(module: 'llvm.ModuleRef', opt_level: int) -> None:
+    for fun in module.functions:
+        if not fun.is_declaration and fun.name != 'main':
+            fun.linkage = 'internal'
+    pm_builder = llvm.create_pass_manager_builder()
+    pm_builder.opt_level = opt_level
+    pm_builder.inlining_threshold = INLINING_THRESHOLDS[opt_level]
+    pass_manager = llvm.create_module_pass_manager()
+    pm_builder.populate(pass_manager)
+    pass_manager.run(module)
+
+
+def build_in_process(
+        ll_path: str, runtime_path: Optional[str], bc_path: str,
+        opt_level: int) -> int:
+    with open(ll_path) as f:
+        ir = f.read()
+    try:
+        module = llvm.parse_assembly(ir)
+        module.verify()
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return ASSEMBLY_FAILED
+    if runtime_path is not None:
+        try:
+            module.link_in(get_runtime_module(runtime_path), preserve=True)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            return LINKING_FAILED
+    if opt_level > 0:
+        optimize_module(module, opt_level)
+    with open(bc_path, 'wb') as f:
+        f.write(module.as_bitcode())
+    return 0
+
+
+def build_with_tools(
+        ll_path: str, runtime_path: Optional[str], bc_path: str,
+        opt_level: int) -> int:
+    if runtime_path is None:
+        if not run_tool(['llvm-as', '-o', bc_path, ll_path]):
+            return ASSEMBLY_FAILED
+    else:
+        bc_no_runtime_path = bc_path[:-3] + '_no_runtime.bc'
+        if not run_tool(['llvm-as', '-o', bc_no_runtime_path, ll_path]):
+            return ASSEMBLY_FAILED
+        print(f'Compiled to {bc_no_runtime_path}')
+        if not run_tool([
+                'llvm-link', '-o', bc_path, bc_no_runtime_path,
+                runtime_path]):
+            return LINKING_FAILED
+        os.remove(bc_no_runtime_path)
+    if opt_level > 0 and not run_tool([
+            'opt', '-internalize', '-internalize-public-api-list=main',
+            f'-O{opt_level}', '-o', bc_path, bc_path]):
+        return LINKING_FAILED
+    return 0
+
+
+# Returns 0 on success or the exit code of the compiler on failure.
+def build_bitcode(
+        ll_path: str, runtime_path: Optional[str], bc_path: str,
+        opt_level: int = 0, in_process: bool = True) -> int:
+    if in_process and llvm is not None:
+        return build_in_process(ll_path, runtime_path, bc_path, opt_level)
+    return build_with_tools(ll_path, runtime_path, bc_path, opt_level)
+
+
+def initialize_native_target() -> None:
+    global native_target_initialized
+    if not native_target_initialized:
+        llvm.initialize()
+        llvm.initialize_native_target()
+        llvm.initialize_native_asmprinter()
+        native_target_initialized = True
+
+
+# Builds a native executable from the bitcode linked with the runtime,
+# or from the bitcode without the runtime and the runtime's object file.
+# The object file is produced by LLVM and linked with libc by `cc`.
+def build_executable(
+        bc_path: str, exe_path: str, opt_level: int = 0,
+        in_process: bool = True,
+        runtime_obj_path: Optional[str] = None) -> int:
+    obj_path = exe_path + '.o'
+    if in_process and llvm is not None:
+        initialize_native_target()
+        with open(bc_path, 'rb') as f:
+            module = llvm.parse_bitcode(f.read())
+        target_machine = llvm.Target.from_default_triple() \
+            .create_target_machine(opt=opt_level, reloc='pic')
+        with open(obj_path, 'wb') as f:
+            f.write(target_machine.emit_object(module))
+    elif not run_tool([
+            'llc', f'-O{opt_level}', '-relocation-model=pic',
+            '-filetype=obj', '-o', obj_path, bc_path]):
+        return LINKING_FAILED
+    cc_args = ['cc', '-o', exe_path, obj_path]
+    if runtime_obj_path is not None:
+        cc_args.append(runtime_obj_path)
+    if not run_tool(cc_args):
+        return LINKING_FAILED
+    os.remove(obj_path)
+    return 0
@@ -1,87 +1,144 @@
 # pylint: disable=C0103, C0111, R1705
 
+import contextlib
 import sys
-from typing import Dict, List, Set, Tuple, Union
-
-import antlr4
-from antlr_generated.LatteParser import LatteParser
-
-
-def compilation_error(ctx: antlr4.ParserRuleContext, msg: str) -> None:
-    line = ctx.start.line
-    code = ctx.start.getInputStream().getText(
-        ctx.start.start, ctx.stop.stop)
-    code = code.split('\n')[0]
-    print('ERROR', file=sys.stderr)
-    print(f'Compilation error in line {line}:')
-    print(code)
-    print(f'{msg}.')
-    sys.exit(2)
-
-
-def type_as_str(lattype: LatteParser.LattypeContext) -> str:
-    if isinstance(lattype, LatteParser.TypeIntContext):
-        return 'int'
-    elif isinstance(lattype, LatteParser.TypeStrContext):
-        return 'string'
-    elif isinstance(lattype, LatteParser.TypeBoolContext):
-        return 'boolean'
-    elif isinstance(lattype, LatteParser.TypeVoidContext):
-        return 'void'
+from typing import Dict, Generator, Iterator, List, Set, Tuple, Union
+
+from CFGCleanup import cleanup_function
+import LatteAST as ast
+from LLVMIR import Block, Function, Instr, LLWriter, str_const_pointer
+
+
+LLVM_TYPES = {
+    'int': 'i32',
+    'string': 'i8*',
+    'boolean': 'i1',
+    'void': 'void',
+}
 
 
 def type_str_as_llvm(type_str: str) -> str:
-    BASIC_TYPES = {
-        'int': 'i32',
-        'string': 'i8*',
-        'boolean': 'i1',
-        'void': 'void',
-    }
-    if type_str in BASIC_TYPES:
-        return BASIC_TYPES[type_str]
-    elif type_str.endswith('[]'):
-        raise NotImplementedError('Latte extension')
-    else:
+    llvm_type = LLVM_TYPES.get(type_str)
+    if llvm_type is None:
         raise NotImplementedError('Latte extension')
+    return llvm_type
 
 
-def type_as_llvm(lattype: LatteParser.LattypeContext) -> str:
-    if isinstance(lattype, LatteParser.TypeIntContext):
-        return 'i32'
-    elif isinstance(lattype, LatteParser.TypeStrContext):
-        return 'i8*'
-    elif isinstance(lattype, LatteParser.TypeBoolContext):
-        return 'i1'
-    elif isinstance(lattype, LatteParser.TypeVoidContext):
-        return 'void'
+# operator: (LLVM instruction, icmp predicate, accepted argument types,
+# result type); for strings, `+` and comparisons call runtime functions
+BINARY_OPS = {
+    '<': ('icmp', 'slt', ('int', 'boolean', 'string'), 'boolean'),
+    '<=': ('icmp', 'sle', ('int', 'boolean', 'string'), 'boolean'),
+    '>': ('icmp', 'sgt', ('int', 'boolean', 'string'), 'boolean'),
+    '>=': ('icmp', 'sge', ('int', 'boolean', 'string'), 'boolean'),
+    '==': ('icmp', 'eq', ('int', 'boolean', 'string'), 'boolean'),
+    '!=': ('icmp', 'ne', ('int', 'boolean', 'string'), 'boolean'),
+    '+': ('add', '', ('int', 'string'), 'int'),
+    '-': ('sub', '', ('int',), 'int'),
+    '*': ('mul', '', ('int',), 'int'),
+    '/': ('sdiv', '', ('int',), 'int'),
+    '%': ('srem', '', ('int',), 'int'),
+}
+
+
+### Constant folding
+
+# Constants are kept as Python values: int for int, bool for boolean and str
+# (the literal as written in the source) for string. Folding has to give
+# the same results as the LLVM instructions emitted otherwise.
+
+INT_BITS = 32
+
+
+def wrap_int(value: int) -> int:
+    half = 1 << (INT_BITS - 1)
+    return (value + half) % (1 << INT_BITS) - half
+
+
+# Value of a constant as seen by icmp, which compares i1 as signed too.
+def signed_value(const: Union[int, bool]) -> int:
+    if isinstance(const, bool):
+        return -1 if const else 0
+    return const
+
+
+# Strings are compared with memcmp and concatenated byte by byte at run time,
+# which only matches Python semantics for plain ASCII literals. Literals with
+# escape sequences are not folded, since joining them could change
+# the meaning of an escape.
+def foldable_str(const: str) -> bool:
+    return all(ord(c) < 128 for c in const) and '\\' not in const
+
+
+def fold_binary_op(op: str, left, right) -> Union[int, bool, str, None]:
+    if isinstance(left, str):
+        if not (foldable_str(left) and foldable_str(right)):
+            return None
+        if op == '+':
+            return left + right
+        left, right = (left > right) - (left < right), 0
+    else:
+        left, right = signed_value(left), signed_value(right)
+
+    if op == '+':
+        return wrap_int(left + right)
+    elif op == '-':
+        return wrap_int(left - right)
+    elif op == '*':
+        return wrap_int(left * right)
+    elif op in ('/', '%'):
+        # sdiv and srem are undefined for these, leave them to run time
+        if right == 0 or (left == -(1 << (INT_BITS - 1)) and right == -1):
+            return None
+        quotient = abs(left) // abs(right)
+        if (left < 0) != (right < 0):
+            quotient = -quotient
+        if op == '/':
+            return wrap_int(quotient)
+        return wrap_int(left - right * quotient)
+    return {
+        '<': left < right,
+        '<=': left <= right,
+        '>': left > right,
+        '>=': left >= right,
+        '==': left == right,
+        '!=': left != right,
+    }[op]
 
 
 # Used for variables or values returned from expressions.
 class LatValue:
 
     def __init__(
-            self, str_type: str, value: str = '',
-            name: str = '', finish_label: str = ''):
+            self, str_type: str, value: str = '', name: str = '',
+            const: Union[int, bool, str, None] = None):
         self.str_type = str_type  # 'int', 'boolean', etc.; not 'i32'
-        self.value = value  # might be a constant or a register
+        # might be a constant or a register; for variables it's the register
+        # holding the current value in SSA mode or the pointer returned by
+        # alloca in alloca mode (unless the variable is a constant)
+        self.value = value
         self.name = name  # variable name if it's a variable
-        # some expressions produce labels when evaluating, this is the label
-        # of the block in which the final result is assigned to a register
-        self.finish_label = finish_label
+        # value known at compile time, None if unknown
+        self.const = const
 
     def llvm_type(self):
         return type_str_as_llvm(self.str_type)  # 'i32', 'i1', etc.
 
 
+# visited by LLVMCompiler.visit_exp without generators
+ARITHMETIC_EXPS = frozenset((ast.ExpRel, ast.ExpAdd, ast.ExpMul))
+
+# Visitor of an expression with subexpressions, see LLVMCompiler.visit_exp.
+ExpVisitor = Generator[ast.Exp, LatValue, LatValue]
+
+
 class LatFunSignature:
 
     def __init__(
-            self, ret_type: str, arg_types: List[str],
-            name: str = '', code: str = ''):
+            self, ret_type: str, arg_types: List[str], name: str = ''):
         self.ret_type = ret_type
         self.arg_types = arg_types
         self.name = name
-        self.code = code
 
     def __str__(self):
         args = ', '.join(self.arg_types)
@@ -95,13 +152,26 @@ class LLVMCompiler:
 
     ### Constructor
 
-    def __init__(self):
+    # With ssa=True (the default) local variables live in registers and
+    # phi nodes are emitted at join points, otherwise every local gets
+    # an alloca and is accessed with load/store.
+    def __init__(self, ssa: bool = True):
+        self.ssa = ssa
+        self.source = ''
         self.used_functions: Set[str] = set()
-        self.current_function_code: List[str] = []
+        self.writer: Union[LLWriter, None] = None
+        self.current_function = Function('', '', [])
+        # the basic block to which code is currently appended
+        self.current_block = Block('entry')
+        # labels of blocks started right after `unreachable`, values of
+        # variables at their ends don't matter for phi nodes
+        self.dead_labels: Set[str] = set()
+        self.assigned_names: Set[str] = set()
         self.next_reg_index = 0
         self.next_label_index = 0
         self.tree_depth = -1
-        self.str_consts: Dict[str, str] = {}
+        self.str_consts: Dict[str, str] = {}  # global name: literal
+        self.str_const_names: Dict[str, str] = {}  # literal: global name
         self.builtin_functions: Set[str] = set()
         self.expected_ret_type: Union[str, None] = None
         self.var_envs: List[Dict[str, LatValue]] = []
@@ -111,7 +181,8 @@ class LLVMCompiler:
             'error': LatFunSignature('void', []),
             'readInt': LatFunSignature('int', []),
             'readString': LatFunSignature('string', []),
-            'strcmp': LatFunSignature('int', ['string', 'string']),
+            'strcompare': LatFunSignature('int', ['string', 'string']),
+            'strequal': LatFunSignature('int', ['string', 'string']),
             'strconcat': LatFunSignature('string', ['string', 'string']),
         }
         for fun in self.functions:
@@ -121,56 +192,99 @@ class LLVMCompiler:
 
     ### Utils
 
+    # Reports an error in the code of the given node and exits.
+    def compilation_error(self, node: ast.Node, msg: str) -> None:
+        code = self.source[node.start:node.stop + 1].split('\n')[0]
+        print('ERROR', file=sys.stderr)
+        print(f'Compilation error in line {node.line}:')
+        print(code)
+        print(f'{msg}.')
+        sys.exit(2)
+
+
     def get_new_register(self) -> str:
         reg = self.next_reg_index
         self.next_reg_index += 1
         return f'%.t{reg}'
 
 
+    def emit(self, instr: Instr) -> str:
+        self.current_block.instrs.append(instr)
+        return instr.result
+
+
+    # Emits an instruction which produces a value in a new register
+    # and returns the register.
+    def emit_value(self, opcode: str, type_: str, *operands: str, **kwargs) \
+            -> str:
+        return self.emit(Instr(
+            opcode, self.get_new_register(), type_, list(operands), **kwargs))
+
+
+    @property
+    def current_label(self) -> str:
+        return self.current_block.label
+
+
+    # Each literal is one global, so all its uses (also the default value
+    # "" of declared strings) share it; the pointer to it is a constant
+    # expression, used directly as an operand.
     def get_str_const(self, str_val: str) -> LatValue:
-        exists = False
-        for name, val in self.str_consts.items():
-            if val == str_val:
-                exists = True
-                break
-        if not exists:
+        name = self.str_const_names.get(str_val)
+        if name is None:
             name = '@.str{id}'.format(id=len(self.str_consts))
             self.str_consts[name] = str_val
-        str_len = len(str_val) + 1
-        reg = self.get_new_register()
-        self.current_function_code.append(
-            f'{reg} = getelementptr [{str_len} x i8], '
-            f'[{str_len} x i8]* {name}, i32 0, i32 0')
-        return LatValue('string', reg)
+            self.str_const_names[str_val] = name
+        return LatValue('string', str_const_pointer(name), const=str_val)
 
 
+    def get_const(self, str_type: str, const: Union[int, bool, str]) \
+            -> LatValue:
+        if str_type == 'string':
+            return self.get_str_const(const)
+        return LatValue(str_type, str(int(const)), const=const)
+
+
+    # In alloca mode variables with a constant initial value which are never
+    # assigned to in the function don't need memory, they are used like
+    # the constant itself.
     def declare_variable(
-            self, ctx: antlr4.ParserRuleContext, var: LatValue) -> None:
+            self, node: ast.Node, var: LatValue, val: LatValue) -> None:
         if var.name in self.var_envs[-1]:
-            compilation_error(ctx, f'Variable {var.name} already declared')
-        var.value = self.get_new_register()
-        llvm_type = var.llvm_type()
-        self.current_function_code.append(f'{var.value} = alloca {llvm_type}')
+            self.compilation_error(
+                node, f'Variable {var.name} already declared')
         self.var_envs[-1][var.name] = var
+        if self.ssa or (val.const is not None
+                        and var.name not in self.assigned_names):
+            var.value, var.const = val.value, val.const
+            return
+        var.value = self.emit_value('alloca', var.llvm_type())
+        self.assign_variable(var, val)
 
 
-    def get_variable(self, ctx: antlr4.ParserRuleContext, var_name: str) \
-            -> LatValue:
+    def assign_variable(self, var: LatValue, val: LatValue) -> None:
+        if self.ssa:
+            var.value, var.const = val.value, val.const
+        else:
+            self.emit(Instr(
+                'store', type_=var.llvm_type(),
+                operands=[val.value, var.value]))
+
+
+    def get_variable(self, node: ast.Node, var_name: str) -> LatValue:
         for var_env in reversed(self.var_envs):
             if var_name in var_env:
                 return var_env[var_name]
-        compilation_error(ctx, f'Variable {var_name} was not declared')
+        self.compilation_error(node, f'Variable {var_name} was not declared')
 
 
     # Returns (variable, loaded value of variable)
-    def load_variable(
-            self, ctx: antlr4.ParserRuleContext, var_name: str) \
+    def load_variable(self, node: ast.Node, var_name: str) \
             -> Tuple[LatValue, LatValue]:
-        var = self.get_variable(ctx, var_name)
-        reg = self.get_new_register()
-        llvm_type = var.llvm_type()
-        self.current_function_code.append(
-            f'{reg} = load {llvm_type}, {llvm_type}* {var.value}')
+        var = self.get_variable(node, var_name)
+        if self.ssa or var.const is not None:
+            return (var, LatValue(var.str_type, var.value, const=var.const))
+        reg = self.emit_value('load', var.llvm_type(), var.value)
         return (var, LatValue(var.str_type, reg))
 
 
@@ -180,113 +294,189 @@ class LLVMCompiler:
         return f'L{ind}'
 
 
-    def declare_function(self, ctx: LatteParser.TopDefFunContext) -> None:
-        fun_name = ctx.IDENT().getText()
+    def start_block(self, label: str) -> None:
+        self.current_block = Block(label)
+        self.current_function.blocks.append(self.current_block)
+
+
+    def emit_br(self, label: str) -> None:
+        self.emit(Instr('br', labels=[label]))
+
+
+    def emit_cond_br(self, cond: str, label_true: str, label_false: str) \
+            -> None:
+        self.emit(Instr(
+            'br', operands=[cond], labels=[label_true, label_false]))
+
+
+    # Code which is never executed, e.g. a branch of an if with a constant
+    # condition, is still visited to report compilation errors in it,
+    # but the generated code is thrown away.
+    @contextlib.contextmanager
+    def discarded_code(self) -> Iterator[None]:
+        function = self.current_function
+        current_block = self.current_block
+        variables = self.visible_variables()
+        states = [(var.value, var.const) for var in variables]
+        self.current_function = Function('', '', [])
+        self.current_block = Block('')
+        yield
+        self.current_function = function
+        self.current_block = current_block
+        for var, (value, const) in zip(variables, states):
+            var.value, var.const = value, const
+
+
+    # Names of all variables assigned to in a function, used in alloca mode
+    # to find variables that never change.
+    @staticmethod
+    def find_assigned_names(node: ast.TopDefFun) -> Set[str]:
+        names = set()
+        stmts = list(node.block.stmts)
+        while stmts:
+            stmt = stmts.pop()
+            if isinstance(stmt, (ast.StmtAss, ast.StmtIncrDecr)):
+                names.add(stmt.name)
+            elif isinstance(stmt, ast.StmtBlock):
+                stmts += stmt.block.stmts
+            elif isinstance(stmt, ast.StmtIfElse):
+                stmts += [stmt.stmt, stmt.else_stmt]
+            elif isinstance(stmt, ast.CondStmt):
+                stmts.append(stmt.stmt)
+        return names
+
+
+    # All variables visible at this point, they are the only ones that can
+    # need a phi node when control flow joins.
+    def visible_variables(self) -> List[LatValue]:
+        return [var for var_env in self.var_envs for var in var_env.values()]
+
+
+    # Returns the variables declared outside of the statement that may be
+    # assigned inside it. Declarations inside the statement are tracked the
+    # same way visit_block does it, so shadowed variables are skipped.
+    def assigned_variables(self, node: ast.Stmt) -> List[LatValue]:
+        assigned: Dict[int, LatValue] = {}
+        local_envs: List[Set[str]] = [set()]
+
+        def visit(stmt: ast.Stmt) -> None:
+            if isinstance(stmt, ast.StmtBlock):
+                local_envs.append(set())
+                for block_stmt in stmt.block.stmts:
+                    visit(block_stmt)
+                local_envs.pop()
+            elif isinstance(stmt, ast.StmtDecl):
+                for item in stmt.items:
+                    local_envs[-1].add(item.name)
+            elif isinstance(stmt, (ast.StmtAss, ast.StmtIncrDecr)):
+                var_name = stmt.name
+                if any(var_name in env for env in local_envs):
+                    return
+                for var_env in reversed(self.var_envs):
+                    if var_name in var_env:
+                        var = var_env[var_name]
+                        assigned[id(var)] = var
+                        break
+            elif isinstance(stmt, ast.StmtIfElse):
+                visit(stmt.stmt)
+                visit(stmt.else_stmt)
+            elif isinstance(stmt, ast.CondStmt):
+                visit(stmt.stmt)
+
+        visit(node)
+        return list(assigned.values())
+
+
+    def declare_function(self, node: ast.TopDefFun) -> None:
+        fun_name = node.name
         if fun_name in self.functions:
-            compilation_error(
-                ctx, f'Multiple declarations of function {fun_name}')
-        ret_type = type_as_str(ctx.lattype())
+            self.compilation_error(
+                node, f'Multiple declarations of function {fun_name}')
+        ret_type = node.ret_type
         if fun_name == 'main' and ret_type != 'int':
-            compilation_error(ctx, 'Function main has to return int')
-        arg_types = [type_as_str(arg.lattype()) for arg in ctx.arg()]
+            self.compilation_error(node, 'Function main has to return int')
+        arg_types = [arg.type for arg in node.args]
         if fun_name == 'main' and arg_types:
-            compilation_error(ctx, 'Function main can not take arguments')
+            self.compilation_error(
+                node, 'Function main can not take arguments')
         self.functions[fun_name] = LatFunSignature(
             ret_type, arg_types, name=fun_name)
 
 
     ### Program visitor
 
-    def visit_prog(self, ctx: LatteParser.ProgramContext) -> str:
-        for child in ctx.children:
-            if isinstance(child, LatteParser.TopDefFunContext):
-                self.declare_function(child)
+    # Each function is passed to the writer (LLWriter or X86Writer) as soon
+    # as it is compiled, string constants and declarations of used builtin
+    # functions are passed at the end.
+    def visit_prog(self, node: ast.Program, writer: LLWriter) -> None:
+        self.writer = writer
+        self.source = node.source
+        for topdef in node.topdefs:
+            self.declare_function(topdef)
 
-        for child in ctx.children:
-            if isinstance(child, LatteParser.TopDefFunContext):
-                self.visit_topdef_fun(child)
+        for topdef in node.topdefs:
+            self.visit_topdef_fun(topdef)
 
         if 'main' not in self.functions:
-            compilation_error(ctx, 'Function `int main()` was not declared')
+            self.compilation_error(
+                node, 'Function `int main()` was not declared')
 
-        code = ''
-        for fun_name in self.builtin_functions:
-            if fun_name not in self.used_functions:
-                continue
+        declarations = []
+        for fun_name in sorted(self.used_functions & self.builtin_functions):
             fun = self.functions[fun_name]
-            llvm_ret_type = fun.llvm_ret_type()
-            args = ', '.join(type_str_as_llvm(arg) for arg in fun.arg_types)
-            code += f'declare {llvm_ret_type} @{fun_name}({args})\n'
-        code += '\n'
-        for name, val in self.str_consts.items():
-            str_len = len(val) + 1
-            code += \
-                f'{name} = internal constant [{str_len} x i8] c"{val}\\00"\n'
-        if self.str_consts:
-            code += '\n\n'
-        for name, fun in self.functions.items():
-            if name in self.builtin_functions:
-                continue
-            code += fun.code + '\n\n'
-        return code.strip() + '\n'
+            args = [(type_str_as_llvm(arg), '') for arg in fun.arg_types]
+            declarations.append(
+                Function(fun_name, fun.llvm_ret_type(), args))
+        writer.write_globals(self.str_consts, declarations)
 
 
     ### Function definition visitor
 
-    def visit_topdef_fun(self, ctx: LatteParser.TopDefFunContext) -> None:
-        llvm_ret_type = type_as_llvm(ctx.lattype())
-        fun_name = ctx.IDENT().getText()
+    def visit_topdef_fun(self, node: ast.TopDefFun) -> None:
+        llvm_ret_type = type_str_as_llvm(node.ret_type)
+        fun_name = node.name
         llvm_args = []
         self.var_envs.append({})
         self.next_reg_index = 0
         self.next_label_index = 0
-        self.current_function_code = []
-        self.expected_ret_type = type_as_str(ctx.lattype())
-
-        for arg in ctx.arg():
-            arg_name = arg.IDENT().getText()
-            arg_type = type_as_str(arg.lattype())
-            arg_llvm_type = type_as_llvm(arg.lattype())
-            llvm_args.append(f'{arg_llvm_type} %{arg_name}')
+        self.current_function = Function(fun_name, llvm_ret_type, llvm_args)
+        self.start_block('entry')
+        self.dead_labels = set()
+        self.expected_ret_type = node.ret_type
+        self.assigned_names = self.find_assigned_names(node)
+
+        for arg in node.args:
+            arg_name = arg.name
+            arg_type = arg.type
+            arg_llvm_type = type_str_as_llvm(arg.type)
+            llvm_args.append((arg_llvm_type, f'%{arg_name}'))
             var = LatValue(arg_type, name=arg_name)
-            self.declare_variable(ctx, var)
-            self.current_function_code.append(
-                f'store {arg_llvm_type} %{arg_name}, '
-                f'{arg_llvm_type}* {var.value}')
-        llvm_args_str = ', '.join(llvm_args)
-        fun_def = f'define {llvm_ret_type} @{fun_name}({llvm_args_str})'
-
-        returned = self.visit_block(ctx.block(), make_env=False)
+            self.declare_variable(
+                node, var, LatValue(arg_type, f'%{arg_name}'))
+
+        returned = self.visit_block(node.block, make_env=False)
         if not returned:
             if self.expected_ret_type == 'void':
-                self.current_function_code.append('ret void')
+                self.emit(Instr('ret', type_='void'))
             else:
-                compilation_error(
-                    ctx, 'Function can finish before returning a value')
+                self.compilation_error(
+                    node, 'Function can finish before returning a value')
         self.var_envs.pop()
 
-        code = self.current_function_code
-        fun_block_code = 'entry:\n'
-        for line in code:
-            if not line.endswith(':'):
-                fun_block_code += ' ' * 4
-            fun_block_code += line + '\n'
-        code_str = f'{fun_def} {{\n{fun_block_code}}}'
-        self.functions[fun_name].code = code_str
-        self.current_function_code = []
+        cleanup_function(self.current_function)
+        self.writer.write_function(self.current_function)
 
 
     ### Block/statements visitors
 
     # Visiting blocks and statements returns the type returned in a return
     # statement inside it or None if nothing is guaranteed to be returned.
-    def visit_block(
-            self, ctx: LatteParser.BlockContext,
-            make_env: bool = True) -> Union[str, None]:
+    def visit_block(self, node: ast.Block, make_env: bool = True) \
+            -> Union[str, None]:
         if make_env:
             self.var_envs.append(dict())
         returned_type = None
-        for stmt in ctx.stmt():
+        for stmt in node.stmts:
             returned_type = self.visit_stmt(stmt)
             if returned_type:
                 break
@@ -295,359 +485,505 @@ class LLVMCompiler:
         return returned_type
 
 
-    def visit_stmt(self, ctx: LatteParser.StmtContext) -> Union[str, None]:
-        if isinstance(ctx, LatteParser.StmtEmptyContext):
-            return None
+    def visit_stmt(self, node: ast.Stmt) -> Union[str, None]:
+        return self.STMT_VISITORS[type(node)](self, node)
 
-        elif isinstance(ctx, LatteParser.StmtBlockContext):
-            return self.visit_block(ctx.block())
 
-        elif isinstance(ctx, LatteParser.StmtDeclContext):
-            self.visit_stmt_decl(ctx)
-            return None
+    def visit_stmt_empty(self, node: ast.StmtEmpty) -> None:
+        pass
 
-        elif isinstance(ctx, LatteParser.StmtAssContext):
-            var = self.get_variable(ctx, ctx.IDENT().getText())
-            val = self.visit_exp(ctx.exp())
-            if var.str_type != val.str_type:
-                compilation_error(
-                    ctx, f'Variable {var.name} has type {var.str_type}, '
-                    f'but the value has type {val.str_type}')
-            llvm_type = var.llvm_type()
-            self.current_function_code.append(
-                f'store {llvm_type} {val.value}, {llvm_type}* {var.value}')
-            return None
 
-        elif isinstance(ctx, (
-                LatteParser.StmtIncrContext, LatteParser.StmtDecrContext)):
-            if isinstance(ctx, LatteParser.StmtIncrContext):
-                op, llvm_op = '++', 'add'
-            else:
-                op, llvm_op = '--', 'sub'
-            var, var_val = self.load_variable(ctx, ctx.IDENT().getText())
-            if var_val.str_type != 'int':
-                compilation_error(
-                    ctx, f'Argument to `{op}` has to be int, '
-                    f'but {var.name} is {var_val.str_type}')
-            reg = self.get_new_register()
-            self.current_function_code += [
-                f'{reg} = {llvm_op} i32 {var_val.value}, 1',
-                f'store i32 {reg}, i32* {var.value}'
-            ]
-            return None
+    def visit_stmt_block(self, node: ast.StmtBlock) -> Union[str, None]:
+        return self.visit_block(node.block)
 
-        elif isinstance(ctx, LatteParser.StmtRetValContext):
-            val = self.visit_exp(ctx.exp())
-            if val.str_type != self.expected_ret_type:
-                compilation_error(
-                    ctx, f'This function returns {self.expected_ret_type}, '
-                    f'but value is {val.str_type}')
-            llvm_type = val.llvm_type()
-            self.current_function_code.append(
-                f'ret {llvm_type} {val.value}')
-            return val.str_type
-
-        elif isinstance(ctx, LatteParser.StmtRetVoidContext):
-            if self.expected_ret_type != 'void':
-                compilation_error(
-                    ctx, 'This function returns non-void type '
-                    f'{self.expected_ret_type}')
-            self.current_function_code.append('ret void')
-            return 'void'
-
-        elif isinstance(ctx, (
-                LatteParser.StmtIfNoElseContext,
-                LatteParser.StmtIfElseContext)):
-            return self.visit_stmt_if(ctx)
-
-        elif isinstance(ctx, LatteParser.StmtWhileContext):
-            return self.visit_stmt_while(ctx)
-
-        elif isinstance(ctx, LatteParser.StmtExpContext):
-            self.visit_exp(ctx.exp())
-            return None
 
+    def visit_stmt_ass(self, node: ast.StmtAss) -> None:
+        var = self.get_variable(node, node.name)
+        val = self.visit_exp(node.exp)
+        if var.str_type != val.str_type:
+            self.compilation_error(
+                node, f'Variable {var.name} has type {var.str_type}, '
+                f'but the value has type {val.str_type}')
+        self.assign_variable(var, val)
 
-    def visit_stmt_decl(self, ctx: LatteParser.StmtDeclContext) \
-            -> Union[str, None]:
-        str_type = type_as_str(ctx.lattype())
+
+    def visit_stmt_incr_decr(self, node: ast.StmtIncrDecr) -> None:
+        if isinstance(node, ast.StmtIncr):
+            op, llvm_op = '++', 'add'
+        else:
+            op, llvm_op = '--', 'sub'
+        var, var_val = self.load_variable(node, node.name)
+        if var_val.str_type != 'int':
+            self.compilation_error(
+                node, f'Argument to `{op}` has to be int, '
+                f'but {var.name} is {var_val.str_type}')
+        if var_val.const is not None:
+            self.assign_variable(var, self.get_const(
+                'int', fold_binary_op(op[0], var_val.const, 1)))
+            return
+        reg = self.emit_value(llvm_op, 'i32', var_val.value, '1')
+        self.assign_variable(var, LatValue('int', reg))
+
+
+    def visit_stmt_ret_val(self, node: ast.StmtRetVal) -> str:
+        val = self.visit_exp(node.exp)
+        if val.str_type != self.expected_ret_type:
+            self.compilation_error(
+                node, f'This function returns {self.expected_ret_type}, '
+                f'but value is {val.str_type}')
+        self.emit(Instr(
+            'ret', type_=val.llvm_type(), operands=[val.value]))
+        return val.str_type
+
+
+    def visit_stmt_ret_void(self, node: ast.StmtRetVoid) -> str:
+        if self.expected_ret_type != 'void':
+            self.compilation_error(
+                node, 'This function returns non-void type '
+                f'{self.expected_ret_type}')
+        self.emit(Instr('ret', type_='void'))
+        return 'void'
+
+
+    def visit_stmt_exp(self, node: ast.StmtExp) -> None:
+        self.visit_exp(node.exp)
+
+
+    def visit_stmt_decl(self, node: ast.StmtDecl) -> None:
+        str_type = node.type
         if str_type == 'void':
-            compilation_error(ctx, 'Cannot declare void variables')
-        llvm_type = type_as_llvm(ctx.lattype())
-        for item in ctx.item():
-            if isinstance(item, LatteParser.ItemInitContext):
-                val = self.visit_exp(item.exp())
-            elif str_type in ('int', 'boolean'):
-                val = LatValue(str_type, '0')
+            self.compilation_error(node, 'Cannot declare void variables')
+        for item in node.items:
+            if item.exp is not None:
+                val = self.visit_exp(item.exp)
+            elif str_type == 'int':
+                val = self.get_const('int', 0)
+            elif str_type == 'boolean':
+                val = self.get_const('boolean', False)
             elif str_type == 'string':
                 val = self.get_str_const('')
 
-            var = LatValue(str_type, name=item.IDENT().getText())
-            self.declare_variable(ctx, var)
-
+            var = LatValue(str_type, name=item.name)
             if val.str_type != var.str_type:
-                compilation_error(
-                    ctx, f'Variable {var.name} has type {var.str_type}, '
+                self.compilation_error(
+                    node, f'Variable {var.name} has type {var.str_type}, '
                     f'but the value has type {val.str_type}')
-            self.current_function_code.append(
-                f'store {llvm_type} {val.value}, {llvm_type}* {var.value}')
+            self.declare_variable(node, var, val)
 
 
-    def visit_stmt_if(self, ctx: LatteParser.StmtContext) -> Union[str, None]:
-        has_else = isinstance(ctx, LatteParser.StmtIfElseContext)
-        cond = self.visit_exp(ctx.exp())
-        true_stmt_ctx = ctx.stmt(0) if has_else else ctx.stmt()
+    def visit_stmt_if(self, node: ast.CondStmt) -> Union[str, None]:
+        has_else = isinstance(node, ast.StmtIfElse)
+        cond = self.visit_exp(node.exp)
+        true_stmt = node.stmt
+        false_stmt = node.else_stmt if has_else else None
         if cond.str_type != 'boolean':
-            compilation_error(
-                ctx, f'Condition of if has to be boolean, is {cond.str_type}')
+            self.compilation_error(
+                node, f'Condition of if has to be boolean, is {cond.str_type}')
 
-        if cond.value == '1':
-            return self.visit_stmt(true_stmt_ctx)
-        elif cond.value == '0' and has_else:
-            return self.visit_stmt(ctx.stmt(1))
+        if cond.const is not None:
+            if cond.const:
+                taken, skipped = true_stmt, false_stmt
+            else:
+                taken, skipped = false_stmt, true_stmt
+            if skipped is not None:
+                with self.discarded_code():
+                    self.visit_stmt(skipped)
+            return self.visit_stmt(taken) if taken else None
 
         label_true = self.get_new_label()
         label_false = self.get_new_label()
         label_after = self.get_new_label() if has_else else label_false
-        self.current_function_code += [
-            f'br i1 {cond.value}, label %{label_true}, label %{label_false}',
-            f'{label_true}:'
-        ]
-        returned_block_true = self.visit_stmt(true_stmt_ctx)
+        variables = self.visible_variables()
+        states_before = self.variable_states(variables)
+        # (label of the predecessor block, states of variables at its end)
+        incoming: List[Tuple[str, List[Tuple[str, object]]]] = []
+        if not has_else:
+            self.add_incoming(incoming, variables)
+        self.emit_cond_br(cond.value, label_true, label_false)
+        self.start_block(label_true)
+        returned_block_true = self.visit_stmt(true_stmt)
         if not returned_block_true:
-            self.current_function_code.append(f'br label %{label_after}')
+            self.emit_br(label_after)
+            self.add_incoming(incoming, variables)
 
         returned_block_false = None
         if has_else:
-            self.current_function_code.append(f'{label_false}:')
-            returned_block_false = self.visit_stmt(ctx.stmt(1))
+            for var, (value, const) in zip(variables, states_before):
+                var.value, var.const = value, const
+            self.start_block(label_false)
+            returned_block_false = self.visit_stmt(false_stmt)
             if not returned_block_false:
-                self.current_function_code.append(f'br label %{label_after}')
+                self.emit_br(label_after)
+                self.add_incoming(incoming, variables)
         if (returned_block_true is not None
                 and returned_block_true == returned_block_false):
             return returned_block_true
-        self.current_function_code.append(f'{label_after}:')
+        self.start_block(label_after)
+        if not incoming:
+            # all predecessors are unreachable, so this block is too
+            self.dead_labels.add(label_after)
+        elif self.ssa:
+            self.join_variables(variables, incoming)
         return None
 
 
-    def visit_stmt_while(self, ctx: LatteParser.StmtWhileContext) -> None:
-        cond_label = self.get_new_label()
-        label_true = self.get_new_label()
-        label_false = self.get_new_label()
-        self.current_function_code += [
-            f'br label %{cond_label}',
-            f'{cond_label}:'
-        ]
+    def add_incoming(
+            self, incoming: List[Tuple[str, List[Tuple[str, object]]]],
+            variables: List[LatValue]) -> None:
+        if self.current_label not in self.dead_labels:
+            incoming.append(
+                (self.current_label, self.variable_states(variables)))
+
+
+    @staticmethod
+    def variable_states(variables: List[LatValue]) \
+            -> List[Tuple[str, object]]:
+        return [(var.value, var.const) for var in variables]
 
-        cond = self.visit_exp(ctx.exp())
+
+    # Emits phi nodes at the beginning of the current block for variables
+    # which have different values in its predecessors.
+    def join_variables(
+            self, variables: List[LatValue],
+            incoming: List[Tuple[str, List[Tuple[str, object]]]]) -> None:
+        for i, var in enumerate(variables):
+            states = [pred_states[i] for _, pred_states in incoming]
+            if all(value == states[0][0] for value, _ in states):
+                var.value, var.const = states[0]
+                continue
+            reg = self.emit_value(
+                'phi', var.llvm_type(),
+                *(pred_states[i][0] for _, pred_states in incoming),
+                labels=[pred_label for pred_label, _ in incoming])
+            var.value, var.const = reg, None
+
+
+    def visit_stmt_while(self, node: ast.StmtWhile) -> None:
+        # If the condition is false for the values from before the loop,
+        # the loop is never entered and only the condition is evaluated.
+        with self.discarded_code():
+            cond = self.visit_exp(node.exp)
         if cond.str_type != 'boolean':
-            compilation_error(
-                ctx,
+            self.compilation_error(
+                node,
                 f'Condition of while has to be boolean, is {cond.str_type}')
+        if cond.const is False:
+            self.visit_exp(node.exp)
+            with self.discarded_code():
+                self.visit_stmt(node.stmt)
+            return None
 
-        self.current_function_code += [
-            f'br i1 {cond.value}, label %{label_true}, label %{label_false}',
-            f'{label_true}:'
-        ]
-        self.visit_stmt(ctx.stmt())
-        self.current_function_code += [
-            f'br label %{cond_label}',
-            f'{label_false}:'
-        ]
+        cond_label = self.get_new_label()
+        label_true = self.get_new_label()
+        label_false = self.get_new_label()
+        label_before = self.current_label
+        self.emit_br(cond_label)
+        self.start_block(cond_label)
+
+        # Phi nodes for variables assigned in the loop are created before
+        # visiting it, their incoming values from the loop body are added
+        # once the body is compiled.
+        phis: List[Tuple[LatValue, Instr]] = []
+        if self.ssa:
+            for var in self.assigned_variables(node.stmt):
+                phi = Instr(
+                    'phi', self.get_new_register(), var.llvm_type(),
+                    [var.value], [label_before])
+                self.emit(phi)
+                phis.append((var, phi))
+                var.value, var.const = phi.result, None
+
+        cond = self.visit_exp(node.exp)
+        if cond.const is True:
+            self.emit_br(label_true)
+        else:
+            self.emit_cond_br(cond.value, label_true, label_false)
+        self.start_block(label_true)
+        returned = self.visit_stmt(node.stmt)
+        if not returned:
+            self.emit_br(cond_label)
+        back_edge = (not returned
+                     and self.current_label not in self.dead_labels)
+
+        for var, phi in phis:
+            if back_edge:
+                phi.operands.append(var.value)
+                phi.labels.append(self.current_label)
+            var.value, var.const = phi.result, None
+        self.start_block(label_false)
+        return None
 
 
     ### Expression visitors
 
-    def visit_exp(self, ctx: LatteParser.ExpContext) -> LatValue:
-        if isinstance(ctx, (
-                LatteParser.ExpOrContext, LatteParser.ExpAndContext)):
-            return self.visit_bool_op_exp(ctx)
+    # Expressions are visited without recursion, so that their depth isn't
+    # limited by the recursion limit of Python. Visitors waiting for values
+    # of subexpressions are kept on an explicit stack:
+    # - arithmetic and comparison operators, the most common compound
+    #   expressions, as the node, followed by the value of the left
+    #   argument once it's known,
+    # - others as generators, which yield subexpressions and get back their
+    #   values (`arg = yield node.exp`) until they return the value.
+    # Visitors of literals and variables return the value right away and
+    # parentheses are skipped.
+    def visit_exp(self, node: ast.Exp) -> LatValue:
+        # attributes used for every node are looked up once
+        exp_visitors = self.EXP_VISITORS
+        visit_binary_op_exp = self.visit_binary_op_exp
+        stack: List[Union[ast.BinaryExp, LatValue, ExpVisitor]] = []
+        push = stack.append
+        pop = stack.pop
+        while True:
+            while True:
+                node_type = type(node)
+                if node_type in ARITHMETIC_EXPS:
+                    push(node)
+                    node = node.left
+                elif node_type is ast.ExpParen:
+                    node = node.exp
+                else:
+                    break
+            value = exp_visitors[node_type](self, node)
+            if type(value) is not LatValue:
+                push(value)
+                value = None  # starts the generator
+            while stack:
+                top_type = type(stack[-1])
+                if top_type is LatValue:
+                    left = pop()
+                    value = visit_binary_op_exp(pop(), left, value)
+                elif top_type in ARITHMETIC_EXPS:
+                    node = stack[-1].right
+                    push(value)
+                    break
+                else:
+                    try:
+                        node = stack[-1].send(value)
+                        break
+                    except StopIteration as e:
+                        pop()
+                        value = e.value
+            else:
+                return value
+
 
-        elif isinstance(ctx, (
-                LatteParser.ExpRelContext, LatteParser.ExpAddContext,
-                LatteParser.ExpMulContext)):
-            return self.visit_binary_op_exp(ctx)
+    def visit_exp_str(self, node: ast.ExpStr) -> LatValue:
+        return self.get_str_const(node.value)
 
-        elif isinstance(ctx, LatteParser.ExpNegContext):
-            return self.visit_exp_neg(ctx)
 
-        elif isinstance(ctx, LatteParser.ExpStrContext):
-            return self.get_str_const(ctx.STR().getText()[1:-1])
+    def visit_exp_false(self, node: ast.ExpFalse) -> LatValue:
+        return self.get_const('boolean', False)
 
-        elif isinstance(ctx, LatteParser.ExpAppContext):
-            return self.visit_exp_app(ctx)
 
-        elif isinstance(ctx, LatteParser.ExpFalseContext):
-            return LatValue('boolean', '0')
+    def visit_exp_true(self, node: ast.ExpTrue) -> LatValue:
+        return self.get_const('boolean', True)
 
-        elif isinstance(ctx, LatteParser.ExpTrueContext):
-            return LatValue('boolean', '1')
 
-        elif isinstance(ctx, LatteParser.ExpIntContext):
-            return LatValue('int', ctx.INTEGER().getText())
+    def visit_exp_int(self, node: ast.ExpInt) -> LatValue:
+        return self.get_const('int', wrap_int(node.value))
 
-        elif isinstance(ctx, LatteParser.ExpVarContext):
-            _, var_val = self.load_variable(ctx, ctx.IDENT().getText())
-            return var_val
 
-        elif isinstance(ctx, LatteParser.ExpParenContext):
-            return self.visit_exp(ctx.exp())
+    def visit_exp_var(self, node: ast.ExpVar) -> LatValue:
+        _, var_val = self.load_variable(node, node.name)
+        return var_val
 
 
-    def visit_exp_neg(self, ctx: LatteParser.ExpNegContext) -> LatValue:
-        op = ctx.negop().getText()
-        arg = self.visit_exp(ctx.exp())
-        reg = self.get_new_register()
+    def visit_exp_neg(self, node: ast.ExpNeg) -> ExpVisitor:
+        op = node.op
+        arg = yield node.exp
         expected_type = 'boolean' if op == '!' else 'int'
         if arg.str_type != expected_type:
-            compilation_error(
-                ctx, f'Argument to `{op}` has to be {expected_type}, '
+            self.compilation_error(
+                node, f'Argument to `{op}` has to be {expected_type}, '
                 f'but is {arg.str_type}'
             )
+        if arg.const is not None:
+            if op == '!':
+                return self.get_const('boolean', not arg.const)
+            return self.get_const('int', wrap_int(-arg.const))
         if op == '!':
-            self.current_function_code.append(
-                f'{reg} = xor i1 {arg.value}, 1')
+            reg = self.emit_value('xor', 'i1', arg.value, '1')
             return LatValue('boolean', reg)
         else:
-            self.current_function_code.append(
-                f'{reg} = sub i32 0, {arg.value}')
+            reg = self.emit_value('sub', 'i32', '0', arg.value)
             return LatValue('int', reg)
 
 
-    def visit_exp_app(self, ctx: LatteParser.ExpAppContext) -> LatValue:
-        fun_name = ctx.IDENT().getText()
+    def visit_exp_app(self, node: ast.ExpApp) -> ExpVisitor:
+        fun_name = node.name
         fun_decl = self.functions.get(fun_name)
         if not fun_decl:
-            compilation_error(ctx, f'Undeclared function: {fun_name}')
-        args = [self.visit_exp(arg) for arg in ctx.exp()]
+            self.compilation_error(node, f'Undeclared function: {fun_name}')
+        args = []
+        for arg in node.args:
+            args.append((yield arg))
         if len(args) != len(fun_decl.arg_types):
-            compilation_error(
-                ctx, f'Invalid number of arguments to `{fun_decl}`')
+            self.compilation_error(
+                node, f'Invalid number of arguments to `{fun_decl}`')
         for i, (arg, arg_decl) in enumerate(zip(args, fun_decl.arg_types)):
             if arg.str_type != arg_decl:
-                compilation_error(
-                    ctx, f'Argument {i+1} to function `{fun_decl}` has to '
+                self.compilation_error(
+                    node, f'Argument {i+1} to function `{fun_decl}` has to '
                     f'have type {arg_decl}, but value has type {arg.str_type}')
         self.used_functions.add(fun_name)
-        llvm_ret_type = type_str_as_llvm(fun_decl.ret_type)
-        str_args = ', '.join((
-            '{arg_type} {arg_val}'.format(
-                arg_type=arg.llvm_type(), arg_val=arg.value)
-            for arg in args))
-        call_str = f'call {llvm_ret_type} @{fun_decl.name}({str_args})'
-        if fun_decl.ret_type != 'void':
-            reg = self.get_new_register()
-            call_str = f'{reg} = {call_str}'
-        else:
-            reg = 'void'
-        self.current_function_code.append(call_str)
+        reg = self.emit_call(
+            fun_decl.name, type_str_as_llvm(fun_decl.ret_type),
+            [arg.llvm_type() for arg in args], [arg.value for arg in args])
+        if fun_name == 'error':
+            # error() never returns, so the code after it is unreachable
+            self.emit(Instr('unreachable'))
+            self.start_block(self.get_new_label())
+            self.dead_labels.add(self.current_label)
         return LatValue(fun_decl.ret_type, reg)
 
 
-    def visit_bool_op_exp(self, ctx: LatteParser.ExpContext) -> LatValue:
-        if isinstance(ctx, LatteParser.ExpAndContext):
-            op, instr = '&&', 'and'
-        else:
-            op, instr = '||', 'or'
-        label_entry = self.get_new_label()
+    def emit_call(
+            self, fun_name: str, llvm_ret_type: str, arg_types: List[str],
+            args: List[str]) -> str:
+        reg = self.get_new_register() if llvm_ret_type != 'void' else ''
+        self.emit(Instr(
+            'call', reg, llvm_ret_type, args, attr=fun_name,
+            arg_types=arg_types))
+        return reg or 'void'
+
+
+    def visit_bool_op_exp(self, node: ast.BinaryExp) -> ExpVisitor:
+        op = node.op
+        instr = 'and' if op == '&&' else 'or'
         label_check = self.get_new_label()
         label_skip = self.get_new_label()
         if instr == 'and':
             label_true, label_false = label_check, label_skip
         else:
             label_true, label_false = label_skip, label_check
-        self.current_function_code += [
-            f'br label %{label_entry}',
-            f'{label_entry}:'
-        ]
 
-        left = self.visit_exp(ctx.exp(0))
+        left = yield node.left
         if left.str_type != 'boolean':
-            compilation_error(
-                ctx, f'Arguments to operator `{op}` have to be boolean,'
+            self.compilation_error(
+                node, f'Arguments to operator `{op}` have to be boolean,'
                 f'but the left value is {left.str_type}')
-        left_finish_label = left.finish_label or label_entry
-        self.current_function_code += [
-            f'br i1 {left.value}, label %{label_true}, label %{label_false}',
-            f'{label_check}:'
-        ]
-
-        right = self.visit_exp(ctx.exp(1))
+        # true for `&&`, false for `||`: the value of the left argument
+        # for which the result is the value of the right one
+        neutral = instr == 'and'
+        if left.const is not None:
+            if left.const == neutral:
+                return (yield from self.visit_bool_op_right_arg(node, op))
+            with self.discarded_code():
+                yield from self.visit_bool_op_right_arg(node, op)
+            return left
+
+        left_block = self.current_block
+        self.emit_cond_br(left.value, label_true, label_false)
+        self.start_block(label_check)
+        check_block = self.current_block
+
+        right = yield from self.visit_bool_op_right_arg(node, op)
+        right_finish_label = self.current_label
+        if (right.const is not None and self.current_block is check_block
+                and not check_block.instrs):
+            # the right argument is a constant that needed no code,
+            # so the branch is not needed either
+            left_block.instrs.pop()
+            self.current_function.blocks.pop()
+            self.current_block = left_block
+            return left if right.const == neutral else right
+
+        self.emit_br(label_skip)
+        self.start_block(label_skip)
+        reg = self.emit_value(
+            'phi', 'i1', left.value, right.value,
+            labels=[left_block.label, right_finish_label])
+        return LatValue('boolean', reg)
+
+
+    def visit_bool_op_right_arg(
+            self, node: ast.BinaryExp, op: str) -> ExpVisitor:
+        right = yield node.right
         if right.str_type != 'boolean':
-            compilation_error(
-                ctx, f'Arguments to operator `{op}` have to be boolean,'
+            self.compilation_error(
+                node, f'Arguments to operator `{op}` have to be boolean,'
                 f'but the right value is {right.str_type}')
-        right_finish_label = right.finish_label or label_check
-
-        reg = self.get_new_register()
-        self.current_function_code += [
-            f'br label %{label_skip}',
-
-            f'{label_skip}:',
-
-            f'{reg} = phi i1 [ {left.value}, %{left_finish_label} ], '
-            f'[ {right.value}, %{right_finish_label} ]'
-        ]
-        return LatValue('boolean', reg, finish_label=label_skip)
-
-
-    def visit_binary_op_exp(self, ctx: LatteParser.ExpContext) -> LatValue:
-        if isinstance(ctx, LatteParser.ExpRelContext):
-            op = ctx.relop().getText()
-            op_ret_type = 'boolean'
-            valid_types = ('int', 'boolean', 'string')
-            instr = 'icmp ' + {
-                '<': 'slt',
-                '<=': 'sle',
-                '>': 'sgt',
-                '>=': 'sge',
-                '==': 'eq',
-                '!=': 'ne',
-            }[op]
-        elif isinstance(ctx, LatteParser.ExpAddContext):
-            op = ctx.addop().getText()
-            op_ret_type = 'int'  # not used for strings
-            valid_types = {'+': ('int', 'string'), '-': ('int',)}[op]
-            instr = {'+': 'add', '-': 'sub'}[op]  # not used for strings
-        elif isinstance(ctx, LatteParser.ExpMulContext):
-            op = ctx.mulop().getText()
-            op_ret_type = 'int'
-            valid_types = ('int',)
-            instr = {'*': 'mul', '/': 'sdiv', '%': 'srem'}[op]
-
-        left = self.visit_exp(ctx.exp(0))
-        right = self.visit_exp(ctx.exp(1))
+        return right
+
+
+    def visit_binary_op_exp(
+            self, node: ast.BinaryExp, left: LatValue, right: LatValue) \
+            -> LatValue:
+        op = node.op
+        instr, pred, valid_types, op_ret_type = BINARY_OPS[op]
         if left.str_type != right.str_type:
-            compilation_error(
-                ctx, f'Types to operator `{op}` do not match: '
+            self.compilation_error(
+                node, f'Types to operator `{op}` do not match: '
                 f'{left.str_type} and {right.str_type}')
         # true: left.str_type == right.str_type
         if left.str_type not in valid_types:
-            compilation_error(
-                ctx, f'Operator `{op}` does not accept type {left.str_type}')
+            self.compilation_error(
+                node, f'Operator `{op}` does not accept type {left.str_type}')
+
+        if left.const is not None and right.const is not None:
+            const = fold_binary_op(op, left.const, right.const)
+            if const is not None:
+                if op_ret_type == 'boolean':
+                    return self.get_const('boolean', const)
+                return self.get_const(left.str_type, const)
 
-        reg = self.get_new_register()
         if left.str_type != 'string':
             llvm_arg_type = type_str_as_llvm(left.str_type)
-            self.current_function_code.append(
-                f'{reg} = {instr} {llvm_arg_type} '
-                f'{left.value}, {right.value}')
+            reg = self.emit_value(
+                instr, llvm_arg_type, left.value, right.value, attr=pred)
             return LatValue(op_ret_type, reg)
 
-        elif isinstance(ctx, LatteParser.ExpRelContext):  # string comparison
-            reg2 = self.get_new_register()
-            self.used_functions.add('strcmp')
-            self.current_function_code += [
-                f'{reg} = call i32 @strcmp('
-                f'i8* {left.value}, i8* {right.value})',
+        elif op in ('==', '!='):  # string equality, lengths compared first
+            self.used_functions.add('strequal')
+            reg = self.emit_call(
+                'strequal', 'i32', ['i8*', 'i8*'], [left.value, right.value])
+            reg2 = self.emit_value(
+                'icmp', 'i32', reg, '0', attr='ne' if op == '==' else 'eq')
+            return LatValue('boolean', reg2)
 
-                f'{reg2} = {instr} i32 {reg}, 0'
-            ]
+        elif op_ret_type == 'boolean':  # string ordering
+            self.used_functions.add('strcompare')
+            reg = self.emit_call(
+                'strcompare', 'i32', ['i8*', 'i8*'],
+                [left.value, right.value])
+            reg2 = self.emit_value(instr, 'i32', reg, '0', attr=pred)
             return LatValue('boolean', reg2)
 
         else:  # string concatenation
             self.used_functions.add('strconcat')
-            self.current_function_code.append(
-                f'{reg} = call i8* @strconcat('
-                f'i8* {left.value}, i8* {right.value})')
+            reg = self.emit_call(
+                'strconcat', 'i8*', ['i8*', 'i8*'], [left.value, right.value])
             return LatValue('string', reg)
+
+
+    ### Dispatch tables
+
+    # Visitors of statements and expressions by node class, looked up with
+    # type(node) instead of a chain of isinstance checks.
+
+    STMT_VISITORS = {
+        ast.StmtEmpty: visit_stmt_empty,
+        ast.StmtBlock: visit_stmt_block,
+        ast.StmtDecl: visit_stmt_decl,
+        ast.StmtAss: visit_stmt_ass,
+        ast.StmtIncr: visit_stmt_incr_decr,
+        ast.StmtDecr: visit_stmt_incr_decr,
+        ast.StmtRetVal: visit_stmt_ret_val,
+        ast.StmtRetVoid: visit_stmt_ret_void,
+        ast.StmtIfNoElse: visit_stmt_if,
+        ast.StmtIfElse: visit_stmt_if,
+        ast.StmtWhile: visit_stmt_while,
+        ast.StmtExp: visit_stmt_exp,
+    }
+
+    EXP_VISITORS = {
+        ast.ExpOr: visit_bool_op_exp,
+        ast.ExpAnd: visit_bool_op_exp,
+        ast.ExpNeg: visit_exp_neg,
+        ast.ExpStr: visit_exp_str,
+        ast.ExpApp: visit_exp_app,
+        ast.ExpFalse: visit_exp_false,
+        ast.ExpTrue: visit_exp_true,
+        ast.ExpInt: visit_exp_int,
+        ast.ExpVar: visit_exp_var,
+    }
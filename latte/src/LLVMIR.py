@@ -0,0 +1,242 @@
+# pylint: disable=C0103, C0111, R1705
+
+# In-memory representation of the LLVM code generated by LLVMCompiler
+# and its printer to the textual .ll format. Functions are printed
+# one by one, so that only one of them has to be kept in memory.
+#
+# Values (operands and results of instructions) are kept as strings
+# in the .ll syntax: registers ('%.t3', '%x'), constants ('42') or pointers
+# to string constants ('bitcast ({ i64, i8*, i8* }* @.str0 to i8*)').
+
+import re
+from typing import Dict, List, TextIO, Tuple, Union
+
+# Type of the globals of string constants, matching String in
+# lib/runtime.c: length, pointer to the characters and the buffer (null).
+# Values of type string are i8* pointers to such structures.
+STR_CONST_TYPE = '{ i64, i8*, i8* }'
+
+STR_CONST_POINTER_RE = re.compile(r'bitcast \(.*\* (@[^ ]+) to i8\*\)$')
+LLVM_ESCAPE_RE = re.compile(r'\\([0-9A-Fa-f]{2}|\\)')
+
+
+class Instr:
+
+    __slots__ = (
+        'opcode', 'result', 'type', 'operands', 'labels', 'attr', 'arg_types')
+
+    # Meaning of the fields depends on the opcode:
+    # * type is the type of the operands (arithmetic, icmp, store, ret, phi),
+    #   of the loaded/allocated value (load, alloca) or the return type
+    #   (call)
+    # * operands are the value operands; for phi they are the incoming
+    #   values and labels are the corresponding predecessors; for br
+    #   labels are the targets and the condition is the only operand
+    # * attr is the predicate of icmp or the name of the called function
+    # * arg_types are the types of arguments of call
+    def __init__(
+            self, opcode: str, result: str = '', type_: str = '',
+            operands: List[str] = None, labels: List[str] = None,
+            attr: str = '', arg_types: List[str] = None):
+        self.opcode = opcode
+        self.result = result
+        self.type = type_
+        self.operands = operands if operands is not None else []
+        self.labels = labels if labels is not None else []
+        self.attr = attr
+        self.arg_types = arg_types if arg_types is not None else []
+
+    def is_terminator(self) -> bool:
+        return self.opcode in TERMINATORS
+
+    # sdiv and srem are here, since they can crash the program
+    def has_side_effects(self) -> bool:
+        return self.opcode in SIDE_EFFECT_OPCODES
+
+    def __str__(self) -> str:
+        return FORMATTERS[self.opcode](self)
+
+
+class Block:
+
+    __slots__ = ('label', 'instrs')
+
+    def __init__(self, label: str):
+        self.label = label
+        self.instrs: List[Instr] = []
+
+    def is_terminated(self) -> bool:
+        return bool(self.instrs) and self.instrs[-1].is_terminator()
+
+    def successors(self) -> List[str]:
+        if not self.instrs or self.instrs[-1].opcode != 'br':
+            return []
+        return self.instrs[-1].labels
+
+
+class Function:
+
+    __slots__ = ('name', 'ret_type', 'args', 'blocks')
+
+    # A function without blocks is a declaration.
+    def __init__(
+            self, name: str, ret_type: str, args: List[Tuple[str, str]]):
+        self.name = name
+        self.ret_type = ret_type
+        self.args = args  # [(type, register)], register is '' in declarations
+        self.blocks: List[Block] = []
+
+
+TERMINATORS = frozenset(('br', 'ret', 'unreachable'))
+SIDE_EFFECT_OPCODES = frozenset(
+    ('call', 'store', 'sdiv', 'srem')) | TERMINATORS
+
+
+### Printer
+
+def format_binary(instr: Instr) -> str:
+    left, right = instr.operands
+    return f'{instr.result} = {instr.opcode} {instr.type} {left}, {right}'
+
+
+def format_icmp(instr: Instr) -> str:
+    left, right = instr.operands
+    return (f'{instr.result} = icmp {instr.attr} {instr.type} '
+            f'{left}, {right}')
+
+
+def format_phi(instr: Instr) -> str:
+    incoming = ', '.join(
+        f'[ {value}, %{label} ]'
+        for value, label in zip(instr.operands, instr.labels))
+    return f'{instr.result} = phi {instr.type} {incoming}'
+
+
+def format_call(instr: Instr) -> str:
+    args = ', '.join(
+        f'{arg_type} {arg}'
+        for arg_type, arg in zip(instr.arg_types, instr.operands))
+    call = f'call {instr.type} @{instr.attr}({args})'
+    return f'{instr.result} = {call}' if instr.result else call
+
+
+def format_br(instr: Instr) -> str:
+    if instr.operands:
+        label_true, label_false = instr.labels
+        return (f'br i1 {instr.operands[0]}, '
+                f'label %{label_true}, label %{label_false}')
+    return f'br label %{instr.labels[0]}'
+
+
+def format_ret(instr: Instr) -> str:
+    if instr.type == 'void':
+        return 'ret void'
+    return f'ret {instr.type} {instr.operands[0]}'
+
+
+def format_alloca(instr: Instr) -> str:
+    return f'{instr.result} = alloca {instr.type}'
+
+
+def format_load(instr: Instr) -> str:
+    return (f'{instr.result} = load {instr.type}, '
+            f'{instr.type}* {instr.operands[0]}')
+
+
+def format_store(instr: Instr) -> str:
+    value, ptr = instr.operands
+    return f'store {instr.type} {value}, {instr.type}* {ptr}'
+
+
+FORMATTERS = {
+    'add': format_binary,
+    'sub': format_binary,
+    'mul': format_binary,
+    'sdiv': format_binary,
+    'srem': format_binary,
+    'xor': format_binary,
+    'icmp': format_icmp,
+    'phi': format_phi,
+    'call': format_call,
+    'br': format_br,
+    'ret': format_ret,
+    'alloca': format_alloca,
+    'load': format_load,
+    'store': format_store,
+    'unreachable': lambda instr: 'unreachable',
+}
+
+
+def write_function(fun: Function, out: TextIO) -> None:
+    args = ', '.join(
+        f'{arg_type} {reg}' if reg else arg_type
+        for arg_type, reg in fun.args)
+    if not fun.blocks:
+        out.write(f'declare {fun.ret_type} @{fun.name}({args})\n')
+        return
+    out.write(f'define {fun.ret_type} @{fun.name}({args}) {{\n')
+    for block in fun.blocks:
+        out.write(f'{block.label}:\n')
+        for instr in block.instrs:
+            out.write(f'    {instr}\n')
+    out.write('}\n')
+
+
+# Value of type string pointing to the string constant `name`.
+def str_const_pointer(name: str) -> str:
+    return f'bitcast ({STR_CONST_TYPE}* {name} to i8*)'
+
+
+# Name of the string constant if the value points to one, else None.
+def str_const_name(value: str) -> Union[str, None]:
+    match = STR_CONST_POINTER_RE.match(value)
+    return match.group(1) if match else None
+
+
+# String constants are kept escaped as in LLVM's c"..." syntax, where
+# \XX is a single byte and other characters are encoded in UTF-8.
+def str_const_bytes(value: str) -> bytes:
+    data = bytearray()
+    pos = 0
+    for match in LLVM_ESCAPE_RE.finditer(value):
+        data += value[pos:match.start()].encode('utf-8')
+        if match.group(1) == '\\':
+            data += b'\\'
+        else:
+            data.append(int(match.group(1), 16))
+        pos = match.end()
+    data += value[pos:].encode('utf-8')
+    return bytes(data)
+
+
+# The characters are followed by a null byte, which isn't counted
+# in the length.
+def write_str_const(name: str, value: str, out: TextIO) -> None:
+    str_len = len(str_const_bytes(value))
+    array_type = f'[{str_len + 1} x i8]'
+    out.write(
+        f'{name}.chars = internal constant {array_type} c"{value}\\00"\n'
+        f'{name} = internal constant {STR_CONST_TYPE} {{ i64 {str_len}, '
+        f'i8* getelementptr ({array_type}, {array_type}* {name}.chars, '
+        'i32 0, i32 0), i8* null }\n')
+
+
+# Writes the module to a .ll file as it's generated by LLVMCompiler.
+class LLWriter:
+
+    def __init__(self, out: TextIO):
+        self.out = out
+
+    def write_function(self, fun: Function) -> None:
+        write_function(fun, self.out)
+        self.out.write('\n')
+
+    def write_globals(
+            self, str_consts: Dict[str, str],
+            declarations: List[Function]) -> None:
+        for name, value in str_consts.items():
+            write_str_const(name, value, self.out)
+        if str_consts:
+            self.out.write('\n')
+        for fun in declarations:
+            write_function(fun, self.out)
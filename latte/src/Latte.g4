@@ -21,6 +21,11 @@ block
 //     | lattype IDENT '(' arg? (',' arg)* ')' block   # ClassMemberMethod
 //     ;
 
+// `if` with and without `else` is one alternative, so that SLL prediction
+// doesn't have to choose between them before the whole `if` is parsed
+// (with two alternatives it chose the one without `else` and failed
+// on every `if`/`else`). The optional `else` is greedy, so the dangling
+// `else` is bound to the nearest `if`.
 stmt
     : ';'                                       # StmtEmpty
     | block                                     # StmtBlock
@@ -30,8 +35,7 @@ stmt
     | IDENT '--' ';'                            # StmtDecr
     | 'return' exp ';'                          # StmtRetVal
     | 'return' ';'                              # StmtRetVoid
-    | 'if' '(' exp ')' stmt                     # StmtIfNoElse
-    | 'if' '(' exp ')' stmt 'else' stmt         # StmtIfElse
+    | 'if' '(' exp ')' stmt ('else' stmt)?      # StmtIf
     | 'while' '(' exp ')' stmt                  # StmtWhile
     | exp ';'                                   # StmtExp
     // | 'for' '(' lattype IDENT ':' exp ')' stmt  # StmtFor
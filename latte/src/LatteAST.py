@@ -0,0 +1,279 @@
+# pylint: disable=C0103, C0111, R1705, R0903
+
+# Abstract syntax tree of Latte programs, built by PrattParser or by
+# TreeBuilder (from the ANTLR parse tree). Node classes correspond to the
+# labelled alternatives of Latte.g4. Every node keeps the line of its
+# first token and offsets of its first and last character in the source,
+# used in compilation errors. Types are kept as strings ('int', 'string',
+# 'boolean', 'void').
+
+from typing import List, Union
+
+
+class Node:
+    __slots__ = ('line', 'start', 'stop')
+
+    def __init__(self, line: int, start: int, stop: int):
+        self.line = line
+        self.start = start
+        self.stop = stop
+
+
+### Expressions
+
+class Exp(Node):
+    __slots__ = ()
+
+
+class ExpNeg(Exp):
+    __slots__ = ('op', 'exp')
+
+    def __init__(self, line: int, start: int, stop: int, op: str, exp: Exp):
+        super().__init__(line, start, stop)
+        self.op = op  # '-' or '!'
+        self.exp = exp
+
+
+class BinaryExp(Exp):
+    __slots__ = ('op', 'left', 'right')
+
+    def __init__(
+            self, line: int, start: int, stop: int, op: str, left: Exp,
+            right: Exp):
+        super().__init__(line, start, stop)
+        self.op = op
+        self.left = left
+        self.right = right
+
+
+class ExpMul(BinaryExp):
+    __slots__ = ()
+
+
+class ExpAdd(BinaryExp):
+    __slots__ = ()
+
+
+class ExpRel(BinaryExp):
+    __slots__ = ()
+
+
+class ExpAnd(BinaryExp):
+    __slots__ = ()
+
+
+class ExpOr(BinaryExp):
+    __slots__ = ()
+
+
+class ExpVar(Exp):
+    __slots__ = ('name',)
+
+    def __init__(self, line: int, start: int, stop: int, name: str):
+        super().__init__(line, start, stop)
+        self.name = name
+
+
+class ExpInt(Exp):
+    __slots__ = ('value',)
+
+    def __init__(self, line: int, start: int, stop: int, value: int):
+        super().__init__(line, start, stop)
+        self.value = value
+
+
+class ExpTrue(Exp):
+    __slots__ = ()
+
+
+class ExpFalse(Exp):
+    __slots__ = ()
+
+
+class ExpApp(Exp):
+    __slots__ = ('name', 'args')
+
+    def __init__(
+            self, line: int, start: int, stop: int, name: str,
+            args: List[Exp]):
+        super().__init__(line, start, stop)
+        self.name = name
+        self.args = args
+
+
+class ExpStr(Exp):
+    __slots__ = ('value',)
+
+    # value is the literal without quotes, escapes are kept as written
+    def __init__(self, line: int, start: int, stop: int, value: str):
+        super().__init__(line, start, stop)
+        self.value = value
+
+
+class ExpParen(Exp):
+    __slots__ = ('exp',)
+
+    def __init__(self, line: int, start: int, stop: int, exp: Exp):
+        super().__init__(line, start, stop)
+        self.exp = exp
+
+
+### Statements
+
+class Stmt(Node):
+    __slots__ = ()
+
+
+class Block(Node):
+    __slots__ = ('stmts',)
+
+    def __init__(self, line: int, start: int, stop: int, stmts: List[Stmt]):
+        super().__init__(line, start, stop)
+        self.stmts = stmts
+
+
+class StmtEmpty(Stmt):
+    __slots__ = ()
+
+
+class StmtBlock(Stmt):
+    __slots__ = ('block',)
+
+    def __init__(self, line: int, start: int, stop: int, block: Block):
+        super().__init__(line, start, stop)
+        self.block = block
+
+
+class Item(Node):
+    __slots__ = ('name', 'exp')
+
+    # exp is None for a declaration without initialization
+    def __init__(
+            self, line: int, start: int, stop: int, name: str,
+            exp: Union[Exp, None]):
+        super().__init__(line, start, stop)
+        self.name = name
+        self.exp = exp
+
+
+class StmtDecl(Stmt):
+    __slots__ = ('type', 'items')
+
+    def __init__(
+            self, line: int, start: int, stop: int, type_: str,
+            items: List[Item]):
+        super().__init__(line, start, stop)
+        self.type = type_
+        self.items = items
+
+
+class StmtAss(Stmt):
+    __slots__ = ('name', 'exp')
+
+    def __init__(
+            self, line: int, start: int, stop: int, name: str, exp: Exp):
+        super().__init__(line, start, stop)
+        self.name = name
+        self.exp = exp
+
+
+class StmtIncrDecr(Stmt):
+    __slots__ = ('name',)
+
+    def __init__(self, line: int, start: int, stop: int, name: str):
+        super().__init__(line, start, stop)
+        self.name = name
+
+
+class StmtIncr(StmtIncrDecr):
+    __slots__ = ()
+
+
+class StmtDecr(StmtIncrDecr):
+    __slots__ = ()
+
+
+class StmtRetVal(Stmt):
+    __slots__ = ('exp',)
+
+    def __init__(self, line: int, start: int, stop: int, exp: Exp):
+        super().__init__(line, start, stop)
+        self.exp = exp
+
+
+class StmtRetVoid(Stmt):
+    __slots__ = ()
+
+
+# a statement with a condition and a body
+class CondStmt(Stmt):
+    __slots__ = ('exp', 'stmt')
+
+    def __init__(
+            self, line: int, start: int, stop: int, exp: Exp, stmt: Stmt):
+        super().__init__(line, start, stop)
+        self.exp = exp
+        self.stmt = stmt
+
+
+class StmtIfNoElse(CondStmt):
+    __slots__ = ()
+
+
+class StmtIfElse(CondStmt):
+    __slots__ = ('else_stmt',)
+
+    def __init__(
+            self, line: int, start: int, stop: int, exp: Exp, stmt: Stmt,
+            else_stmt: Stmt):
+        super().__init__(line, start, stop, exp, stmt)
+        self.else_stmt = else_stmt
+
+
+class StmtWhile(CondStmt):
+    __slots__ = ()
+
+
+class StmtExp(Stmt):
+    __slots__ = ('exp',)
+
+    def __init__(self, line: int, start: int, stop: int, exp: Exp):
+        super().__init__(line, start, stop)
+        self.exp = exp
+
+
+### Top level
+
+class Arg(Node):
+    __slots__ = ('type', 'name')
+
+    def __init__(
+            self, line: int, start: int, stop: int, type_: str, name: str):
+        super().__init__(line, start, stop)
+        self.type = type_
+        self.name = name
+
+
+class TopDefFun(Node):
+    __slots__ = ('ret_type', 'name', 'args', 'block')
+
+    def __init__(
+            self, line: int, start: int, stop: int, ret_type: str, name: str,
+            args: List[Arg], block: Block):
+        super().__init__(line, start, stop)
+        self.ret_type = ret_type
+        self.name = name
+        self.args = args
+        self.block = block
+
+
+class Program(Node):
+    __slots__ = ('topdefs', 'source')
+
+    # source is the whole text of the program, for compilation errors
+    def __init__(
+            self, line: int, start: int, stop: int, topdefs: List[TopDefFun],
+            source: str):
+        super().__init__(line, start, stop)
+        self.topdefs = topdefs
+        self.source = source
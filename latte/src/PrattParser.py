@@ -0,0 +1,605 @@
+# pylint: disable=C0103, C0111, R1705
+
+# Hand-written front end for Latte, producing the same LatteAST trees as
+# ANTLR with TreeBuilder, but several times faster, without the ANTLR
+# runtime. The whole Latte.g4 grammar is parsed, so that syntax errors are
+# found at the same tokens, but like in TreeBuilder, programs using
+# extensions (classes, arrays, null) raise NotImplementedError.
+#
+# The lexer is table-driven: TOKEN_TYPES are tried in order, as a single
+# regular expression, and keywords and operators are recognized by their
+# text. Statements are parsed by recursive descent and expressions by
+# a Pratt parser with an explicit stack, using BINARY_OPS, which has
+# the same precedence and associativity as the left-recursive `exp` rule
+# in Latte.g4.
+#
+# Syntax errors are raised as ParseError with the same line and column
+# (counted from 0) as reported by ANTLR for the offending token. ANTLR
+# reports a token recognition error only when the parser gets to it, so
+# here it's kept as an INVALID token.
+
+import re
+from typing import Callable, List, Tuple
+
+import LatteAST as ast
+
+TOKEN_TYPES = [
+    ('WS', r'[ \t\r\n]+'),
+    ('COMMENT', r'#[^\n]*\n|//[^\n]*\n|/\*.*?\*/'),
+    ('IDENT', r"[a-zA-Z][a-zA-Z0-9_']*"),
+    ('INTEGER', r'[0-9]+'),
+    ('STR', r'"(?:\\"|[^\r\n"])*"'),
+    ('OP', r'\+\+|--|\[\]|&&|\|\||<=|>=|==|!=|[-(),{};=.\[\]!*/%+<>]'),
+]
+TOKEN_RE = re.compile(
+    '|'.join(f'(?P<{name}>{regex})' for name, regex in TOKEN_TYPES),
+    re.DOTALL)
+SKIPPED = ('WS', 'COMMENT')
+
+KEYWORDS = {
+    'return', 'if', 'else', 'while', 'int', 'string', 'boolean', 'void',
+    'true', 'false', 'new', 'null', 'NULL', 'nullptr',
+}
+TYPES = ('int', 'string', 'boolean', 'void')
+NULL_LITERALS = ('null', 'NULL', 'nullptr')
+
+EOF = '<EOF>'
+# the last token when the rest of the source can't be tokenized
+INVALID = '<invalid>'
+
+# operator: (precedence, right associative, node class); like in ANTLR,
+# alternatives of `exp` which are later in the grammar bind looser, so
+# `.` and `[` (extensions, without node classes) are the loosest
+BINARY_OPS = {
+    '[': (1, False, None),
+    '.': (2, False, None),
+    '||': (3, True, ast.ExpOr),
+    '&&': (4, True, ast.ExpAnd),
+    '<': (5, False, ast.ExpRel),
+    '<=': (5, False, ast.ExpRel),
+    '>': (5, False, ast.ExpRel),
+    '>=': (5, False, ast.ExpRel),
+    '==': (5, False, ast.ExpRel),
+    '!=': (5, False, ast.ExpRel),
+    '+': (6, False, ast.ExpAdd),
+    '-': (6, False, ast.ExpAdd),
+    '*': (7, False, ast.ExpMul),
+    '/': (7, False, ast.ExpMul),
+    '%': (7, False, ast.ExpMul),
+}
+# operands of `-` and `!` bind tighter than any binary operator
+NEG_PRECEDENCE = 8
+
+EXP_START = \
+    "{'(', 'true', 'false', 'new', '-', '!', IDENT, INTEGER, STR}"
+TYPE_START = "{'int', 'string', 'boolean', 'void', IDENT}"
+
+# (kind, text, line, column, offset); kind is the text for keywords
+# and operators
+Token = Tuple[str, str, int, int, int]
+
+# (method, args) called with the value of a parsed subexpression, see
+# Parser.parse_exp
+Continuation = Tuple[Callable[..., ast.Exp], tuple]
+# returned instead of a value by a continuation which needs another
+# operand (None is the value of an extension)
+PENDING = object()
+
+
+class ParseError(Exception):
+
+    def __init__(self, line: int, column: int, msg: str):
+        super().__init__(f'{line}:{column}: {msg}')
+        self.line = line
+        self.column = column
+        self.msg = msg
+
+
+def tokenize(source: str) -> List[Token]:
+    tokens = []
+    line = 1
+    line_start = 0
+    offset = 0
+    match = TOKEN_RE.match
+    while offset < len(source):
+        m = match(source, offset)
+        if m is None:
+            tokens.append(
+                (INVALID, source[offset], line, offset - line_start, offset))
+            return tokens
+        kind = m.lastgroup
+        text = m.group()
+        if kind in SKIPPED:
+            newlines = text.count('\n')
+            if newlines:
+                line += newlines
+                line_start = offset + text.rindex('\n') + 1
+        else:
+            if kind == 'OP' or (kind == 'IDENT' and text in KEYWORDS):
+                kind = text
+            tokens.append((kind, text, line, offset - line_start, offset))
+        offset = m.end()
+    tokens.append((EOF, EOF, line, offset - line_start, offset))
+    return tokens
+
+
+class Parser:
+
+    def __init__(self, source: str):
+        self.source = source
+        self.tokens = tokenize(source)
+        self.pos = 0
+        # set when a construct of a Latte extension is parsed
+        self.extension = False
+
+
+    ### Utils
+
+    def peek(self, ahead: int = 0) -> str:
+        return self.tokens[self.pos + ahead][0]
+
+
+    # Consumes a token of the given kind and returns it.
+    def expect(self, kind: str) -> Token:
+        token = self.tokens[self.pos]
+        if token[0] != kind:
+            expected = kind if kind in ('IDENT', 'INTEGER', 'STR') \
+                else f"'{kind}'"
+            self.error(expected)
+        self.pos += 1
+        return token
+
+
+    def error(self, expected: str) -> None:
+        kind, text, line, column, _ = self.tokens[self.pos]
+        if kind == INVALID:
+            raise ParseError(
+                line, column, f"token recognition error at: '{text}'")
+        raise ParseError(
+            line, column, f"mismatched input '{text}' expecting {expected}")
+
+
+    # Position (line, start, stop) of the code from the token at index
+    # `first` to the last consumed token.
+    def span(self, first: int) -> Tuple[int, int, int]:
+        _, _, line, _, start = self.tokens[first]
+        _, text, _, _, last_start = self.tokens[self.pos - 1]
+        return line, start, last_start + len(text) - 1
+
+
+    ### Top level
+
+    def parse_program(self) -> ast.Program:
+        topdefs = [self.parse_topdef_fun()]
+        while self.peek() != EOF:
+            topdefs.append(self.parse_topdef_fun())
+        if self.extension:
+            raise NotImplementedError('Latte extension')
+        return ast.Program(*self.span(0), topdefs, self.source)
+
+
+    def parse_type(self) -> str:
+        kind = self.peek()
+        if kind == 'IDENT':
+            self.extension = True
+        elif kind not in TYPES:
+            self.error(TYPE_START)
+        self.pos += 1
+        while self.peek() == '[]':
+            self.extension = True
+            self.pos += 1
+        return kind
+
+
+    def parse_topdef_fun(self) -> ast.TopDefFun:
+        first = self.pos
+        ret_type = self.parse_type()
+        name = self.expect('IDENT')[1]
+        self.expect('(')
+        args = []
+        # `arg? (',' arg)*` in the grammar
+        if self.peek() not in (')', ','):
+            args.append(self.parse_arg())
+        while self.peek() == ',':
+            self.pos += 1
+            args.append(self.parse_arg())
+        self.expect(')')
+        block = self.parse_block()
+        return ast.TopDefFun(*self.span(first), ret_type, name, args, block)
+
+
+    def parse_arg(self) -> ast.Arg:
+        first = self.pos
+        type_str = self.parse_type()
+        name = self.expect('IDENT')[1]
+        return ast.Arg(*self.span(first), type_str, name)
+
+
+    ### Statements
+
+    def parse_block(self) -> ast.Block:
+        first = self.pos
+        self.expect('{')
+        stmts = []
+        while self.peek() != '}':
+            if self.peek() == EOF:
+                self.error("'}'")
+            stmts.append(self.parse_stmt())
+        self.pos += 1
+        return ast.Block(*self.span(first), stmts)
+
+
+    def parse_stmt(self) -> ast.Stmt:
+        first = self.pos
+        kind = self.peek()
+        if kind == ';':
+            self.pos += 1
+            return ast.StmtEmpty(*self.span(first))
+
+        elif kind == '{':
+            block = self.parse_block()
+            return ast.StmtBlock(*self.span(first), block)
+
+        elif kind in TYPES \
+                or (kind == 'IDENT' and self.peek(1) in ('IDENT', '[]')):
+            return self.parse_stmt_decl()
+
+        elif kind == 'return':
+            self.pos += 1
+            if self.peek() == ';':
+                self.pos += 1
+                return ast.StmtRetVoid(*self.span(first))
+            exp = self.parse_exp()
+            self.expect(';')
+            return ast.StmtRetVal(*self.span(first), exp)
+
+        elif kind == 'if':
+            self.pos += 1
+            self.expect('(')
+            exp = self.parse_exp()
+            self.expect(')')
+            stmt = self.parse_stmt()
+            # `else` belongs to the nearest `if`
+            if self.peek() == 'else':
+                self.pos += 1
+                else_stmt = self.parse_stmt()
+                return ast.StmtIfElse(
+                    *self.span(first), exp, stmt, else_stmt)
+            return ast.StmtIfNoElse(*self.span(first), exp, stmt)
+
+        elif kind == 'while':
+            self.pos += 1
+            self.expect('(')
+            exp = self.parse_exp()
+            self.expect(')')
+            stmt = self.parse_stmt()
+            return ast.StmtWhile(*self.span(first), exp, stmt)
+
+        elif kind == 'IDENT' and self.peek(1) in ('=', '++', '--'):
+            name = self.tokens[self.pos][1]
+            op = self.peek(1)
+            self.pos += 2
+            if op == '=':
+                exp = self.parse_exp()
+                self.expect(';')
+                return ast.StmtAss(*self.span(first), name, exp)
+            self.expect(';')
+            if op == '++':
+                return ast.StmtIncr(*self.span(first), name)
+            return ast.StmtDecr(*self.span(first), name)
+
+        exp = self.parse_exp()
+        self.expect(';')
+        return ast.StmtExp(*self.span(first), exp)
+
+
+    def parse_stmt_decl(self) -> ast.StmtDecl:
+        first = self.pos
+        type_str = self.parse_type()
+        items = [self.parse_item()]
+        while self.peek() == ',':
+            self.pos += 1
+            items.append(self.parse_item())
+        self.expect(';')
+        return ast.StmtDecl(*self.span(first), type_str, items)
+
+
+    def parse_item(self) -> ast.Item:
+        first = self.pos
+        name = self.expect('IDENT')[1]
+        exp = None
+        if self.peek() == '=':
+            self.pos += 1
+            exp = self.parse_exp()
+        return ast.Item(*self.span(first), name, exp)
+
+
+    ### Expressions
+
+    # Expressions are parsed without recursion, so that deeply nested
+    # parentheses, prefix operators and calls don't exceed the recursion
+    # limit of Python. Where a recursive descent parser would call
+    # parse_exp for an operand, a continuation (method, args) is pushed
+    # on `stack` and the operand is parsed in the loop of parse_exp. When
+    # an expression is parsed, the continuation on top of the stack is
+    # called with its value: it returns the value of its own expression,
+    # or PENDING after pushing continuations of the next operand.
+    # Continuations hold unbound methods, which is a bit faster than
+    # creating bound ones.
+    def parse_exp(self, min_precedence: int = 0) -> ast.Exp:
+        stack: List[Continuation] = []
+        value = self.parse_operand(stack, min_precedence)
+        while value is PENDING:
+            value = self.parse_prefix(stack)
+            while value is not PENDING and stack:
+                method, args = stack.pop()
+                value = method(self, value, stack, *args)
+        return value
+
+
+    # Starts an expression whose binary operators have precedence
+    # at least min_precedence, its first operand is parsed next.
+    def start_exp(self, stack: List[Continuation],
+                  min_precedence: int) -> None:
+        stack.append((Parser.continue_exp, (self.pos, min_precedence)))
+
+
+    # Parses the binary operators after the operand `left` of the
+    # expression starting at the token `first`. A right operand which is
+    # a variable or a literal (the most common case) is parsed here,
+    # without a continuation, together with the operators binding tighter
+    # after it (the recursion is bounded by the number of precedence
+    # levels).
+    def continue_exp(
+            self, left: ast.Exp, stack: List[Continuation], first: int,
+            min_precedence: int) -> ast.Exp:
+        while True:
+            op_info = BINARY_OPS.get(self.peek())
+            if op_info is None or op_info[0] < min_precedence:
+                return left
+            precedence, right_assoc, exp_class = op_info
+            if right_assoc:
+                left = self.parse_right_assoc_chain(
+                    left, stack, first, min_precedence, precedence, [], [],
+                    first)
+                if left is PENDING:
+                    return PENDING
+                continue
+            op = self.tokens[self.pos][1]
+            self.pos += 1
+            if op == '[':
+                self.extension = True
+                stack.append(
+                    (Parser.end_index, (first, min_precedence, left)))
+                self.start_exp(stack, 0)
+                return PENDING
+            stack.append((Parser.end_binary_op, (
+                first, min_precedence, left, exp_class, op)))
+            right = self.parse_operand(stack, precedence + 1)
+            if right is PENDING:
+                return PENDING
+            stack.pop()
+            left = self.binary_exp(first, left, exp_class, op, right)
+
+
+    # Parses an expression whose binary operators have precedence at least
+    # min_precedence if it starts with a variable or a literal, otherwise
+    # starts it in the loop of parse_exp and returns PENDING.
+    def parse_operand(
+            self, stack: List[Continuation], min_precedence: int) -> ast.Exp:
+        first = self.pos
+        atom = self.parse_atom()
+        if atom is PENDING:
+            self.start_exp(stack, min_precedence)
+            return PENDING
+        return self.continue_exp(atom, stack, first, min_precedence)
+
+
+    def binary_exp(self, first: int, left: ast.Exp, exp_class: type,
+                   op: str, right: ast.Exp) -> ast.Exp:
+        if exp_class is None:
+            self.extension = True
+            return left
+        return exp_class(*self.span(first), op, left, right)
+
+
+    def end_binary_op(
+            self, right: ast.Exp, stack: List[Continuation], first: int,
+            min_precedence: int, left: ast.Exp, exp_class: type,
+            op: str) -> ast.Exp:
+        left = self.binary_exp(first, left, exp_class, op, right)
+        return self.continue_exp(left, stack, first, min_precedence)
+
+
+    def end_index(
+            self, _index: ast.Exp, stack: List[Continuation], first: int,
+            min_precedence: int, left: ast.Exp) -> ast.Exp:
+        self.expect(']')
+        return self.continue_exp(left, stack, first, min_precedence)
+
+
+    # Parses a chain of right associative operators of the given
+    # precedence, called with each of its operands `right` (starting
+    # at the token right_first). The chain is kept in lists, `operands`
+    # are pairs (first token, expression) of the previous operands and
+    # `ops` are pairs (node class, operator). Returns the tree built when
+    # the chain ends, or PENDING.
+    def parse_right_assoc_chain(
+            self, right: ast.Exp, stack: List[Continuation], first: int,
+            min_precedence: int, precedence: int,
+            operands: List[Tuple[int, ast.Exp]], ops: List[Tuple[type, str]],
+            right_first: int) -> ast.Exp:
+        operands.append((right_first, right))
+        while True:
+            op_info = BINARY_OPS.get(self.peek())
+            if op_info is None or op_info[0] != precedence:
+                break
+            ops.append((op_info[2], self.tokens[self.pos][1]))
+            self.pos += 1
+            right_first = self.pos
+            stack.append((Parser.continue_right_assoc_chain, (
+                first, min_precedence, precedence, operands, ops,
+                right_first)))
+            right = self.parse_operand(stack, precedence + 1)
+            if right is PENDING:
+                return PENDING
+            stack.pop()
+            operands.append((right_first, right))
+        _, exp = operands.pop()
+        while ops:
+            exp_class, op = ops.pop()
+            left_first, left = operands.pop()
+            exp = exp_class(*self.span(left_first), op, left, exp)
+        return exp
+
+
+    # Continues the chain and then the expression containing it.
+    def continue_right_assoc_chain(
+            self, right: ast.Exp, stack: List[Continuation], first: int,
+            min_precedence: int, *chain_args) -> ast.Exp:
+        exp = self.parse_right_assoc_chain(
+            right, stack, first, min_precedence, *chain_args)
+        if exp is PENDING:
+            return PENDING
+        return self.continue_exp(exp, stack, first, min_precedence)
+
+
+    # Parses a subexpression and returns the value of the continuation
+    # (method, args) called with it. Like parse_operand, it returns PENDING
+    # if the subexpression is parsed in the loop of parse_exp, then the
+    # continuation is called there. `method` mustn't call parse_subexp,
+    # so that the recursion is bounded.
+    def parse_subexp(
+            self, stack: List[Continuation], min_precedence: int,
+            method: Callable[..., ast.Exp], args: tuple) -> ast.Exp:
+        stack.append((method, args))
+        value = self.parse_operand(stack, min_precedence)
+        if value is PENDING:
+            return PENDING
+        stack.pop()
+        return method(self, value, stack, *args)
+
+
+    # Parses a variable or a literal, if it's the next operand. Otherwise
+    # returns PENDING without consuming anything.
+    def parse_atom(self) -> ast.Exp:
+        first = self.pos
+        kind, text = self.tokens[first][:2]
+        if kind == 'IDENT':
+            if self.peek(1) == '(':
+                return PENDING
+            self.pos += 1
+            return ast.ExpVar(*self.span(first), text)
+        elif kind == 'INTEGER':
+            self.pos += 1
+            return ast.ExpInt(*self.span(first), int(text))
+        elif kind == 'true':
+            self.pos += 1
+            return ast.ExpTrue(*self.span(first))
+        elif kind == 'false':
+            self.pos += 1
+            return ast.ExpFalse(*self.span(first))
+        elif kind == 'STR':
+            self.pos += 1
+            return ast.ExpStr(*self.span(first), text[1:-1])
+        return PENDING
+
+
+    # Returns the parsed operand, or PENDING if it has subexpressions,
+    # which are parsed next.
+    def parse_prefix(self, stack: List[Continuation]) -> ast.Exp:
+        atom = self.parse_atom()
+        if atom is not PENDING:
+            return atom
+        first = self.pos
+        kind, text = self.tokens[self.pos][:2]
+        self.pos += 1
+        if kind in ('-', '!'):
+            return self.parse_subexp(
+                stack, NEG_PRECEDENCE, Parser.end_neg, (first, text))
+        elif kind == 'IDENT':
+            self.pos += 1
+            # `exp? (',' exp)*` in the grammar
+            if self.peek() not in (')', ','):
+                return self.parse_subexp(
+                    stack, 0, Parser.continue_call, (first, text, []))
+            return self.next_call_arg(stack, first, text, [])
+        elif kind == '(':
+            if self.is_null_cast():
+                self.extension = True
+                self.parse_type()
+                self.expect(')')
+                if self.peek() not in NULL_LITERALS:
+                    self.error("{'null', 'NULL', 'nullptr'}")
+                self.pos += 1
+                return None  # extensions have no nodes
+            return self.parse_subexp(stack, 0, Parser.end_paren, (first,))
+        elif kind == 'new':
+            self.extension = True
+            self.parse_type()
+            if self.peek() == '[':
+                self.pos += 1
+                return self.parse_subexp(
+                    stack, 0, Parser.end_new_array, ())
+            return None
+        self.pos -= 1
+        self.error(EXP_START)
+
+
+    def end_neg(self, exp: ast.Exp, _stack: List[Continuation], first: int,
+                op: str) -> ast.Exp:
+        return ast.ExpNeg(*self.span(first), op, exp)
+
+
+    def continue_call(
+            self, arg: ast.Exp, stack: List[Continuation], first: int,
+            name: str, args: List[ast.Exp]) -> ast.Exp:
+        args.append(arg)
+        return self.next_call_arg(stack, first, name, args)
+
+
+    # After `(` or an argument of a call, parses the next arguments
+    # and ends the call.
+    def next_call_arg(
+            self, stack: List[Continuation], first: int, name: str,
+            args: List[ast.Exp]) -> ast.Exp:
+        while self.peek() == ',':
+            self.pos += 1
+            stack.append((Parser.continue_call, (first, name, args)))
+            arg = self.parse_operand(stack, 0)
+            if arg is PENDING:
+                return PENDING
+            stack.pop()
+            args.append(arg)
+        self.expect(')')
+        return ast.ExpApp(*self.span(first), name, args)
+
+
+    def end_paren(self, exp: ast.Exp, _stack: List[Continuation],
+                  first: int) -> ast.Exp:
+        self.expect(')')
+        return ast.ExpParen(*self.span(first), exp)
+
+
+    def end_new_array(self, _size: ast.Exp,
+                      _stack: List[Continuation]) -> ast.Exp:
+        self.expect(']')
+        return None
+
+
+    # After `(`, checks if it's `(type) null` rather than a parenthesized
+    # expression.
+    def is_null_cast(self) -> bool:
+        if self.peek() in TYPES:
+            return True
+        if self.peek() != 'IDENT':
+            return False
+        ahead = 1
+        while self.peek(ahead) == '[]':
+            ahead += 1
+        return self.peek(ahead) == ')' \
+            and self.peek(ahead + 1) in NULL_LITERALS
+
+
+def parse_program(source: str) -> ast.Program:
+    return Parser(source).parse_program()
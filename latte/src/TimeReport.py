@@ -0,0 +1,65 @@
+# pylint: disable=C0103, C0111, R1705
+
+# Measuring of the compilation phases for --time-report: wall time,
+# CPU time (together with the subprocesses run in the phase, e.g. llvm-as
+# or cc) and the peak size of memory allocated by Python during the phase
+# (traced by tracemalloc). Tracing slows Python down, so the
+# times include its overhead; they're meant for comparing the phases.
+
+import contextlib
+import os
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, Union
+
+Phase = Dict[str, Union[str, float, int]]
+
+
+# CPU time of this process and of its finished subprocesses (measured
+# only in clock ticks)
+def cpu_time() -> float:
+    times = os.times()
+    return time.process_time() + times.children_user + times.children_system
+
+
+class TimeReport:
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.phases: List[Phase] = []
+
+    # Measures the code in the `with` block as the phase `name`. The phase
+    # is recorded also when the block raises (e.g. on a compilation error).
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if hasattr(tracemalloc, 'reset_peak'):  # Python >= 3.9
+            tracemalloc.reset_peak()
+        start_wall = time.perf_counter()
+        start_cpu = cpu_time()
+        try:
+            yield
+        finally:
+            self.phases.append({
+                'phase': name,
+                'wall': time.perf_counter() - start_wall,
+                'cpu': cpu_time() - start_cpu,
+                'peak_memory': tracemalloc.get_traced_memory()[1],
+            })
+
+    def format_table(self) -> str:
+        lines = [f'{"phase":<10} {"wall [ms]":>10} {"cpu [ms]":>10} '
+                 f'{"peak memory [KiB]":>18}']
+        rows = [(p['phase'], p['wall'], p['cpu'], p['peak_memory'])
+                for p in self.phases]
+        rows.append(('total', sum(row[1] for row in rows),
+                     sum(row[2] for row in rows),
+                     max((row[3] for row in rows), default=0)))
+        for name, wall, cpu, peak_memory in rows:
+            lines.append(f'{name:<10} {wall * 1000:>10.2f} '
+                         f'{cpu * 1000:>10.2f} {peak_memory / 1024:>18.1f}')
+        return '\n'.join(lines)
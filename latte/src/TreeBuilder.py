@@ -0,0 +1,124 @@
+# pylint: disable=C0103, C0111, R1705
+
+# Builds the LatteAST tree from the ANTLR parse tree. ANTLR is kept as
+# the reference front end (latc --parser antlr); PrattParser builds the same
+# trees without it.
+
+import antlr4
+from antlr_generated.LatteParser import LatteParser
+import LatteAST as ast
+
+TYPES = {
+    LatteParser.TypeIntContext: 'int',
+    LatteParser.TypeStrContext: 'string',
+    LatteParser.TypeBoolContext: 'boolean',
+    LatteParser.TypeVoidContext: 'void',
+}
+
+BINARY_EXPS = {
+    LatteParser.ExpMulContext: ast.ExpMul,
+    LatteParser.ExpAddContext: ast.ExpAdd,
+    LatteParser.ExpRelContext: ast.ExpRel,
+    LatteParser.ExpAndContext: ast.ExpAnd,
+    LatteParser.ExpOrContext: ast.ExpOr,
+}
+
+
+def pos(ctx: antlr4.ParserRuleContext):
+    return ctx.start.line, ctx.start.start, ctx.stop.stop
+
+
+def build_type(ctx: LatteParser.LattypeContext) -> str:
+    type_str = TYPES.get(type(ctx))
+    if type_str is None:
+        raise NotImplementedError('Latte extension')
+    return type_str
+
+
+def build_program(ctx: LatteParser.ProgramContext, source: str) \
+        -> ast.Program:
+    topdefs = [
+        build_topdef_fun(child) for child in ctx.children
+        if isinstance(child, LatteParser.TopDefFunContext)]
+    return ast.Program(*pos(ctx), topdefs, source)
+
+
+def build_topdef_fun(ctx: LatteParser.TopDefFunContext) -> ast.TopDefFun:
+    args = [
+        ast.Arg(*pos(arg), build_type(arg.lattype()), arg.IDENT().getText())
+        for arg in ctx.arg()]
+    return ast.TopDefFun(
+        *pos(ctx), build_type(ctx.lattype()), ctx.IDENT().getText(), args,
+        build_block(ctx.block()))
+
+
+def build_block(ctx: LatteParser.BlockContext) -> ast.Block:
+    return ast.Block(*pos(ctx), [build_stmt(stmt) for stmt in ctx.stmt()])
+
+
+def build_stmt(ctx: LatteParser.StmtContext) -> ast.Stmt:
+    if isinstance(ctx, LatteParser.StmtEmptyContext):
+        return ast.StmtEmpty(*pos(ctx))
+    elif isinstance(ctx, LatteParser.StmtBlockContext):
+        return ast.StmtBlock(*pos(ctx), build_block(ctx.block()))
+    elif isinstance(ctx, LatteParser.StmtDeclContext):
+        items = []
+        for item in ctx.item():
+            exp = None
+            if isinstance(item, LatteParser.ItemInitContext):
+                exp = build_exp(item.exp())
+            items.append(ast.Item(*pos(item), item.IDENT().getText(), exp))
+        return ast.StmtDecl(*pos(ctx), build_type(ctx.lattype()), items)
+    elif isinstance(ctx, LatteParser.StmtAssContext):
+        return ast.StmtAss(
+            *pos(ctx), ctx.IDENT().getText(), build_exp(ctx.exp()))
+    elif isinstance(ctx, LatteParser.StmtIncrContext):
+        return ast.StmtIncr(*pos(ctx), ctx.IDENT().getText())
+    elif isinstance(ctx, LatteParser.StmtDecrContext):
+        return ast.StmtDecr(*pos(ctx), ctx.IDENT().getText())
+    elif isinstance(ctx, LatteParser.StmtRetValContext):
+        return ast.StmtRetVal(*pos(ctx), build_exp(ctx.exp()))
+    elif isinstance(ctx, LatteParser.StmtRetVoidContext):
+        return ast.StmtRetVoid(*pos(ctx))
+    elif isinstance(ctx, LatteParser.StmtIfContext):
+        stmts = ctx.stmt()
+        if len(stmts) == 2:
+            return ast.StmtIfElse(
+                *pos(ctx), build_exp(ctx.exp()), build_stmt(stmts[0]),
+                build_stmt(stmts[1]))
+        return ast.StmtIfNoElse(
+            *pos(ctx), build_exp(ctx.exp()), build_stmt(stmts[0]))
+    elif isinstance(ctx, LatteParser.StmtWhileContext):
+        return ast.StmtWhile(
+            *pos(ctx), build_exp(ctx.exp()), build_stmt(ctx.stmt()))
+    elif isinstance(ctx, LatteParser.StmtExpContext):
+        return ast.StmtExp(*pos(ctx), build_exp(ctx.exp()))
+    raise NotImplementedError('Latte extension')
+
+
+def build_exp(ctx: LatteParser.ExpContext) -> ast.Exp:
+    binary_exp = BINARY_EXPS.get(type(ctx))
+    if binary_exp is not None:
+        return binary_exp(
+            *pos(ctx), ctx.getChild(1).getText(), build_exp(ctx.exp(0)),
+            build_exp(ctx.exp(1)))
+    elif isinstance(ctx, LatteParser.ExpNegContext):
+        return ast.ExpNeg(
+            *pos(ctx), ctx.negop().getText(), build_exp(ctx.exp()))
+    elif isinstance(ctx, LatteParser.ExpVarContext):
+        return ast.ExpVar(*pos(ctx), ctx.IDENT().getText())
+    elif isinstance(ctx, LatteParser.ExpIntContext):
+        return ast.ExpInt(*pos(ctx), int(ctx.INTEGER().getText()))
+    elif isinstance(ctx, LatteParser.ExpTrueContext):
+        return ast.ExpTrue(*pos(ctx))
+    elif isinstance(ctx, LatteParser.ExpFalseContext):
+        return ast.ExpFalse(*pos(ctx))
+    elif isinstance(ctx, LatteParser.ExpAppContext):
+        return ast.ExpApp(
+            *pos(ctx), ctx.IDENT().getText(),
+            [build_exp(arg) for arg in ctx.exp()])
+    elif isinstance(ctx, LatteParser.ExpStrContext):
+        return ast.ExpStr(*pos(ctx), ctx.STR().getText()[1:-1])
+    elif isinstance(ctx, LatteParser.ExpParenContext):
+        return ast.ExpParen(*pos(ctx), build_exp(ctx.exp()))
+    raise NotImplementedError('Latte extension')
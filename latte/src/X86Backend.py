@@ -0,0 +1,575 @@
+# pylint: disable=C0103, C0111, R1705
+
+# x86-64 backend: translates functions in the LLVMIR representation
+# (in SSA form, after CFGCleanup) to GNU assembly in Intel syntax,
+# following the System V calling convention, so the result can be linked
+# with the runtime compiled by a C compiler.
+#
+# Values are assigned to registers by linear scan register allocation
+# (Poletto & Sarkar). Every SSA value gets one live interval covering
+# all positions where it's live; values whose intervals contain a call
+# can only get callee-saved registers. When no register is free, the
+# interval which ends last is spilled to a stack slot. Phi nodes are
+# replaced by parallel moves at the ends of predecessor blocks (or in
+# stubs on critical edges).
+#
+# rax, rcx, rdx and r11 are never allocated, they are used as scratch
+# registers by the generated code.
+
+import bisect
+import os
+import re
+from typing import Dict, List, Set, TextIO, Tuple
+
+from LLVMAssembler import ASSEMBLY_FAILED, LINKING_FAILED, run_tool
+from LLVMIR import Block, Function, Instr, str_const_bytes, str_const_name
+
+CALLEE_SAVED_REGS = ('rbx', 'r12', 'r13', 'r14', 'r15')
+CALLER_SAVED_REGS = ('rsi', 'rdi', 'r8', 'r9', 'r10')
+ARG_REGS = ('rdi', 'rsi', 'rdx', 'rcx', 'r8', 'r9')
+CYCLE_TMP_REG = 'r11'
+
+# functions from lib/runtime.c
+RUNTIME_FUNCTIONS = {
+    'printInt', 'printString', 'error', 'readInt', 'readString', 'strcompare',
+    'strequal', 'strconcat',
+}
+
+REGS_32 = {
+    'rax': 'eax', 'rbx': 'ebx', 'rcx': 'ecx', 'rdx': 'edx',
+    'rsi': 'esi', 'rdi': 'edi', 'r8': 'r8d', 'r9': 'r9d', 'r10': 'r10d',
+    'r11': 'r11d', 'r12': 'r12d', 'r13': 'r13d', 'r14': 'r14d',
+    'r15': 'r15d',
+}
+
+BINARY_OPS = {'add': 'add', 'sub': 'sub', 'mul': 'imul', 'xor': 'xor'}
+
+CONDITIONS = {
+    'eq': 'e', 'ne': 'ne', 'slt': 'l', 'sle': 'le', 'sgt': 'g', 'sge': 'ge',
+}
+# true is -1 as a signed i1, but it's represented as 1
+I1_CONDITIONS = {
+    'eq': 'e', 'ne': 'ne', 'slt': 'a', 'sle': 'ae', 'sgt': 'b', 'sge': 'be',
+}
+
+INT_RE = re.compile(r'-?[0-9]+$')
+
+
+def is_imm(value: str) -> bool:
+    return INT_RE.match(value) is not None
+
+
+def is_mem(location: str) -> bool:
+    return location.endswith(']')
+
+
+# Address of a label, e.g. of a string constant, which is loaded with lea.
+def is_address(location: str) -> bool:
+    return location.startswith('offset ')
+
+
+# User functions get a prefix, so that their names can't be taken by
+# the assembler for registers or operators (e.g. `rax`, `lt`) and don't
+# clash with functions from libc.
+def symbol(fun_name: str) -> str:
+    if fun_name == 'main' or fun_name in RUNTIME_FUNCTIONS:
+        return fun_name
+    return 'lat.' + fun_name.replace("'", '.q')
+
+
+def str_const_label(name: str) -> str:
+    return '.L' + name[2:]  # @.str0 -> .Lstr0
+
+
+def asm_string(data: bytes) -> str:
+    chars = []
+    for byte in data:
+        if 32 <= byte < 127 and byte not in b'"\\':
+            chars.append(chr(byte))
+        else:
+            chars.append(f'\\{byte:03o}')
+    return '"' + ''.join(chars) + '"'
+
+
+### Register allocation
+
+class Allocation:
+
+    def __init__(self):
+        self.locations: Dict[str, str] = {}  # value: register or stack slot
+        self.alloca_slots: Dict[str, str] = {}  # alloca result: stack slot
+        self.used_callee_saved: List[str] = []
+        self.slots = 0
+
+
+    # The offsets of slots are known only when it's known which registers
+    # are saved in the frame, so slots are named by their numbers until
+    # then.
+    def new_slot(self) -> str:
+        self.slots += 1
+        return f'slot {self.slots}'
+
+
+    def resolve_slot(self, location: str) -> str:
+        if not location.startswith('slot '):
+            return location
+        offset = 8 * (len(self.used_callee_saved) + int(location[5:]))
+        return f'qword ptr [rbp - {offset}]'
+
+
+def is_var(value: str, alloca_slots: Dict[str, str]) -> bool:
+    return value.startswith('%') and value not in alloca_slots
+
+
+def live_intervals(fun: Function, alloca_slots: Dict[str, str]) \
+        -> Tuple[Dict[str, List[int]], List[int]]:
+    block_start: Dict[str, int] = {}
+    block_end: Dict[str, int] = {}
+    position = 0
+    for block in fun.blocks:
+        block_start[block.label] = position
+        position += len(block.instrs)
+        block_end[block.label] = position - 1
+
+    phi_defs: Dict[str, Set[str]] = {}
+    upward_uses: Dict[str, Set[str]] = {}
+    defs: Dict[str, Set[str]] = {}
+    # values used by phi nodes, by (predecessor, successor)
+    phi_uses: Dict[Tuple[str, str], Set[str]] = {}
+    for block in fun.blocks:
+        phi_defs[block.label] = set()
+        upward_uses[block.label] = set()
+        defs[block.label] = set()
+        for instr in block.instrs:
+            if instr.opcode == 'phi':
+                phi_defs[block.label].add(instr.result)
+                for value, label in zip(instr.operands, instr.labels):
+                    if is_var(value, alloca_slots):
+                        phi_uses.setdefault(
+                            (label, block.label), set()).add(value)
+                continue
+            for value in instr.operands:
+                if (is_var(value, alloca_slots)
+                        and value not in defs[block.label]):
+                    upward_uses[block.label].add(value)
+            if instr.result:
+                defs[block.label].add(instr.result)
+
+    live_in: Dict[str, Set[str]] = {block.label: set() for block in fun.blocks}
+    live_out: Dict[str, Set[str]] = {
+        block.label: set() for block in fun.blocks}
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(fun.blocks):
+            label = block.label
+            out: Set[str] = set()
+            for succ in block.successors():
+                out |= live_in[succ] - phi_defs[succ]
+                out |= phi_uses.get((label, succ), set())
+            in_ = phi_defs[label] | upward_uses[label] \
+                | (out - defs[label] - phi_defs[label])
+            if out != live_out[label] or in_ != live_in[label]:
+                live_out[label], live_in[label] = out, in_
+                changed = True
+
+    intervals: Dict[str, List[int]] = {}
+
+    def extend(value: str, position: int) -> None:
+        interval = intervals.setdefault(value, [position, position])
+        interval[0] = min(interval[0], position)
+        interval[1] = max(interval[1], position)
+
+    for _, reg in fun.args:
+        extend(reg, -1)
+    call_positions = []
+    position = 0
+    for block in fun.blocks:
+        for instr in block.instrs:
+            if instr.opcode == 'phi':
+                extend(instr.result, block_start[block.label])
+            else:
+                for value in instr.operands:
+                    if is_var(value, alloca_slots):
+                        extend(value, position)
+                if instr.result and instr.result not in alloca_slots:
+                    extend(instr.result, position)
+                if instr.opcode == 'call':
+                    call_positions.append(position)
+            position += 1
+        for value in live_in[block.label]:
+            extend(value, block_start[block.label])
+        for value in live_out[block.label]:
+            extend(value, block_end[block.label])
+    return intervals, call_positions
+
+
+def allocate_registers(fun: Function) -> Allocation:
+    allocation = Allocation()
+    for block in fun.blocks:
+        for instr in block.instrs:
+            if instr.opcode == 'alloca':
+                allocation.alloca_slots[instr.result] = allocation.new_slot()
+    intervals, call_positions = live_intervals(fun, allocation.alloca_slots)
+    locations = allocation.locations
+
+    # values used as call arguments are treated as live across the call,
+    # since argument registers are overwritten while passing them
+    # (call_positions are in increasing order)
+    def crosses_call(interval: List[int]) -> bool:
+        i = bisect.bisect_right(call_positions, interval[0])
+        return i < len(call_positions) and call_positions[i] <= interval[1]
+
+    free_regs = set(CALLEE_SAVED_REGS + CALLER_SAVED_REGS)
+    # (end, -n, value) of the values in registers, sorted by the ends of
+    # their intervals, where n is the number of the value in the order
+    # of allocation: of the intervals ending last, the oldest is spilled
+    active: List[Tuple[int, int, str]] = []
+    for n, value in enumerate(
+            sorted(intervals, key=lambda v: (intervals[v][0], v))):
+        start, end = intervals[value]
+        while active and active[0][0] < start:
+            free_regs.add(locations[active.pop(0)[2]])
+        if crosses_call(intervals[value]):
+            pool = CALLEE_SAVED_REGS
+        else:
+            pool = CALLER_SAVED_REGS + CALLEE_SAVED_REGS
+        reg = next((reg for reg in pool if reg in free_regs), None)
+        if reg is not None:
+            free_regs.remove(reg)
+            locations[value] = reg
+            bisect.insort(active, (end, -n, value))
+            continue
+        spilled = next(
+            (entry for entry in reversed(active)
+             if locations[entry[2]] in pool), None)
+        if spilled is not None and spilled[0] > end:
+            locations[value] = locations[spilled[2]]
+            locations[spilled[2]] = allocation.new_slot()
+            active.remove(spilled)
+            bisect.insort(active, (end, -n, value))
+        else:
+            locations[value] = allocation.new_slot()
+
+    allocation.used_callee_saved = [
+        reg for reg in CALLEE_SAVED_REGS if reg in locations.values()]
+    for value, location in locations.items():
+        locations[value] = allocation.resolve_slot(location)
+    for value, slot in allocation.alloca_slots.items():
+        allocation.alloca_slots[value] = allocation.resolve_slot(slot)
+    return allocation
+
+
+### Code generation
+
+class FunctionCompiler:
+
+    def __init__(self, fun: Function, out: TextIO):
+        self.fun = fun
+        self.out = out
+        self.allocation = allocate_registers(fun)
+        self.locations = self.allocation.locations
+        self.alloca_slots = self.allocation.alloca_slots
+        self.ret_label = self.label('.ret')
+
+
+    def label(self, block_label: str) -> str:
+        return f'.L{symbol(self.fun.name)}.{block_label}'
+
+
+    def emit(self, line: str) -> None:
+        self.out.write(f'    {line}\n')
+
+
+    def emit_label(self, label: str) -> None:
+        self.out.write(f'{label}:\n')
+
+
+    # 64-bit location or immediate of a value.
+    def operand(self, value: str) -> str:
+        if is_imm(value):
+            return value
+        name = str_const_name(value)
+        if name is not None:
+            return f'offset {str_const_label(name)}'
+        return self.locations[value]
+
+
+    def operand_32(self, value: str) -> str:
+        operand = self.operand(value)
+        if is_imm(operand):
+            return operand
+        elif is_mem(operand):
+            return operand.replace('qword', 'dword')
+        return REGS_32[operand]
+
+
+    def emit_mov(self, dst: str, src: str) -> None:
+        if dst == src:
+            return
+        if is_address(src):
+            reg = 'rax' if is_mem(dst) else dst
+            self.emit(f'lea {reg}, [rip + {src[len("offset "):]}]')
+            src = reg
+            if reg == dst:
+                return
+        if is_mem(dst) and is_mem(src):
+            self.emit(f'mov rax, {src}')
+            src = 'rax'
+        self.emit(f'mov {dst}, {src}')
+
+
+    # Moves are done as if in parallel, e.g. the values of two registers
+    # can be swapped.
+    def emit_parallel_moves(self, moves: List[Tuple[str, str]]) -> None:
+        moves = [(dst, src) for dst, src in moves if dst != src]
+        while moves:
+            sources = {src for _, src in moves}
+            ready = next(
+                (move for move in moves if move[0] not in sources), None)
+            if ready is not None:
+                self.emit_mov(*ready)
+                moves.remove(ready)
+                continue
+            # only cycles are left, one of them is broken by moving
+            # a value to the temporary register
+            dst = moves[0][0]
+            self.emit_mov(CYCLE_TMP_REG, dst)
+            moves = [
+                (d, CYCLE_TMP_REG if s == dst else s) for d, s in moves]
+
+
+    def phi_moves(self, pred: str, succ: Block) -> List[Tuple[str, str]]:
+        moves = []
+        for instr in succ.instrs:
+            if instr.opcode != 'phi':
+                break
+            for value, label in zip(instr.operands, instr.labels):
+                if label == pred:
+                    moves.append(
+                        (self.locations[instr.result], self.operand(value)))
+        return moves
+
+
+    def compile(self) -> None:
+        name = symbol(self.fun.name)
+        if self.fun.name == 'main':
+            self.out.write(f'    .globl {name}\n')
+        self.out.write(f'    .type {name}, @function\n')
+        self.emit_label(name)
+        self.emit('push rbp')
+        self.emit('mov rbp, rsp')
+        saved = self.allocation.used_callee_saved
+        for reg in saved:
+            self.emit(f'push {reg}')
+        frame_size = 8 * self.allocation.slots
+        if (frame_size + 8 * len(saved)) % 16:
+            frame_size += 8
+        if frame_size:
+            self.emit(f'sub rsp, {frame_size}')
+
+        arg_moves = []
+        for i, (_, reg) in enumerate(self.fun.args):
+            if reg not in self.locations:
+                continue
+            if i < len(ARG_REGS):
+                src = ARG_REGS[i]
+            else:
+                src = f'qword ptr [rbp + {16 + 8 * (i - len(ARG_REGS))}]'
+            arg_moves.append((self.locations[reg], src))
+        self.emit_parallel_moves(arg_moves)
+
+        by_label = {block.label: block for block in self.fun.blocks}
+        for i, block in enumerate(self.fun.blocks):
+            next_label = None
+            if i + 1 < len(self.fun.blocks):
+                next_label = self.fun.blocks[i + 1].label
+            self.emit_label(self.label(block.label))
+            for instr in block.instrs:
+                if instr.opcode == 'br':
+                    self.compile_br(instr, block, by_label, next_label)
+                else:
+                    self.compile_instr(instr)
+
+        self.emit_label(self.ret_label)
+        if frame_size:
+            self.emit(f'lea rsp, [rbp - {8 * len(saved)}]')
+        for reg in reversed(saved):
+            self.emit(f'pop {reg}')
+        self.emit('pop rbp')
+        self.emit('ret')
+        self.out.write(f'    .size {name}, .-{name}\n\n')
+
+
+    def compile_br(
+            self, instr: Instr, block: Block, by_label: Dict[str, Block],
+            next_label: str) -> None:
+        if not instr.operands:
+            target = instr.labels[0]
+            self.emit_parallel_moves(
+                self.phi_moves(block.label, by_label[target]))
+            if target != next_label:
+                self.emit(f'jmp {self.label(target)}')
+            return
+
+        cond = self.operand_32(instr.operands[0])
+        if is_imm(cond):
+            self.emit(f'mov eax, {cond}')
+            cond = 'eax'
+        if is_mem(cond):
+            self.emit(f'cmp {cond}, 0')
+        else:
+            self.emit(f'test {cond}, {cond}')
+        # edges to blocks with phi nodes are critical, the moves are done
+        # in stubs placed after the block
+        stubs = []
+        targets = []
+        for target in instr.labels:
+            moves = self.phi_moves(block.label, by_label[target])
+            if moves:
+                stub = self.label(f'{block.label}.{target}')
+                stubs.append((stub, moves, target))
+                targets.append(stub)
+            else:
+                targets.append(self.label(target))
+        if not stubs and instr.labels[0] == next_label:
+            self.emit(f'je {targets[1]}')
+            return
+        self.emit(f'jne {targets[0]}')
+        if stubs or instr.labels[1] != next_label:
+            self.emit(f'jmp {targets[1]}')
+        for stub, moves, target in stubs:
+            self.emit_label(stub)
+            self.emit_parallel_moves(moves)
+            self.emit(f'jmp {self.label(target)}')
+
+
+    def store_result(self, instr: Instr, reg: str) -> None:
+        self.emit_mov(self.locations[instr.result], reg)
+
+
+    def compile_instr(self, instr: Instr) -> None:
+        opcode = instr.opcode
+        if opcode in ('phi', 'alloca'):
+            return
+
+        if opcode in BINARY_OPS:
+            left, right = instr.operands
+            self.emit(f'mov eax, {self.operand_32(left)}')
+            right_operand = self.operand_32(right)
+            if opcode == 'mul' and is_imm(right_operand):
+                self.emit(f'imul eax, eax, {right_operand}')
+            else:
+                self.emit(f'{BINARY_OPS[opcode]} eax, {right_operand}')
+            self.store_result(instr, 'rax')
+
+        elif opcode in ('sdiv', 'srem'):
+            left, right = instr.operands
+            self.emit(f'mov eax, {self.operand_32(left)}')
+            self.emit(f'mov ecx, {self.operand_32(right)}')
+            self.emit('cdq')
+            self.emit('idiv ecx')
+            self.store_result(instr, 'rax' if opcode == 'sdiv' else 'rdx')
+
+        elif opcode == 'icmp':
+            left, right = instr.operands
+            conditions = I1_CONDITIONS if instr.type == 'i1' else CONDITIONS
+            self.emit(f'mov eax, {self.operand_32(left)}')
+            self.emit(f'cmp eax, {self.operand_32(right)}')
+            self.emit(f'set{conditions[instr.attr]} al')
+            self.emit('movzx eax, al')
+            self.store_result(instr, 'rax')
+
+        elif opcode == 'call':
+            self.compile_call(instr)
+
+        elif opcode == 'ret':
+            if instr.type != 'void':
+                self.emit_mov('rax', self.operand(instr.operands[0]))
+            self.emit(f'jmp {self.ret_label}')
+
+        elif opcode == 'load':
+            self.emit(f'mov rax, {self.alloca_slots[instr.operands[0]]}')
+            self.store_result(instr, 'rax')
+
+        elif opcode == 'store':
+            value, ptr = instr.operands
+            self.emit_mov(self.alloca_slots[ptr], self.operand(value))
+
+        elif opcode == 'unreachable':
+            self.emit('ud2')
+
+        else:
+            raise NotImplementedError(f'unsupported instruction: {instr}')
+
+
+    def compile_call(self, instr: Instr) -> None:
+        args = instr.operands
+        stack_args = args[len(ARG_REGS):]
+        stack_size = 8 * len(stack_args)
+        if stack_size % 16:
+            self.emit('sub rsp, 8')
+            stack_size += 8
+        for arg in reversed(stack_args):
+            operand = self.operand(arg)
+            if is_address(operand):
+                self.emit_mov('rax', operand)
+                operand = 'rax'
+            self.emit(f'push {operand}')
+        for reg, arg in zip(ARG_REGS, args):
+            self.emit_mov(reg, self.operand(arg))
+        self.emit(f'call {symbol(instr.attr)}@PLT')
+        if stack_size:
+            self.emit(f'add rsp, {stack_size}')
+        if instr.result:
+            self.store_result(instr, 'rax')
+
+
+### Module writer
+
+# Writes assembly of functions as they are compiled, to be used
+# by LLVMCompiler.visit_prog in place of LLWriter.
+class X86Writer:
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        out.write('    .intel_syntax noprefix\n    .text\n\n')
+
+
+    def write_function(self, fun: Function) -> None:
+        FunctionCompiler(fun, self.out).compile()
+
+
+    def write_globals(
+            self, str_consts: Dict[str, str],
+            declarations: List[Function]) -> None:
+        del declarations  # resolved by the linker
+        # characters and Strings (see LLVMIR.write_str_const); the Strings
+        # hold pointers, so they need relocations
+        if str_consts:
+            self.out.write('    .section .rodata\n')
+        for name, value in str_consts.items():
+            data = asm_string(str_const_bytes(value))
+            self.out.write(
+                f'{str_const_label(name)}.chars:\n    .string {data}\n')
+        if str_consts:
+            self.out.write('    .section .data.rel.ro\n    .p2align 3\n')
+        for name, value in str_consts.items():
+            label = str_const_label(name)
+            self.out.write(
+                f'{label}:\n    .quad {len(str_const_bytes(value))}\n'
+                f'    .quad {label}.chars\n    .quad 0\n')
+        self.out.write('    .section .note.GNU-stack,"",@progbits\n')
+
+
+# Assembles the generated code and links it with the runtime compiled
+# to an object file (lib/runtime.o). Returns 0 on success,
+# ASSEMBLY_FAILED or LINKING_FAILED on failure.
+def build_executable(asm_path: str, runtime_path: str, exe_path: str) -> int:
+    obj_path = exe_path + '.o'
+    if not run_tool(['cc', '-c', '-o', obj_path, asm_path]):
+        return ASSEMBLY_FAILED
+    if not run_tool(['cc', '-o', exe_path, obj_path, runtime_path]):
+        return LINKING_FAILED
+    os.remove(obj_path)
+    return 0
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+# pylint: disable=C0103, C0111
+
+# Thin client of the compile server (server.py), with the same arguments,
+# output and exit codes as main.py. It imports only the standard library,
+# so it starts quickly. When no server is running, the program is compiled
+# in this process by main.py.
+
+import json
+import os
+import socket
+import sys
+
+
+def default_socket_path(project_dir):
+    return os.path.join(project_dir, 'latc_server.sock')
+
+
+def socket_path_for(argv):
+    if os.environ.get('LATC_SOCKET'):
+        return os.environ['LATC_SOCKET']
+    if len(argv) < 3:
+        return None
+    return default_socket_path(argv[2])
+
+
+# Returns None if there is no server or it didn't respond.
+def request_compile(socket_path, argv):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            with sock.makefile('rw', encoding='utf-8') as f:
+                request = {'argv': argv, 'cwd': os.getcwd()}
+                f.write(json.dumps(request) + '\n')
+                f.flush()
+                response = f.readline()
+    except OSError:
+        return None
+    if not response:
+        return None
+    return json.loads(response)
+
+
+def main(argv):
+    socket_path = socket_path_for(argv)
+    response = None
+    if socket_path is not None and os.path.exists(socket_path):
+        response = request_compile(socket_path, argv)
+    if response is None:
+        import main as latc
+        latc.main(argv)
+        return
+    sys.stderr.write(response['stderr'])
+    sys.stdout.write(response['stdout'])
+    sys.exit(response['exit_code'])
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -2,67 +2,459 @@
 
 # pylint: disable=C0103, C0111
 
+import argparse
+import contextlib
+import functools
+import io
+import json
+import multiprocessing
 import os
+import signal
 import sys
+import time
+import traceback
 
 import antlr4
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.ErrorStrategy import BailErrorStrategy, DefaultErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
 from antlr_generated.LatteLexer import LatteLexer
 from antlr_generated.LatteParser import LatteParser
+from CompilationCache import DEFAULT_MAX_SIZE, CompilationCache
+from LLVMAssembler import build_bitcode, build_executable
 from LLVMCompiler import LLVMCompiler
+from LLVMIR import LLWriter
+import PrattParser
+from TimeReport import TimeReport
+import TreeBuilder
+import X86Backend
 
 
-class LatteParserErrorListener(antlr4.error.ErrorListener.ErrorListener):
-    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+def syntax_error(line, column, msg):
+    print('ERROR', file=sys.stderr)
+    print(f'Syntax error in line {line}:{column}:')
+    print(msg)
+    sys.exit(1)
+
+
+# The recursive parts of the compiler (statements, the ANTLR front end)
+# can exceed the recursion limit of Python on deeply nested programs,
+# which is reported like a syntax error.
+@contextlib.contextmanager
+def nesting_limit():
+    try:
+        yield
+    except RecursionError:
         print('ERROR', file=sys.stderr)
-        print(f'Syntax error in line {line}:{column}:')
-        print(msg)
+        print('Program nested too deeply')
         sys.exit(1)
 
 
-def main(argv):
-    if len(argv) != 3:
-        raise AttributeError('invalid number of arguments to compiler')
-    input_file, project_dir = argv[1:]
-    if not input_file.endswith('.lat'):
-        raise AttributeError('input_file must have `.lat` extension')
-
-    out_path = os.path.dirname(input_file)
-    base_name = os.path.split(input_file)[1][:-4]
-    out_base_name = os.path.join(out_path, base_name)
+class LatteParserErrorListener(antlr4.error.ErrorListener.ErrorListener):
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        syntax_error(line, column, msg)
 
-    input_file_stream = antlr4.FileStream(input_file)
-    syntax_error_listener = LatteParserErrorListener()
 
-    lexer = LatteLexer(input_file_stream)
+# The program is parsed with SLL prediction first, which is much faster
+# than full LL in the Python runtime, and with BailErrorStrategy, which
+# gives up at the first syntax error. Only then it's parsed again with
+# LL prediction and normal error reporting, so that it's rejected only
+# if it's really invalid. The ATN and the DFA cache are class attributes
+# of the generated parser, so they're shared by all files parsed in one
+# process (e.g. by the compile server).
+def parse_program(input_stream, error_listener, sll_first=True):
+    # pylint: disable=W0212
+    lexer = LatteLexer(input_stream)
     lexer.removeErrorListeners()
-    lexer.addErrorListener(syntax_error_listener)
+    lexer.addErrorListener(error_listener)
     token_stream = antlr4.CommonTokenStream(lexer)
 
     parser = LatteParser(token_stream)
     parser.removeErrorListeners()
-    parser.addErrorListener(syntax_error_listener)
-    prog_tree = parser.program()
+    if sll_first:
+        parser._interp.predictionMode = PredictionMode.SLL
+        parser._errHandler = BailErrorStrategy()
+        try:
+            return parser.program()
+        except ParseCancellationException:
+            parser.reset()
+            parser._interp.predictionMode = PredictionMode.LL
+            parser._errHandler = DefaultErrorStrategy()
+    parser.addErrorListener(error_listener)
+    return parser.program()
 
-    compiler = LLVMCompiler()
-    code = compiler.visit_prog(prog_tree)
-    print('OK', file=sys.stderr)
 
-    ll_file_path = out_base_name + '.ll'
-    runtime_path = os.path.join(project_dir, 'lib', 'runtime.bc')
-    bc_no_runtime_path = out_base_name + '_no_runtime.bc'
+# Returns the LatteAST tree of the program, built with PrattParser or with
+# ANTLR (the reference front end, slower). ANTLR lexes the program while
+# parsing it, so there's no separate `lex` phase for it.
+def build_ast(source, parser='pratt', time_report=None):
+    if time_report is None:
+        time_report = TimeReport()
+    if parser == 'antlr':
+        with time_report.phase('parse'):
+            prog_tree = parse_program(
+                antlr4.InputStream(source), LatteParserErrorListener())
+        with time_report.phase('build AST'):
+            return TreeBuilder.build_program(prog_tree, source)
+    try:
+        with time_report.phase('lex'):
+            pratt_parser = PrattParser.Parser(source)
+        with time_report.phase('parse'):
+            return pratt_parser.parse_program()
+    except PrattParser.ParseError as e:
+        syntax_error(e.line, e.column, e.msg)
+
+
+def parse_args(argv):
+    arg_parser = argparse.ArgumentParser(prog='latc_llvm')
+    arg_parser.add_argument(
+        'input_file', help='.lat file or a manifest listing .lat files')
+    arg_parser.add_argument('project_dir')
+    arg_parser.add_argument(
+        'more_input_files', nargs='*', metavar='input_file',
+        help='more files compiled in the same process (batch mode)')
+    arg_parser.add_argument(
+        '--backend', choices=('llvm', 'x86_64'), default='llvm',
+        help='llvm: LLVM bitcode linked with the runtime (run with lli), '
+             'x86_64: native executable built from assembly generated '
+             'without LLVM')
+    arg_parser.add_argument(
+        '--parser', choices=('pratt', 'antlr'), default='pratt',
+        help='pratt: hand-written parser, antlr: parser generated by ANTLR '
+             '(the reference one, slower)')
+    arg_parser.add_argument(
+        '--alloca', action='store_true',
+        help='keep local variables in memory (alloca/load/store) '
+             'instead of building SSA form')
+    arg_parser.add_argument(
+        '--external-tools', action='store_true',
+        help='use llvm-as, llvm-link, opt and llc even if llvmlite '
+             'is installed')
+    arg_parser.add_argument(
+        '-O', type=int, choices=range(4), default=0, dest='opt_level',
+        metavar='LEVEL',
+        help='optimization level (0-3) of the module linked with the runtime '
+             '(LLVM backend only)')
+    arg_parser.add_argument(
+        '--no-link-runtime', action='store_false', dest='link_runtime',
+        help='save the .bc file without the runtime (run it with '
+             '`lli -extra-module=lib/runtime.bc`); with --native, '
+             'the executable is linked with the precompiled lib/runtime.o')
+    arg_parser.add_argument(
+        '--native', action='store_true',
+        help='also build a native executable (next to the .bc file) '
+             'with the LLVM backend')
+    arg_parser.add_argument(
+        '--cache-dir', default=os.environ.get('LATC_CACHE_DIR'),
+        help='directory of the compilation cache (by default $LATC_CACHE_DIR, '
+             'the cache is not used if neither is given)')
+    arg_parser.add_argument(
+        '--cache-max-size', type=int, default=DEFAULT_MAX_SIZE // 2**20,
+        metavar='MB', help='size of the cache above which least recently '
+                           'used entries are evicted')
+    arg_parser.add_argument(
+        '--time-report', action='store_true',
+        help='print wall time, CPU time and peak memory of each phase '
+             'of the compilation')
+    arg_parser.add_argument(
+        '--time-report-json', metavar='PATH',
+        help='write the phases measured like by --time-report to PATH '
+             'as JSON (for all files in batch mode)')
+    arg_parser.add_argument(
+        '-j', '--jobs', type=int, default=1, metavar='N',
+        help='number of processes compiling the files in batch mode')
+    arg_parser.add_argument(
+        '--timeout', type=float, metavar='SECONDS',
+        help='time limit of compiling each file in batch mode, a file '
+             f'compiled longer fails with exit code {TIMEOUT_EXIT_CODE}')
+    arg_parser.add_argument(
+        '--batch-report', metavar='PATH',
+        help='write exit codes and outputs of all files compiled in batch '
+             'mode to PATH as JSON')
+    # More input files can follow the options (latc adds --backend before
+    # them), such positional arguments are left unparsed by argparse
+    # (parse_intermixed_args needs Python 3.7)
+    args, unparsed = arg_parser.parse_known_args(argv[1:])
+    unknown_options = [arg for arg in unparsed if arg.startswith('-')]
+    if unknown_options:
+        arg_parser.error(
+            f'unrecognized arguments: {" ".join(unknown_options)}')
+    args.more_input_files += unparsed
+    return args
+
+
+def build_llvm(args, ll_file_path, out_base_name, time_report):
+    lib_dir = os.path.join(args.project_dir, 'lib')
     bc_final_path = out_base_name + '.bc'
-    with open(ll_file_path, 'w') as f:
-        f.write(code)
-        print(f'Saved {ll_file_path}')
-    if os.system(f'llvm-as -o {bc_no_runtime_path} {ll_file_path}') != 0:
-        sys.exit(3)
-    print(f'Compiled to {bc_no_runtime_path}')
-    if os.system(
-            f'llvm-link -o {bc_final_path} '
-            f'{bc_no_runtime_path} {runtime_path}') != 0:
-        sys.exit(4)
-    os.remove(bc_no_runtime_path)
-    print(f'Linked to runtime: {bc_final_path}')
+    with time_report.phase('bitcode'):
+        exit_code = build_bitcode(
+            ll_file_path,
+            os.path.join(lib_dir, 'runtime.bc') if args.link_runtime
+            else None,
+            bc_final_path, args.opt_level,
+            in_process=not args.external_tools)
+    if exit_code != 0:
+        sys.exit(exit_code)
+    if args.link_runtime:
+        print(f'Linked to runtime: {bc_final_path}')
+    else:
+        print(f'Compiled to {bc_final_path} (without runtime)')
+    if args.native:
+        with time_report.phase('native'):
+            exit_code = build_executable(
+                bc_final_path, out_base_name, args.opt_level,
+                in_process=not args.external_tools,
+                runtime_obj_path=None if args.link_runtime
+                else os.path.join(lib_dir, 'runtime.o'))
+        if exit_code != 0:
+            sys.exit(exit_code)
+        print(f'Built native executable: {out_base_name}')
+
+
+def build_x86_64(args, asm_path, out_base_name, time_report):
+    runtime_path = os.path.join(args.project_dir, 'lib', 'runtime.o')
+    with time_report.phase('native'):
+        exit_code = X86Backend.build_executable(
+            asm_path, runtime_path, out_base_name)
+    if exit_code != 0:
+        sys.exit(exit_code)
+    print(f'Built native executable: {out_base_name}')
+
+
+def compile_file(args, input_file, time_report):
+    start_time = time.perf_counter()
+    project_dir = args.project_dir
+
+    out_path = os.path.dirname(input_file)
+    base_name = os.path.split(input_file)[1][:-4]
+    out_base_name = os.path.join(out_path, base_name)
+    if args.backend == 'x86_64':
+        code_path = out_base_name + '.s'
+        out_paths = [code_path, out_base_name]
+    else:
+        code_path = out_base_name + '.ll'
+        out_paths = [code_path, out_base_name + '.bc']
+        if args.native:
+            out_paths.append(out_base_name)
+
+    cache = None
+    if args.cache_dir:
+        with time_report.phase('cache'):
+            cache = CompilationCache(
+                args.cache_dir, args.cache_max_size * 2**20)
+            cache_key = cache.key(
+                input_file, project_dir,
+                f'backend={args.backend} parser={args.parser} '
+                f'alloca={args.alloca} '
+                f'O={args.opt_level} native={args.native} '
+                f'link_runtime={args.link_runtime}')
+            restored = cache.restore(cache_key, out_paths)
+        if restored:
+            print('OK', file=sys.stderr)
+            print(f'Restored from cache: {", ".join(out_paths)}')
+            return
+
+    with time_report.phase('read'):
+        # decoded like antlr4.FileStream does
+        with open(input_file, 'rb') as f:
+            source = f.read().decode('ascii')
+    with nesting_limit():
+        prog_ast = build_ast(source, args.parser, time_report)
+
+    # the code is written to the file while it's generated, so the phase
+    # includes writing it
+    compiler = LLVMCompiler(ssa=not args.alloca)
+    try:
+        with nesting_limit(), time_report.phase('codegen'):
+            with open(code_path, 'w') as f:
+                if args.backend == 'x86_64':
+                    writer = X86Backend.X86Writer(f)
+                else:
+                    writer = LLWriter(f)
+                compiler.visit_prog(prog_ast, writer)
+    except BaseException:
+        # don't leave a partially written file after a compilation error
+        # (or a crash of the compiler)
+        if os.path.exists(code_path):
+            os.remove(code_path)
+        raise
+    print('OK', file=sys.stderr)
+    print(f'Saved {code_path}')
+    if args.backend == 'x86_64':
+        build_x86_64(args, code_path, out_base_name, time_report)
+    else:
+        build_llvm(args, code_path, out_base_name, time_report)
+    if cache is not None:
+        with time_report.phase('cache'):
+            cache.store(cache_key, out_paths)
+    compile_time = time.perf_counter() - start_time
+    print(f'Compilation time (-O{args.opt_level}): {compile_time:.3f} s')
+
+
+def new_time_report(args):
+    return TimeReport(args.time_report or bool(args.time_report_json))
+
+
+# Compiles the file and prints its time report with --time-report, also
+# when the compilation fails.
+def compile_timed(args, input_file, time_report):
+    try:
+        compile_file(args, input_file, time_report)
+    finally:
+        if args.time_report:
+            print(time_report.format_table())
+
+
+# --time-report-json: a list of {"input_file": ..., "phases": [...]},
+# where each phase is {"phase", "wall", "cpu" (seconds), "peak_memory"
+# (bytes)}.
+def write_time_reports(path, reports):
+    with open(path, 'w') as f:
+        json.dump(reports, f, indent=1)
+
+
+### Batch mode
+
+
+# Exit code of a file whose compilation exceeded --timeout, like the one
+# of timeout(1).
+TIMEOUT_EXIT_CODE = 124
+
+
+class CompilationTimeout(Exception):
+    pass
+
+
+def raise_timeout(signum, frame):
+    raise CompilationTimeout()
+
+
+# Returns the .lat files to compile. Any other input file is a manifest:
+# one path per line (relative to the manifest's directory), empty lines
+# and lines starting with `#` are skipped.
+def expand_inputs(input_files):
+    lat_files = []
+    for input_file in input_files:
+        if input_file.endswith('.lat'):
+            lat_files.append(input_file)
+            continue
+        manifest_dir = os.path.dirname(input_file)
+        with open(input_file) as f:
+            for line in f:
+                path = line.strip()
+                if path and not path.startswith('#'):
+                    lat_files.append(os.path.join(manifest_dir, path))
+    return lat_files
+
+
+# Calls function(*args) with stdout and stderr captured, returns them with
+# the exit code the process would have.
+def run_captured(function, *args):
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    exit_code = 0
+    with contextlib.redirect_stdout(stdout), \
+            contextlib.redirect_stderr(stderr):
+        try:
+            function(*args)
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                exit_code = e.code
+            elif e.code is not None:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except CompilationTimeout:
+            print('ERROR', file=sys.stderr)
+            print('Compilation timed out')
+            exit_code = TIMEOUT_EXIT_CODE
+        except Exception:  # pylint: disable=W0703
+            traceback.print_exc()
+            exit_code = 1
+    return {
+        'exit_code': exit_code,
+        'stdout': stdout.getvalue(),
+        'stderr': stderr.getvalue(),
+    }
+
+
+# Interrupts the compilation after args.timeout seconds with
+# CompilationTimeout (SIGALRM interrupts Python code and waiting for
+# subprocesses, but not a call into a C library like llvmlite).
+def compile_limited(args, input_file, time_report):
+    signal.signal(signal.SIGALRM, raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, args.timeout)
+    try:
+        compile_timed(args, input_file, time_report)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def compile_captured(args, input_file):
+    time_report = new_time_report(args)
+    result = run_captured(
+        compile_limited if args.timeout else compile_timed,
+        args, input_file, time_report)
+    result['input_file'] = input_file
+    if time_report.enabled:
+        result['time_report'] = time_report.phases
+    return result
+
+
+# Compiles the files one by one, like separate runs of the compiler, with
+# -j in a pool of processes. The runtime module and the parser are loaded
+# once per process. Outputs of each file are printed after a header line,
+# in the order of the files, followed by a summary; the exit code is 1
+# if any file failed.
+def compile_batch(args, input_files):
+    if args.jobs > 1:
+        with multiprocessing.Pool(args.jobs) as pool:
+            results = pool.map(
+                functools.partial(compile_captured, args), input_files,
+                chunksize=1)
+    else:
+        results = (compile_captured(args, f) for f in input_files)
+
+    report = []
+    for result in results:
+        print(f'==> {result["input_file"]} <==')
+        sys.stdout.flush()
+        sys.stderr.write(result['stderr'])
+        sys.stderr.flush()
+        sys.stdout.write(result['stdout'])
+        report.append(result)
+    failed = [result for result in report if result['exit_code'] != 0]
+    print(f'Compiled {len(report)} files, {len(failed)} failed')
+    for result in failed:
+        timed_out = result['exit_code'] == TIMEOUT_EXIT_CODE
+        print(f'{result["input_file"]}: exit code {result["exit_code"]}'
+              + (' (timed out)' if timed_out else ''))
+    if args.batch_report:
+        with open(args.batch_report, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.time_report_json:
+        write_time_reports(args.time_report_json, [
+            {'input_file': result['input_file'],
+             'phases': result['time_report']}
+            for result in report])
+    if failed:
+        sys.exit(1)
+
+
+def main(argv):
+    args = parse_args(argv)
+    input_files = [args.input_file] + args.more_input_files
+    if len(input_files) == 1 and input_files[0].endswith('.lat') \
+            and not args.batch_report:
+        time_report = new_time_report(args)
+        try:
+            compile_timed(args, args.input_file, time_report)
+        finally:
+            if args.time_report_json:
+                write_time_reports(args.time_report_json, [
+                    {'input_file': args.input_file,
+                     'phases': time_report.phases}])
+    else:
+        compile_batch(args, expand_inputs(input_files))
 
 
 if __name__ == '__main__':
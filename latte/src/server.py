@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+# pylint: disable=C0103, C0111
+
+# Compile server: a long-running process which keeps the Python modules,
+# the parser and the runtime module loaded and compiles programs on
+# request. Clients (client.py) connect to a Unix socket and send requests
+# as lines of JSON, one response line is sent back for each of them:
+#   request:  {"argv": [...], "cwd": ...} - the same arguments as for
+#             main.py and the working directory of the client, against
+#             which relative paths are resolved
+#   response: {"exit_code": ..., "stdout": ..., "stderr": ...}
+# Requests are handled one at a time.
+
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+import traceback
+
+import main as latc
+from client import default_socket_path
+
+
+def compile_request(argv):
+    return latc.run_captured(latc.main, argv)
+
+
+def serve_connection(conn):
+    with conn, conn.makefile('rw', encoding='utf-8') as f:
+        for line in f:
+            request = json.loads(line)
+            if 'cwd' in request:
+                os.chdir(request['cwd'])
+            f.write(json.dumps(compile_request(request['argv'])) + '\n')
+            f.flush()
+
+
+def stop_server(signum, frame):
+    sys.exit(0)
+
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(prog='latc_server')
+    arg_parser.add_argument('project_dir')
+    arg_parser.add_argument(
+        '--socket', help='path of the socket, by default '
+                         'latc_server.sock in the project directory')
+    args = arg_parser.parse_args(argv[1:])
+    socket_path = args.socket or default_socket_path(args.project_dir)
+
+    signal.signal(signal.SIGTERM, stop_server)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        # only the owner of the server can connect to the socket, since
+        # requests are compiled (and files written) with its permissions
+        old_umask = os.umask(0o077)
+        try:
+            sock.bind(socket_path)
+        finally:
+            os.umask(old_umask)
+        sock.listen()
+        print(f'Listening on {socket_path}')
+        sys.stdout.flush()
+        try:
+            while True:
+                conn, _ = sock.accept()
+                try:
+                    serve_connection(conn)
+                except (OSError, ValueError, KeyError):
+                    traceback.print_exc()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
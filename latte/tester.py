@@ -1,90 +1,248 @@
 #!/usr/bin/env python3
 
+import argparse
+import concurrent.futures
+import json
 import os
 import subprocess
+import sys
+import tempfile
 
 
-def test_good(test_dir):
-    oks = 0
-    errors = 0
-    for f in sorted(os.listdir(test_dir)):
-        if not f.endswith('.lat'):
-            continue
-        print()
-        test_name = f.replace('.lat', '')
-        print(test_name)
-        lat_path = os.path.join(test_dir, f)
-        with open(lat_path, 'r') as f:
-            first_line = f.read().strip().split('\n')[0]
-            if first_line[:2] in ('//', '/*'):
-                print(first_line)
-        out_path = os.path.join(test_dir, test_name + '.output')
-        with open(out_path, 'r') as f:
-            correct_out = f.read()
-        ps = subprocess.Popen(['./latc_llvm', lat_path])
-        ps.wait()
-        if ps.returncode != 0:
-            print('### COMPILATION ERROR')
-            errors += 1
-            continue
-        program_input = None
-        in_path = os.path.join(test_dir, test_name + '.input')
-        if os.path.isfile(in_path):
-            program_input = open(in_path, 'r')
-        bc_path = os.path.join(test_dir, test_name + '.bc')
-        ps2 = subprocess.Popen(['lli', bc_path],
-            stdin=program_input, stdout=subprocess.PIPE)
-        my_out = str(ps2.communicate()[0], 'ascii')
+# All tests are compiled first, by one run of the compiler in batch mode,
+# which reports the output and the exit code of each file. Then each test
+# returns a pair (passed, log). Tests are run in parallel, so their logs
+# are collected and printed in order afterwards.
+
+# Exit code of a file whose compilation exceeded --timeout in batch mode.
+TIMEOUT_EXIT_CODE = 124
+
+
+def run(args, timeout, **kwargs):
+    try:
+        return subprocess.run(
+            args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            timeout=timeout, **kwargs)
+    except subprocess.TimeoutExpired:
+        return None
+
+
+def test_header(test_dir, f):
+    test_name = f.replace('.lat', '')
+    log = ['', test_name]
+    lat_path = os.path.join(test_dir, f)
+    with open(lat_path, 'r') as f:
+        first_line = f.read().strip().split('\n')[0]
+        if first_line[:2] in ('//', '/*'):
+            log.append(first_line)
+    return test_name, lat_path, log
+
+
+# Compiles the file by a separate run of the compiler, returns a report
+# like the one from batch mode or None if the compilation timed out.
+def compile_single(lat_path, timeout, parser):
+    ps = run(['./latc_llvm', lat_path, '--parser', parser], timeout)
+    if ps is None:
+        return None
+    return {
+        'input_file': os.path.abspath(lat_path),
+        'exit_code': ps.returncode,
+        'stdout': str(ps.stdout, 'ascii', 'replace'),
+        'stderr': '',
+    }
+
+
+# Returns a dict: absolute path of the .lat file -> its report from
+# the compiler. The batch run limits the time of each file (exit code
+# TIMEOUT_EXIT_CODE); files missing from its report (when the compiler
+# got stuck or crashed) are compiled one by one, those still missing
+# timed out. With time_report, also a list of time reports of the files
+# compiled in batch mode (see --time-report-json of the compiler).
+def compile_tests(lat_paths, jobs, timeout, time_report=False,
+                  parser='pratt'):
+    results = {}
+    time_reports = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manifest_path = os.path.join(tmp_dir, 'tests.txt')
+        report_path = os.path.join(tmp_dir, 'report.json')
+        times_path = os.path.join(tmp_dir, 'times.json')
+        with open(manifest_path, 'w') as f:
+            f.write(''.join(os.path.abspath(p) + '\n' for p in lat_paths))
+        options = ['-j', str(jobs), '--batch-report', report_path,
+                   '--parser', parser, '--timeout', str(timeout)]
+        if time_report:
+            options += ['--time-report-json', times_path]
+        ps = run(['./latc_llvm', manifest_path] + options,
+                 timeout * len(lat_paths))
+        if ps is not None and os.path.isfile(report_path):
+            with open(report_path) as f:
+                results = {r['input_file']: r for r in json.load(f)}
+            if time_report:
+                with open(times_path) as f:
+                    time_reports = json.load(f)
+    missing = [p for p in lat_paths if os.path.abspath(p) not in results]
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        for result in executor.map(
+                lambda p: compile_single(p, timeout, parser), missing):
+            if result is not None:
+                results[result['input_file']] = result
+    return results, time_reports
+
+
+# Sums up time reports of all tests: per phase the total and the maximum
+# time over the files and the maximum peak memory, then the slowest files.
+def format_time_reports(time_reports, slowest=5):
+    phases = {}
+    for report in time_reports:
+        for phase in report['phases']:
+            phases.setdefault(phase['phase'], []).append(
+                (phase, report['input_file']))
+    lines = [
+        '',
+        f'{"phase":<10} {"files":>6} {"wall [ms]":>10} {"cpu [ms]":>10} '
+        f'{"max wall [ms]":>14} {"max peak [KiB]":>15}',
+    ]
+    for name, measures in phases.items():
+        wall = sum(phase['wall'] for phase, _ in measures)
+        cpu = sum(phase['cpu'] for phase, _ in measures)
+        max_wall = max(phase['wall'] for phase, _ in measures)
+        max_peak = max(phase['peak_memory'] for phase, _ in measures)
+        lines.append(
+            f'{name:<10} {len(measures):>6} {wall * 1000:>10.1f} '
+            f'{cpu * 1000:>10.1f} {max_wall * 1000:>14.2f} '
+            f'{max_peak / 1024:>15.1f}')
+    totals = sorted(
+        ((sum(phase['wall'] for phase in report['phases']),
+          report['input_file']) for report in time_reports),
+        reverse=True)
+    lines.append('Slowest files:')
+    for wall, input_file in totals[:slowest]:
+        lines.append(f'{wall * 1000:>10.1f} ms  {os.path.relpath(input_file)}')
+    return '\n'.join(lines)
+
+
+def compile_test(lat_path, compile_results, timeout, log):
+    result = compile_results.get(os.path.abspath(lat_path))
+    if result is None or result['exit_code'] == TIMEOUT_EXIT_CODE:
+        log.append(f'### COMPILATION TIMEOUT ({timeout} s per file)')
+        return None
+    compiler_out = (result['stderr'] + result['stdout']).rstrip('\n')
+    if compiler_out:
+        log.append(compiler_out)
+    return result['exit_code']
+
+
+def good_test(test_dir, f, compile_results, timeout):
+    test_name, lat_path, log = test_header(test_dir, f)
+    out_path = os.path.join(test_dir, test_name + '.output')
+    with open(out_path, 'r') as f:
+        correct_out = f.read()
+    returncode = compile_test(lat_path, compile_results, timeout, log)
+    if returncode is None:
+        return False, log
+    if returncode != 0:
+        log.append('### COMPILATION ERROR')
+        return False, log
+    program_input = None
+    in_path = os.path.join(test_dir, test_name + '.input')
+    if os.path.isfile(in_path):
+        program_input = open(in_path, 'r')
+    bc_path = os.path.join(test_dir, test_name + '.bc')
+    try:
+        ps2 = subprocess.run(
+            ['lli', bc_path], stdin=program_input, stdout=subprocess.PIPE,
+            timeout=timeout)
+    except subprocess.TimeoutExpired:
+        log.append(f'### RUN TIMEOUT ({timeout} s)')
+        return False, log
+    finally:
         if program_input:
             program_input.close()
-        if correct_out == my_out:
-            print('### OUTPUTS OK')
-            oks += 1
-        else:
-            print('### OUTPUTS MISMATCH')
-            print('Correct output:')
-            print(correct_out)
-            print('My output:')
-            print(my_out)
-            errors += 1
-    return f'{test_dir}: OK {oks} / ERRORS {errors}'
-
-
-def test_bad(test_dir):
-    oks = 0
-    errors = 0
-    for f in sorted(os.listdir(test_dir)):
-        if not f.endswith('.lat'):
-            continue
-        print()
-        test_name = f.replace('.lat', '')
-        print(test_name)
-        lat_path = os.path.join(test_dir, f)
-        with open(lat_path, 'r') as f:
-            first_line = f.read().strip().split('\n')[0]
-            if first_line[:2] in ('//', '/*'):
-                print(first_line)
-        ps = subprocess.Popen(['./latc_llvm', lat_path])
-        ps.wait()
-        if ps.returncode != 0:
-            print('### COMPILATION ERROR (OK)')
-            oks += 1
-        else:
-            print('### COMPILED SUCCESFULLY (ERROR)')
-            errors += 1
-    return f'{test_dir}: OK {oks} / ERRORS {errors}'
+    my_out = str(ps2.stdout, 'ascii')
+    if correct_out == my_out:
+        log.append('### OUTPUTS OK')
+        return True, log
+    log += [
+        '### OUTPUTS MISMATCH',
+        'Correct output:',
+        correct_out,
+        'My output:',
+        my_out,
+    ]
+    return False, log
+
+
+def bad_test(test_dir, f, compile_results, timeout):
+    _, lat_path, log = test_header(test_dir, f)
+    returncode = compile_test(lat_path, compile_results, timeout, log)
+    if returncode is None:
+        return False, log
+    if returncode != 0:
+        log.append('### COMPILATION ERROR (OK)')
+        return True, log
+    log.append('### COMPILED SUCCESFULLY (ERROR)')
+    return False, log
+
+
+def test_dir_files(test_dir):
+    return [f for f in sorted(os.listdir(test_dir)) if f.endswith('.lat')]
 
 
 def main():
-    reports = []
-    reports.append(test_bad('./lattests/bad/'))
-    reports.append(test_good('./lattests/good/'))
-    reports.append(test_bad('./lattests/extensions/arrays1/'))
-    reports.append(test_bad('./lattests/extensions/objects1/'))
-    reports.append(test_bad('./lattests/extensions/objects2/'))
-    reports.append(test_bad('./lattests/extensions/struct/'))
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '-j', type=int, default=1, dest='jobs', metavar='N',
+        help='number of tests compiled and run in parallel')
+    arg_parser.add_argument(
+        '--timeout', type=float, default=60,
+        help='time limit in seconds for compiling and for running each test')
+    arg_parser.add_argument(
+        '--time-report', action='store_true',
+        help='print times and peak memory of the compilation phases '
+             'summed up over all tests')
+    arg_parser.add_argument(
+        '--parser', choices=('pratt', 'antlr'), default='pratt',
+        help='front end of the compiler used for the tests')
+    args = arg_parser.parse_args()
+
+    suites = [
+        (bad_test, './lattests/bad/'),
+        (good_test, './lattests/good/'),
+        (bad_test, './lattests/extensions/arrays1/'),
+        (bad_test, './lattests/extensions/objects1/'),
+        (bad_test, './lattests/extensions/objects2/'),
+        (bad_test, './lattests/extensions/struct/'),
+    ]
+    compile_results, time_reports = compile_tests(
+        [os.path.join(test_dir, f)
+         for _, test_dir in suites for f in test_dir_files(test_dir)],
+        args.jobs, args.timeout, args.time_report, args.parser)
+    with concurrent.futures.ThreadPoolExecutor(args.jobs) as executor:
+        futures = [
+            [executor.submit(
+                test, test_dir, f, compile_results, args.timeout)
+             for f in test_dir_files(test_dir)]
+            for test, test_dir in suites]
+        reports = []
+        all_passed = True
+        for (_, test_dir), suite_futures in zip(suites, futures):
+            oks = 0
+            errors = 0
+            for future in suite_futures:
+                passed, log = future.result()
+                print('\n'.join(log))
+                if passed:
+                    oks += 1
+                else:
+                    errors += 1
+            all_passed = all_passed and errors == 0
+            reports.append(f'{test_dir}: OK {oks} / ERRORS {errors}')
     print('\n'.join(reports))
+    if args.time_report:
+        print(format_time_reports(time_reports))
+    if not all_passed:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()